@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'system.middleware.RequestMetricsMiddleware',
     'system.middleware.UserSessionTrackingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -100,6 +101,19 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Число итераций PBKDF2 задаётся здесь (None — значение Django); хеши с меньшим числом пересчитываются при входе
+PASSWORD_HASHERS = [
+    'system.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    'PBKDF2_ITERATIONS': int(os.environ['PBKDF2_ITERATIONS']) if os.environ.get('PBKDF2_ITERATIONS') else None,
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -137,10 +151,33 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'system.authentication.ClaimsJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'system.pagination.OptionalLimitOffsetPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'system.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
+# Логи пакета system: JSON-строки через очередь и фоновый поток, массовые события сэмплируются
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {'()': 'system.log.SamplingFilter'},
+    },
+    'handlers': {
+        'json': {'()': 'system.log.AsyncJsonHandler', 'filters': ['sampling']},
+    },
+    'loggers': {
+        'system': {'handlers': ['json'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# /api/metrics доступен администраторам и скрейперу с заголовком X-Metrics-Token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -148,9 +185,56 @@ CACHES = {
     }
 }
 
+# Счётчики попыток входа общие для всех воркеров: в базе или, если задан REDIS_URL, в Redis.
+# Истёкшие счётчики в базе удаляются не чаще раза в OPTIONS['prune_interval'] секунд
+LOGIN_THROTTLE = {
+    'BACKEND': 'system.throttle.DatabaseThrottleStore',
+    'OPTIONS': {'prune_interval': 60},
+    'MAX_ATTEMPTS': 3,
+    'ATTEMPT_WINDOW': 10,
+    'LOCKOUT': 5 * 60,
+}
+
+if os.environ.get('REDIS_URL'):
+    LOGIN_THROTTLE['BACKEND'] = 'system.throttle.RedisThrottleStore'
+    LOGIN_THROTTLE['OPTIONS'] = {'url': os.environ['REDIS_URL']}
+    # Общий кэш: сброс состояния пользователя и справочников сразу виден всем воркерам
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# События сессий пишутся пачками фоновым потоком; ASYNC=False пишет их сразу в запросе
+SESSION_TRACKING = {
+    'ASYNC': True,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.5,
+}
+
+# Закрытые сессии старше горизонта переносит в архив команда archive_sessions
+SESSION_ARCHIVE_DAYS = 365
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=3000),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
 }
+
+# Отозванные токены: фильтр Блума в памяти процесса и таблица revoked_tokens. Фоновый поток раз в
+# SYNC_INTERVAL секунд подтягивает отзывы из других процессов и раз в PRUNE_INTERVAL удаляет истёкшие
+TOKEN_REVOCATION = {
+    'BACKGROUND': True,
+    'SYNC_INTERVAL': 5,
+    'PRUNE_INTERVAL': 3600,
+    'CAPACITY': 100000,
+    'ERROR_RATE': 0.001,
+}
+
+# Сколько секунд запросы доверяют закэшированным active, роли и офису пользователя.
+# С LocMemCache (без REDIS_URL) кэш свой у каждого процесса и update_user сбрасывает запись только
+# в обработавшем его процессе: остальные узнают о смене роли через TTL, о блокировке и отзыве токенов —
+# через SYNC_INTERVAL из TOKEN_REVOCATION
+USER_STATE_CACHE_TTL = 60
+
+TEST_RUNNER = 'system.test_runner.UnmanagedModelsTestRunner'
@@ -13,12 +13,26 @@ interface User {
   active: number;
 }
 
+interface Office {
+  id: number;
+  title: string;
+}
+
+interface SearchPage {
+  count: number;
+  results: User[];
+}
+
+const PAGE_SIZE = 50;
+
 const AdminPanel = () => {
   const [users, setUsers] = useState<User[]>([]);
-  const [filteredUsers, setFilteredUsers] = useState<User[]>([]);
-  const [selectedOffice, setSelectedOffice] = useState<string>('Все офисы');
+  const [query, setQuery] = useState<string>('');
+  const [selectedOffice, setSelectedOffice] = useState<string>('');
+  const [offset, setOffset] = useState<number>(0);
+  const [count, setCount] = useState<number>(0);
   const [showModal, setShowModal] = useState<boolean>(false);
-  const [offices, setOffices] = useState<string[]>([]);
+  const [offices, setOffices] = useState<Office[]>([]);
   const [newUser, setNewUser] = useState({
     email: '',
     firstname: '',
@@ -31,25 +45,38 @@ const AdminPanel = () => {
 
 
   useEffect(() => {
-    axios.get<User[]>('http://127.0.0.1:8000/api/users/')
-      .then((response) => {
-        setUsers(response.data);
-        setFilteredUsers(response.data);
-        const uniqueOffices: string[] = [...new Set(response.data.map((user) => user.office_name))];
-        setOffices(uniqueOffices);
-      })
+    axios.get<Office[]>('http://127.0.0.1:8000/api/offices/', { params: { fields: 'id,title' } })
+      .then((response) => setOffices(response.data))
       .catch((error) => {
-        console.error("Произошла ошибка при получении пользователей!", error);
+        console.error("Произошла ошибка при получении офисов!", error);
       });
   }, []);
 
-  const handleOfficeChange = (officeName: string) => {
-    setSelectedOffice(officeName);
-    if (officeName === 'Все офисы') {
-      setFilteredUsers(users);
-    } else {
-      setFilteredUsers(users.filter(user => user.office_name === officeName));
-    }
+  // Поиск и фильтр по офису выполняет сервер, страница — PAGE_SIZE пользователей
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      axios.get<SearchPage>('http://127.0.0.1:8000/api/users/search/', {
+        params: { q: query, office: selectedOffice, limit: PAGE_SIZE, offset },
+      })
+        .then((response) => {
+          setUsers(response.data.results);
+          setCount(response.data.count);
+        })
+        .catch((error) => {
+          console.error("Произошла ошибка при получении пользователей!", error);
+        });
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [query, selectedOffice, offset]);
+
+  const handleOfficeChange = (officeId: string) => {
+    setSelectedOffice(officeId);
+    setOffset(0);
+  };
+
+  const handleQueryChange = (value: string) => {
+    setQuery(value);
+    setOffset(0);
   };
 
   const getRowStyle = (user: User) => {
@@ -164,13 +191,21 @@ const AdminPanel = () => {
       <h1 className="admin-panel__title">Админ панель</h1>
       <label className="admin-panel__label">Офис: </label>
       <select className="admin-panel__select" value={selectedOffice} onChange={(e) => handleOfficeChange(e.target.value)}>
-        <option value="Все офисы">Все офисы</option>
-        {offices.map((officeName, index) => (
-          <option key={index} value={officeName}>
-            {officeName}
+        <option value="">Все офисы</option>
+        {offices.map((office) => (
+          <option key={office.id} value={office.id}>
+            {office.title}
           </option>
         ))}
       </select>
+      <label className="admin-panel__label">Поиск: </label>
+      <input
+        type="search"
+        className="admin-panel__search"
+        placeholder="Имя, фамилия или email"
+        value={query}
+        onChange={(e) => handleQueryChange(e.target.value)}
+      />
 
       <button className="admin-panel__button" onClick={() => {
           setUserData(null);
@@ -202,7 +237,7 @@ const AdminPanel = () => {
           </tr>
         </thead>
         <tbody>
-          {filteredUsers.map(user => (
+          {users.map(user => (
             <tr key={user.id} style={getRowStyle(user)} className="admin-panel__table-row">
               <td className="admin-panel__table-cell">{user.firstname}</td>
               <td className="admin-panel__table-cell">{user.lastname}</td>
@@ -217,6 +252,17 @@ const AdminPanel = () => {
           ))}
         </tbody>
       </table>
+      <div className="admin-panel__pagination">
+        <button className="admin-panel__button" disabled={offset === 0}
+                onClick={() => setOffset(Math.max(offset - PAGE_SIZE, 0))}>
+          Назад
+        </button>
+        <span>{count ? `${offset + 1}–${Math.min(offset + PAGE_SIZE, count)} из ${count}` : 'Нет пользователей'}</span>
+        <button className="admin-panel__button" disabled={offset + PAGE_SIZE >= count}
+                onClick={() => setOffset(offset + PAGE_SIZE)}>
+          Далее
+        </button>
+      </div>
 
           {showModal && (
       <>
@@ -276,9 +322,9 @@ const AdminPanel = () => {
               required
             >
               <option value="">Выберите офис</option>
-              {offices.map((officeName, index) => (
-                <option key={index} value={officeName}>
-                  {officeName}
+              {offices.map((office) => (
+                <option key={office.id} value={office.title}>
+                  {office.title}
                 </option>
               ))}
             </select>
@@ -10,30 +10,61 @@ interface UserSession {
   logout_reason: string | null;
 }
 
+interface SessionPage {
+  next: string | null;
+  previous: string | null;
+  results: UserSession[];
+}
+
+interface SessionSummary {
+  sessions: number;
+  crashes: number;
+  seconds: number;
+}
+
 const UserPanel: React.FC = () => {
   const [sessions, setSessions] = useState<UserSession[]>([]);
   const [currentSessionTime, setCurrentSessionTime] = useState<string>('00:00:00');
   const [totalTime, setTotalTime] = useState<string>('00:00:00');
+  const [nextPage, setNextPage] = useState<string | null>(null);
 
-  useEffect(() => {
+  const loadSessions = (url: string) => {
     const accessToken = localStorage.getItem('access_token');
 
-    axios.get<UserSession[]>('http://127.0.0.1:8000/api/user_sessions/', {
+    axios.get<SessionPage>(url, {
       headers: {
         Authorization: `Bearer ${accessToken}`
       }
     })
     .then(response => {
-      setSessions(response.data);
-      const activeSession = response.data.find(session => session.logout_time === null);
+      setSessions(previous => [...previous, ...response.data.results]);
+      setNextPage(response.data.next);
+      const activeSession = response.data.results.find(session => session.logout_time === null);
       if (activeSession) {
         startCurrentSessionTimer(new Date(activeSession.login_time));
       }
-      calculateTotalTime(response.data);
     })
     .catch(error => {
       console.error('Ошибка при получении сессий пользователя:', error);
     });
+  };
+
+  useEffect(() => {
+    const accessToken = localStorage.getItem('access_token');
+
+    loadSessions('http://127.0.0.1:8000/api/user_sessions/');
+
+    axios.get<SessionSummary>('http://127.0.0.1:8000/api/user_sessions/summary/', {
+      headers: {
+        Authorization: `Bearer ${accessToken}`
+      }
+    })
+    .then(response => {
+      calculateTotalTime(response.data.seconds);
+    })
+    .catch(error => {
+      console.error('Ошибка при получении сводки сессий:', error);
+    });
   }, []);
 
   const startCurrentSessionTimer = (loginTime: Date) => {
@@ -49,22 +80,10 @@ const UserPanel: React.FC = () => {
     return () => clearInterval(timer);
   };
 
-  const calculateTotalTime = (sessions: UserSession[]) => {
-    let totalMilliseconds = 0;
-
-    sessions.forEach(session => {
-      if (session.duration) {
-        const parts = session.duration.split(':');
-        const hours = parseInt(parts[0]) * 60 * 60 * 1000;
-        const minutes = parseInt(parts[1]) * 60 * 1000;
-        const seconds = parseInt(parts[2]) * 1000;
-        totalMilliseconds += hours + minutes + seconds;
-      }
-    });
-
-    const totalSeconds = Math.floor((totalMilliseconds / 1000) % 60);
-    const totalMinutes = Math.floor((totalMilliseconds / (1000 * 60)) % 60);
-    const totalHours = Math.floor((totalMilliseconds / (1000 * 60 * 60)) % 24);
+  const calculateTotalTime = (seconds: number) => {
+    const totalSeconds = seconds % 60;
+    const totalMinutes = Math.floor(seconds / 60) % 60;
+    const totalHours = Math.floor(seconds / (60 * 60));
 
     setTotalTime(`${totalHours.toString().padStart(2, '0')}:${totalMinutes.toString().padStart(2, '0')}:${totalSeconds.toString().padStart(2, '0')}`);
   };
@@ -139,6 +158,9 @@ const UserPanel: React.FC = () => {
           ))}
         </tbody>
       </table>
+      {nextPage && (
+        <button className="user-panel__button" onClick={() => loadSessions(nextPage)}>Показать ещё</button>
+      )}
 
       <div className="user-panel__buttons">
         <button className="user-panel__button_exit" onClick={handleLogout}>Выйти</button>
@@ -0,0 +1,159 @@
+import math
+import threading
+
+import numpy as np
+from django.db.models import Max
+
+from .models import Surveys0
+from .survey_summary import AGE_BUCKETS, UNKNOWN_AGE, QUESTIONS
+
+CHUNK_SIZE = 50000
+DENSE_GROUPS_LIMIT = 1000000
+
+AGE_EDGES = [low for low, _, _ in AGE_BUCKETS]
+AGE_LABELS = np.array([UNKNOWN_AGE] + [label for _, _, label in AGE_BUCKETS])
+
+COLUMNS = ('departure_airport_id', 'arrival_airport_id', 'travel_class_id', 'gender', 'survey_month', 'age') + QUESTIONS
+DIMENSIONS = ('departure_airport', 'arrival_airport', 'route', 'travel_class', 'gender', 'survey_month', 'age_band')
+
+
+class Dimension:
+    __slots__ = ('codes', 'labels')
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def encode(cls, values):
+        labels, codes = np.unique(values, return_inverse=True)
+        return cls(codes.astype(np.int32), labels)
+
+    def code_of(self, value):
+        matches = np.flatnonzero(self.labels.astype(str) == str(value))
+        return matches[0] if len(matches) else None
+
+
+class SurveyColumns:
+    # Опросы в виде колонок: целочисленные коды измерений и ответы int8 (-1 — нет ответа)
+    def __init__(self, columns):
+        self.size = len(columns['age'])
+        age = np.array([-1 if value is None else value for value in columns['age']], dtype=np.int16)
+        self.answers = {
+            question: np.array([-1 if value is None else value for value in columns[question]], dtype=np.int8)
+            for question in QUESTIONS
+        }
+        departure = np.array(columns['departure_airport_id'], dtype=np.int32)
+        arrival = np.array(columns['arrival_airport_id'], dtype=np.int32)
+        self.dimensions = {
+            'departure_airport': Dimension.encode(departure),
+            'arrival_airport': Dimension.encode(arrival),
+            'route': Dimension.encode(np.char.add(np.char.add(departure.astype(str), '-'), arrival.astype(str))),
+            'travel_class': Dimension.encode(np.array(columns['travel_class_id'], dtype=np.int32)),
+            'gender': Dimension.encode(np.array(columns['gender'], dtype=str)),
+            'survey_month': Dimension.encode(np.array(columns['survey_month'], dtype=str)),
+            'age_band': Dimension(np.digitize(age, AGE_EDGES).astype(np.int32), AGE_LABELS),
+        }
+
+    @classmethod
+    def load(cls):
+        columns = {column: [] for column in COLUMNS}
+        rows = Surveys0.objects.values_list(*COLUMNS).order_by().iterator(chunk_size=CHUNK_SIZE)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                cls._extend(columns, chunk)
+                chunk = []
+        cls._extend(columns, chunk)
+        return cls(columns)
+
+    @staticmethod
+    def _extend(columns, chunk):
+        if chunk:
+            for column, values in zip(COLUMNS, zip(*chunk)):
+                columns[column].extend(values)
+
+    def mask(self, filters):
+        mask = np.ones(self.size, dtype=bool)
+        for name, value in filters.items():
+            code = self.dimensions[name].code_of(value)
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= self.dimensions[name].codes == code
+        return mask
+
+    def crosstab(self, group_by, question, filters):
+        # Группировка без циклов по строкам: коды измерений сворачиваются в один ключ,
+        # счётчики, суммы и гистограммы считаются через bincount
+        mask = self.mask(filters) if filters else None
+        answers = self.answers[question] if mask is None else self.answers[question][mask]
+        dimensions = [self.dimensions[name] for name in group_by]
+        sizes = [len(dimension.labels) for dimension in dimensions]
+
+        # Ключ умножается ещё на ширину гистограммы (ответы int8), поэтому запас в 256 раз
+        keys = np.zeros(len(answers), dtype=np.int32 if math.prod(sizes) * 256 < 2 ** 31 else np.int64)
+        for dimension, size in zip(dimensions, sizes):
+            keys = keys * size + (dimension.codes if mask is None else dimension.codes[mask])
+
+        # Пока декартово произведение измерений невелико, ключ сразу служит номером группы;
+        # иначе группы нумеруются через сортировку
+        if math.prod(sizes) <= DENSE_GROUPS_LIMIT:
+            groups, slots = None, math.prod(sizes)
+        else:
+            groups, keys = np.unique(keys, return_inverse=True)
+            keys, slots = keys.reshape(-1), len(groups)
+
+        # Количество ответов и суммы выводятся из гистограммы, отдельные проходы не нужны
+        answered = answers >= 0
+        answered_values = answers[answered].astype(keys.dtype)
+        width = int(answered_values.max()) + 1 if len(answered_values) else 1
+        counts = np.bincount(keys, minlength=slots)
+        histogram = np.bincount(keys[answered] * width + answered_values, minlength=slots * width).reshape(slots, width)
+        answered_counts = histogram.sum(axis=1)
+        sums = histogram @ np.arange(width)
+
+        present = np.flatnonzero(counts)
+        group_keys = present if groups is None else groups[present]
+        codes = np.unravel_index(group_keys, sizes) if group_by else ()
+        labels = [dimension.labels[code].tolist() for dimension, code in zip(dimensions, codes)]
+        counts, answered_counts = counts[present].tolist(), answered_counts[present]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.round(sums[present] / answered_counts, 2).tolist()
+        answered_counts, histogram = answered_counts.tolist(), histogram[present].tolist()
+
+        result = []
+        for index in range(len(present)):
+            item = {name: values[index] for name, values in zip(group_by, labels)}
+            item.update({
+                'count': counts[index],
+                'mean': means[index] if answered_counts[index] else None,
+                'unanswered': counts[index] - answered_counts[index],
+                'distribution': {answer: total for answer, total in enumerate(histogram[index]) if total},
+            })
+            result.append(item)
+        return result
+
+
+class SurveyColumnsCache:
+    # Колонки держатся в памяти процесса, пока в surveys0 не появятся новые строки
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None
+        self._version = None
+
+    def get(self):
+        version = Surveys0.objects.aggregate(version=Max('id'))['version']
+        if self._columns is None or self._version != version:
+            with self._lock:
+                if self._columns is None or self._version != version:
+                    self._columns = SurveyColumns.load()
+                    self._version = version
+        return self._columns
+
+    def invalidate(self):
+        with self._lock:
+            self._columns = None
+
+
+survey_columns = SurveyColumnsCache()
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class SystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'system'
+
+    def ready(self):
+        from . import availability  # noqa: F401  счётчики мест для новых рейсов
+        from . import reference_cache  # noqa: F401  сигналы версий справочников
+        from . import itineraries  # noqa: F401  журнал правок маршрутов
+        from . import metrics  # noqa: F401  учёт SQL-запросов на каждом новом соединении
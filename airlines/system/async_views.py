@@ -0,0 +1,118 @@
+import functools
+import logging
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from .authentication import ClaimsJWTAuthentication
+from .availability import seats_for
+from .metrics import TimedJSONRenderer, time_serializer
+from .models import Schedules, Tickets, Users
+from .search import asearch_schedules, schedules_queryset
+from .serializers import SchedulesSerializer, TicketsSerializer, UsersSerializer
+
+from .views import SEARCH_LOG_SAMPLE_RATE
+
+# Асинхронные варианты самых нагруженных эндпоинтов чтения для запуска под ASGI (uvicorn).
+# Ожидание базы не занимает поток: пока один запрос ждёт ORM, цикл событий обслуживает другие
+
+logger = logging.getLogger(__name__)
+
+_jwt = ClaimsJWTAuthentication()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(TimedJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+async def authenticate(request):
+    # Подпись и срок токена проверяются на месте без ввода-вывода, пользователь собирается из claims
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+
+    return await _jwt.aget_user(_jwt.get_validated_token(raw_token))
+
+
+def async_api(require_auth=False):
+    # Аналог @api_view для async-вьюх: только GET, JWT-аутентификация и ошибки DRF в виде JSON
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return json_response({'detail': f'Метод {request.method} не поддерживается.'},
+                                     status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                request.api_user = await authenticate(request)
+                if require_auth and request.api_user is None:
+                    raise NotAuthenticated()
+                return await view(request, *args, **kwargs)
+            except APIException as e:
+                return json_response(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, e.status_code)
+        return wrapper
+    return decorator
+
+
+async def serialize_schedules(schedules, many=True):
+    items = schedules if many else [schedules]
+    seats = await sync_to_async(seats_for)([schedule.id for schedule in items])
+    return time_serializer(SchedulesSerializer(schedules, many=many, context={'seat_availability': seats})).data
+
+
+@async_api()
+async def schedules_search(request):
+    departure_airport = request.GET.get('departure_airport')
+    arrival_airport = request.GET.get('arrival_airport')
+    date = request.GET.get('date')
+    include_nearby_days = request.GET.get('include_nearby_days', 'false').lower() == 'true'
+
+    if not (departure_airport and arrival_airport and date):
+        return json_response(
+            {"detail": "Нужно указать все параметры поиска (аэропорт вылета, аэропорт прибытия и дату)."},
+            status.HTTP_400_BAD_REQUEST)
+
+    try:
+        selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+    except ValueError:
+        return json_response({"detail": "Неверный формат даты. Используйте формат ГГГГ-ММ-ДД."},
+                             status.HTTP_400_BAD_REQUEST)
+
+    schedules = await asearch_schedules(departure_airport, arrival_airport, selected_date, include_nearby_days)
+    if not schedules:
+        return json_response({"detail": "Нет доступных рейсов на указанную дату."}, status.HTTP_404_NOT_FOUND)
+    return json_response(await serialize_schedules(schedules))
+
+
+@async_api()
+async def schedules_search_by_id(request):
+    schedule_id = request.GET.get('id')
+    if not schedule_id or not schedule_id.isdigit():
+        return json_response({"detail": "Необходимо указать id расписания."}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        schedule = await schedules_queryset().aget(id=schedule_id)
+    except Schedules.DoesNotExist:
+        return json_response({"detail": "Расписание с таким id не найдено."}, status.HTTP_404_NOT_FOUND)
+    return json_response(await serialize_schedules(schedule, many=False))
+
+
+@async_api()
+async def tickets_search(request):
+    booking_reference = request.GET.get('booking_reference')
+    logger.info('ticket search', extra={'booking_reference': booking_reference,
+                                        'sample_rate': SEARCH_LOG_SAMPLE_RATE})
+    if booking_reference is None:
+        return json_response({"detail": "Please provide a booking reference."}, status.HTTP_400_BAD_REQUEST)
+
+    tickets = [ticket async for ticket in Tickets.objects.filter(booking_reference=booking_reference)]
+    return json_response(time_serializer(TicketsSerializer(tickets, many=True)).data)
+
+
+@async_api(require_auth=True)
+async def current_user(request):
+    user = await Users.objects.select_related('officeid').aget(pk=request.api_user.pk)
+    return json_response(time_serializer(UsersSerializer(user)).data)
@@ -0,0 +1,111 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Users, Offices
+from .revocation import check_not_revoked
+
+# Снимок пользователя на момент входа, копируется в access-токен при каждом обновлении
+EMAIL_CLAIM = 'email'
+ROLE_CLAIM = 'role'
+OFFICE_CLAIM = 'office'
+OFFICE_TITLE_CLAIM = 'office_title'
+
+STATE_FIELDS = ('active', 'roleid_id', 'officeid_id', 'token_revocation__revoked_before')
+
+
+def add_user_claims(token, user):
+    token[EMAIL_CLAIM] = user.email
+    token[ROLE_CLAIM] = user.roleid_id
+    token[OFFICE_CLAIM] = user.officeid_id
+    token[OFFICE_TITLE_CLAIM] = user.officeid.title if user.officeid_id else None
+    return token
+
+
+def state_key(user_id):
+    return f'user-state:{user_id}'
+
+
+# Актуальные active, роль, офис и время отзыва токенов пользователя кэшируются на USER_STATE_CACHE_TTL
+# секунд: блокировка и смена роли через update_user сбрасывают запись сразу, прочие изменения
+# в базе доходят до запросов не позже чем через TTL. Сброс виден всем воркерам только с общим кэшем
+# (Redis); с кэшем в памяти процесса блокировку в остальных воркерах сбрасывает синхронизация отзывов
+def get_user_state(user_id):
+    state = cache.get(state_key(user_id))
+    if state is None:
+        state = Users.objects.filter(pk=user_id).values_list(*STATE_FIELDS).first()
+        if state is not None:
+            cache.set(state_key(user_id), state, settings.USER_STATE_CACHE_TTL)
+    return state
+
+
+async def aget_user_state(user_id):
+    state = await cache.aget(state_key(user_id))
+    if state is None:
+        state = await Users.objects.filter(pk=user_id).values_list(*STATE_FIELDS).afirst()
+        if state is not None:
+            await cache.aset(state_key(user_id), state, settings.USER_STATE_CACHE_TTL)
+    return state
+
+
+def invalidate_user_state(*user_ids):
+    cache.delete_many([state_key(user_id) for user_id in user_ids])
+
+
+def partial_instance(model, db, values):
+    # from_db ждёт значения в порядке полей модели, остальные поля становятся отложенными
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(db, names, [values[name] for name in names])
+
+
+def build_user(token, user_id, state):
+    # Экземпляр Users без запроса к базе: поля, которых нет в токене (имя, пароль, дата рождения),
+    # отложены и подгрузятся при обращении, роль — тоже при первом обращении к roleid
+    active, role_id, office_id, _ = state
+    db = router.db_for_read(Users)
+    user = partial_instance(Users, db, {'id': user_id, 'email': token[EMAIL_CLAIM], 'active': active,
+                                        'roleid_id': role_id, 'officeid_id': office_id})
+    if office_id is not None and office_id == token.get(OFFICE_CLAIM):
+        user.officeid = partial_instance(Offices, db, {'id': office_id, 'title': token[OFFICE_TITLE_CLAIM]})
+    return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    # Пользователь собирается из claims токена и кэша состояния: обычный запрос не обращается к базе.
+    # Токены, выданные до появления claims, проверяются как в simplejwt
+    def user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+    @staticmethod
+    def check_user(user):
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь заблокирован', code='user_inactive')
+        return user
+
+    def get_user(self, validated_token):
+        user_id = self.user_id(validated_token)
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        check_not_revoked(validated_token, state[-1])
+        if EMAIL_CLAIM not in validated_token:
+            return self.check_user(super().get_user(validated_token))
+        return self.check_user(build_user(validated_token, user_id, state))
+
+    async def aget_user(self, validated_token):
+        user_id = self.user_id(validated_token)
+        state = await aget_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        await sync_to_async(check_not_revoked)(validated_token, state[-1])
+        if EMAIL_CLAIM not in validated_token:
+            user = await Users.objects.select_related('officeid').aget(**{api_settings.USER_ID_FIELD: user_id})
+            return self.check_user(user)
+        return self.check_user(build_user(validated_token, user_id, state))
@@ -0,0 +1,122 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import SeatAvailability, Schedules, Tickets
+
+ECONOMY = 1
+BUSINESS = 2
+FIRST_CLASS = 3
+
+BATCH_SIZE = 1000
+
+
+class NotEnoughSeats(Exception):
+    pass
+
+
+def cabin_capacities(total_seats, economy_seats, business_seats):
+    # Места первого класса в самолёте не хранятся отдельно: это всё, что не эконом и не бизнес
+    return {
+        ECONOMY: economy_seats,
+        BUSINESS: business_seats,
+        FIRST_CLASS: max(total_seats - economy_seats - business_seats, 0),
+    }
+
+
+def _capacity_rows(schedules, sold):
+    for schedule_id, total_seats, economy_seats, business_seats in schedules:
+        for cabin_type_id, capacity in cabin_capacities(total_seats, economy_seats, business_seats).items():
+            yield SeatAvailability(schedule_id=schedule_id, cabin_type_id=cabin_type_id,
+                                   remaining=capacity - sold.get((schedule_id, cabin_type_id), 0))
+
+
+def _capacities_query(schedules):
+    return schedules.values_list('id', 'aircraft__total_seats', 'aircraft__economy_seats',
+                                 'aircraft__business_seats')
+
+
+def _sold_counts(tickets):
+    return {
+        (row['scheduleid'], row['cabintypeid']): row['sold']
+        for row in tickets.values('scheduleid', 'cabintypeid').annotate(sold=Count('id')).order_by()
+    }
+
+
+def _missing(schedule_ids):
+    return set(schedule_ids) - set(
+        SeatAvailability.objects.filter(schedule_id__in=schedule_ids).values_list('schedule_id', flat=True))
+
+
+def _counted_rows(schedule_ids):
+    sold = _sold_counts(Tickets.objects.filter(scheduleid__in=schedule_ids))
+    return _capacity_rows(_capacities_query(Schedules.objects.filter(id__in=schedule_ids)), sold)
+
+
+def _initialize(schedule_ids):
+    # Счётчики для рейсов, у которых их ещё нет, считаются одним агрегатом по билетам
+    schedule_ids = _missing(schedule_ids)
+    if schedule_ids:
+        SeatAvailability.objects.bulk_create(_counted_rows(schedule_ids), batch_size=BATCH_SIZE,
+                                             ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Schedules)
+def schedule_saved(sender, instance, created, raw=False, **kwargs):
+    # Счётчики заводятся вместе с рейсом. Рейсы, вставленные в обход сигналов или из фикстур, получают их
+    # при первом бронировании или в rebuild_seat_availability
+    if created and not raw:
+        _initialize([instance.id])
+
+
+def seats_for(schedule_ids):
+    # Только чтение: для рейсов без счётчиков остаток считается по билетам, но не записывается
+    schedule_ids = set(schedule_ids)
+    rows = list(SeatAvailability.objects.filter(schedule_id__in=schedule_ids).values_list(
+        'schedule_id', 'cabin_type_id', 'remaining'))
+    missing = schedule_ids - {row[0] for row in rows}
+    if missing:
+        rows += [(row.schedule_id, row.cabin_type_id, row.remaining) for row in _counted_rows(missing)]
+
+    seats = defaultdict(dict)
+    for schedule_id, cabin_type_id, remaining in rows:
+        seats[schedule_id][cabin_type_id] = remaining
+    return seats
+
+
+def reserve_seats(schedule_id, cabin_type_id, count):
+    # Условный UPDATE: уменьшение проходит только если мест хватает, без чтения перед записью
+    with transaction.atomic():
+        _initialize([schedule_id])
+        updated = SeatAvailability.objects.filter(
+            schedule_id=schedule_id, cabin_type_id=cabin_type_id, remaining__gte=count,
+        ).update(remaining=F('remaining') - count)
+        if not updated:
+            raise NotEnoughSeats(schedule_id, cabin_type_id)
+
+
+def release_seats(schedule_id, cabin_type_id, count=1):
+    SeatAvailability.objects.filter(schedule_id=schedule_id, cabin_type_id=cabin_type_id).update(
+        remaining=F('remaining') + count)
+
+
+def rebuild_availability():
+    # Полный пересчёт: один агрегат по tickets и потоковая вставка счётчиков пачками
+    created = 0
+    with transaction.atomic():
+        sold = _sold_counts(Tickets.objects.all())
+        SeatAvailability.objects.all().delete()
+        batch = []
+        schedules = _capacities_query(Schedules.objects.all()).iterator(chunk_size=BATCH_SIZE)
+        for row in _capacity_rows(schedules, sold):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                SeatAvailability.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        SeatAvailability.objects.bulk_create(batch)
+        created += len(batch)
+    return created
@@ -0,0 +1,197 @@
+import random
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as dtime, timedelta
+from itertools import count, islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+
+from .availability import ECONOMY, BUSINESS, FIRST_CLASS, rebuild_availability
+from .booking import allocate_booking_references
+from .models import Countries, Offices, Roles, Users, Airports, Routes, Aircrafts, Schedules, CabinTypes, Tickets, \
+    Amenities, AmenitiesTickets, Surveys0
+
+BATCH_SIZE = 5000
+PASSWORD = 'benchmark'
+START_DATE = date(2024, 1, 1)
+SAMPLE_SIZE = 1000
+
+# Размеры синтетического набора; любой параметр можно переопределить из команды benchmark
+SCALES = {
+    'small': {'airports': 50, 'routes': 300, 'aircrafts': 10, 'days': 30, 'schedules': 20000, 'users': 200,
+              'tickets': 50000, 'surveys': 50000},
+    'medium': {'airports': 500, 'routes': 5000, 'aircrafts': 50, 'days': 180, 'schedules': 300000, 'users': 2000,
+               'tickets': 500000, 'surveys': 500000},
+    'large': {'airports': 3000, 'routes': 30000, 'aircrafts': 200, 'days': 365, 'schedules': 3000000,
+              'users': 20000, 'tickets': 3000000, 'surveys': 3000000},
+}
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def _bulk(model, rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+
+
+def _booking_references(total):
+    # Номера из той же серии, что и у броней через API: сценарий create_ticket их не повторит
+    for start in range(0, total, BATCH_SIZE):
+        yield from allocate_booking_references(min(BATCH_SIZE, total - start))
+
+
+def seed(scale, rng):
+    # Генерация детерминирована зерном rng: одинаковый набор для сравнения разных коммитов
+    countries = scale['airports'] // 10 + 1
+    _bulk(Countries, (Countries(id=i, name=f'Country {i}') for i in range(1, countries + 1)))
+    _bulk(Roles, [Roles(id=1, title='Administrator'), Roles(id=2, title='User')])
+    _bulk(Offices, (Offices(id=i, countryid_id=i, title=f'Office {i}', phone='0', contact='Contact')
+                    for i in range(1, min(countries, 20) + 1)))
+    _bulk(CabinTypes, [CabinTypes(id=ECONOMY, name='Economy'), CabinTypes(id=BUSINESS, name='Business'),
+                       CabinTypes(id=FIRST_CLASS, name='First Class')])
+
+    password = make_password(PASSWORD)
+    _bulk(Users, (Users(id=i, roleid_id=1 if i == 1 else 2, email=f'bench{i}@amonic.com', password=password,
+                        lastname=f'User {i}', officeid_id=i % min(countries, 20) + 1, active=1)
+                  for i in range(1, scale['users'] + 1)))
+
+    _bulk(Airports, (Airports(id=i, countryid_id=i % countries + 1, iata_code=f'{i:03d}'[-3:], name=f'Airport {i}')
+                     for i in range(1, scale['airports'] + 1)))
+    pairs = set()
+    while len(pairs) < min(scale['routes'], scale['airports'] * (scale['airports'] - 1)):
+        departure, arrival = rng.sample(range(1, scale['airports'] + 1), 2)
+        pairs.add((departure, arrival))
+    pairs = sorted(pairs)
+    _bulk(Routes, (Routes(id=i, departure_airport_id=departure, arrival_airport_id=arrival,
+                          distance=rng.randint(200, 9000), flight_time=dtime(rng.randint(1, 12), 0))
+                   for i, (departure, arrival) in enumerate(pairs, 1)))
+    _bulk(Aircrafts, (Aircrafts(id=i, name=f'Aircraft {i}', make_model='B738', total_seats=180, economy_seats=150,
+                                business_seats=24) for i in range(1, scale['aircrafts'] + 1)))
+
+    _bulk(Schedules, (Schedules(id=i, date=START_DATE + timedelta(days=rng.randrange(scale['days'])),
+                                time=dtime(rng.randrange(24), rng.choice((0, 15, 30, 45))),
+                                aircraft_id=rng.randint(1, scale['aircrafts']), route_id=rng.randint(1, len(pairs)),
+                                flight_number=f'BM{i}', economy_price=rng.randint(100, 2000), confirmed=True)
+                      for i in range(1, scale['schedules'] + 1)))
+    _bulk(Tickets, (Tickets(id=i, userid_id=rng.randint(1, scale['users']),
+                            scheduleid_id=rng.randint(1, scale['schedules']),
+                            cabintypeid_id=rng.choice((ECONOMY, ECONOMY, ECONOMY, BUSINESS, FIRST_CLASS)),
+                            first_name='Bench', last_name=f'Passenger {i}', email='p@amonic.com', phone='0',
+                            passport_number=str(i), passport_country_id=1,
+                            booking_reference=booking_reference, confirmed=True)
+                    for i, booking_reference in enumerate(_booking_references(scale['tickets']), 1)))
+    _bulk(Amenities, (Amenities(id=i, service=f'Service {i}', price=rng.randint(0, 100)) for i in range(1, 11)))
+    _bulk(AmenitiesTickets, (AmenitiesTickets(amenity_id=rng.randint(1, 10), ticket_id=rng.randint(1, scale['tickets']),
+                                              price=10) for _ in range(scale['tickets'] // 4)))
+    _bulk(Surveys0, (Surveys0(departure_airport_id=rng.randint(1, scale['airports']),
+                              arrival_airport_id=rng.randint(1, scale['airports']), age=rng.randint(18, 80),
+                              gender=rng.choice('MF'), travel_class_id=rng.randint(1, 3),
+                              q1=rng.randint(0, 7), q2=rng.randint(0, 7), q3=rng.randint(0, 7), q4=rng.randint(0, 7),
+                              survey_month=str(rng.randint(1, 12))) for _ in range(scale['surveys'])))
+    # Счётчики мест заводятся так же, как после загрузки рабочей базы
+    rebuild_availability()
+
+
+class Workload:
+    # Запросы строятся из выборки реальных id, чтобы поиск попадал в существующие рейсы и билеты
+    def __init__(self, scale, rng):
+        self.scale = scale
+        schedule_ids = rng.sample(range(1, scale['schedules'] + 1), min(scale['schedules'], SAMPLE_SIZE))
+        self.schedules = list(Schedules.objects.filter(id__in=schedule_ids).values_list(
+            'id', 'route__departure_airport_id', 'route__arrival_airport_id', 'date'))
+        self.tickets = [rng.randint(1, scale['tickets']) for _ in range(SAMPLE_SIZE)]
+        # next() у itertools.count атомарен, номера пассажиров уникальны без блокировки
+        self.numbers = count(1)
+
+    def token(self, rng):
+        user = rng.randint(1, self.scale['users'])
+        return 'post', '/api/token/', {'email': f'bench{user}@amonic.com', 'password': PASSWORD}
+
+    def schedules_search(self, rng):
+        _, departure, arrival, day = rng.choice(self.schedules)
+        return 'get', '/api/schedules/search/', {'departure_airport': departure, 'arrival_airport': arrival,
+                                                 'date': day.isoformat()}
+
+    def create_ticket(self, rng):
+        schedule_id = rng.choice(self.schedules)[0]
+        number = next(self.numbers)
+        return 'post', '/api/create-ticket/', {
+            'flight': schedule_id, 'cabintypeid': ECONOMY,
+            'passengers': [{'first_name': 'Load', 'last_name': f'Test {number}', 'email': 'load@amonic.com',
+                            'phone': '0', 'passport_number': f'L{number}', 'passport_country': 'Country 1'}],
+        }
+
+    def amenities_tickets(self, rng):
+        return 'get', '/api/amenitiestickets/', {'ticket': rng.choice(self.tickets)}
+
+    def surveys(self, rng):
+        return 'get', '/api/surveys0/', {'limit': 50, 'offset': rng.randrange(max(self.scale['surveys'] - 50, 1))}
+
+
+SCENARIOS = {
+    'token': ('token', False),
+    'schedules_search': ('schedules_search', False),
+    'create_ticket': ('create_ticket', True),
+    'amenitiestickets': ('amenities_tickets', False),
+    'surveys0': ('surveys', False),
+}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_scenario(workload, name, requests, concurrency, access_token, seed_value):
+    method_name, needs_auth = SCENARIOS[name]
+    build = getattr(workload, method_name)
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {access_token}'} if needs_auth else {}
+
+    def worker(index):
+        # Свой клиент и свой генератор на поток: потоки не делят состояние
+        client = Client()
+        rng = random.Random(seed_value * 1000 + index)
+        results = []
+        try:
+            for _ in range(index, requests, concurrency):
+                method, path, payload = build(rng)
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(path, payload, **headers)
+                else:
+                    response = client.post(path, payload, content_type='application/json', **headers)
+                elapsed = time.perf_counter() - started
+                match = QUERIES_RE.search(response.get('Server-Timing', ''))
+                results.append((elapsed, response.status_code, int(match.group(1)) if match else None))
+        finally:
+            connection.close()
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [item for chunk in pool.map(worker, range(concurrency)) for item in chunk]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    statuses = {}
+    for _, status_code, _ in results:
+        statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status_code, _ in results if status_code >= 500),
+        'statuses': statuses,
+        'throughput': round(len(results) / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+    }
@@ -0,0 +1,70 @@
+import string
+
+from django.db import IntegrityError, connections, router, transaction
+
+from .models import BookingReferenceSequence, Tickets
+
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+LENGTH = 6
+SPACE = len(ALPHABET) ** LENGTH
+
+# Множитель взаимно прост с 62^6 = 2^6 * 31^6, поэтому отображение номера в код биективно:
+# разные значения последовательности всегда дают разные коды, а соседние коды не похожи друг на друга
+MULTIPLIER = 2654435761
+OFFSET = 916132832
+
+SEQUENCE_ID = 1
+MAX_ATTEMPTS = 5
+
+
+def encode_booking_reference(number):
+    value = (number * MULTIPLIER + OFFSET) % SPACE
+    chars = []
+    for _ in range(LENGTH):
+        value, index = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[index])
+    return ''.join(chars)
+
+
+def allocate_booking_references(count):
+    # Номера выдаются сдвигом единственной строки-счётчика. Вызывается внутри транзакции бронирования:
+    # строка заблокирована до её конца, параллельные брони ждут и никогда не получат одинаковый номер,
+    # а при откате брони номера возвращаются
+    last = _advance_sequence(count)
+    return [encode_booking_reference(number) for number in range(last - count + 1, last + 1)]
+
+
+def create_booked_tickets(build_tickets, count):
+    # Коды серии не повторяются между собой, но могут совпасть со старыми случайными номерами или заданными
+    # вручную. Такая вставка откатывается до точки сохранения и повторяется со следующими номерами серии
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        tickets = build_tickets(allocate_booking_references(count))
+        try:
+            with transaction.atomic():
+                return Tickets.objects.bulk_create(tickets)
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS:
+                raise
+
+
+def _advance_sequence(count):
+    connection = connections[router.db_for_write(BookingReferenceSequence)]
+    table = connection.ops.quote_name(BookingReferenceSequence._meta.db_table)
+    value = connection.ops.quote_name('Value')
+    key = connection.ops.quote_name('ID')
+    with connection.cursor() as cursor:
+        if connection.vendor in ('sqlite', 'postgresql'):
+            cursor.execute(f'UPDATE {table} SET {value} = {value} + %s WHERE {key} = %s RETURNING {value}',
+                           [count, SEQUENCE_ID])
+            row = cursor.fetchone()
+        else:
+            cursor.execute(f'UPDATE {table} SET {value} = {value} + %s WHERE {key} = %s', [count, SEQUENCE_ID])
+            row = None
+            if cursor.rowcount:
+                cursor.execute(f'SELECT {value} FROM {table} WHERE {key} = %s', [SEQUENCE_ID])
+                row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+    # Строку-счётчик создаёт миграция; без неё (очищенная база) счётчик заводится заново
+    BookingReferenceSequence.objects.get_or_create(id=SEQUENCE_ID)
+    return _advance_sequence(count)
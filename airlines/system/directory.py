@@ -0,0 +1,72 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Users
+
+FTS_TABLE = 'users_fts'
+TERM_RE = re.compile(r'\w+')
+
+# Внешний FTS5-индекс над users: текст не дублируется, триггеры держат индекс в согласии с таблицей,
+# в том числе при bulk_create/bulk_update и правках в обход Django
+FTS_SQL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f'FirstName, LastName, Email, content=\'users\', content_rowid=\'ID\', tokenize="unicode61 remove_diacritics 2")',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON users BEGIN '
+    f'INSERT INTO {FTS_TABLE}(rowid, FirstName, LastName, Email) '
+    f'VALUES (new.ID, new.FirstName, new.LastName, new.Email); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON users BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, FirstName, LastName, Email) '
+    f'VALUES (\'delete\', old.ID, old.FirstName, old.LastName, old.Email); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF FirstName, LastName, Email ON users BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, FirstName, LastName, Email) '
+    f'VALUES (\'delete\', old.ID, old.FirstName, old.LastName, old.Email); '
+    f'INSERT INTO {FTS_TABLE}(rowid, FirstName, LastName, Email) '
+    f'VALUES (new.ID, new.FirstName, new.LastName, new.Email); END',
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES (\'rebuild\')',
+]
+
+_fts5_support = {}
+
+
+def has_fts5(connection):
+    # Полнотекстовый индекс есть только у SQLite, собранного с FTS5; иначе поиск идёт по префиксам полей.
+    # Сборка не меняется во время работы процесса, поэтому ответ запоминается по алиасу базы
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts5_support:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5_support[connection.alias] = bool(cursor.fetchone()[0])
+    return _fts5_support[connection.alias]
+
+
+def create_search_index(connection):
+    if not has_fts5(connection):
+        return
+    with connection.cursor() as cursor:
+        for sql in FTS_SQL:
+            cursor.execute(sql)
+
+
+def search_users(query=None, office=None, role=None, active=None):
+    users = Users.objects.select_related('officeid')
+    if office is not None:
+        users = users.filter(officeid=office)
+    if role is not None:
+        users = users.filter(roleid=role)
+    if active is not None:
+        users = users.filter(active=active)
+
+    # Каждое слово запроса — префикс любого слова имени, фамилии или email, все слова обязательны
+    terms = TERM_RE.findall(query or '')
+    if terms and has_fts5(connections[router.db_for_read(Users)]):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        users = users.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+    else:
+        for term in terms:
+            users = users.filter(Q(firstname__istartswith=term) | Q(lastname__istartswith=term) |
+                                 Q(email__istartswith=term))
+    return users.order_by('lastname', 'firstname', 'id')
@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    # Число итераций берётся из настроек, по умолчанию — значение Django. Хеш с меньшим числом итераций
+    # check_password пересчитывает при следующем успешном входе, более дорогой хеш не понижается
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING['PBKDF2_ITERATIONS'] or super().iterations
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return decoded['iterations'] < self.iterations or \
+            hashers.must_update_salt(decoded['salt'], self.salt_entropy)
+
+
+def is_plaintext(encoded):
+    # Пароли из исходной базы хранятся открытым текстом, пока их не зашифрует set_passwords
+    if not encoded or encoded.startswith(hashers.UNUSABLE_PASSWORD_PREFIX):
+        return False
+    try:
+        hashers.identify_hasher(encoded)
+    except ValueError:
+        return True
+    return False
+
+
+def hash_passwords(passwords, workers=None):
+    # PBKDF2 в hashlib отпускает GIL на время вычисления, поэтому потоки хешируют параллельно
+    # и в обработчике запроса не нужно запускать процессы
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2:
+        return [hashers.make_password(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=min(workers, len(passwords))) as pool:
+        return list(pool.map(hashers.make_password, passwords))
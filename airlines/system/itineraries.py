@@ -0,0 +1,165 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db.models.signals import post_save, post_delete
+
+from .models import Routes, RouteChange
+from .reference_cache import table_version
+from .search import schedules_queryset
+
+MAX_STOPS = 2
+MIN_CONNECTION_TIME = timedelta(minutes=60)
+MAX_CONNECTION_TIME = timedelta(hours=24)
+MAX_ITINERARIES = 50
+CHANGE_LOG_SIZE = 1000
+
+
+def time_to_timedelta(value):
+    return timedelta(hours=value.hour, minutes=value.minute, seconds=value.second)
+
+
+class RouteGraph:
+    # Граф маршрутов в памяти процесса: аэропорт вылета -> {id маршрута: аэропорт прилёта}.
+    # Граф привязан к версии таблицы routes из reference_versions. Воркер сверяет версию не чаще раза в
+    # CHECK_INTERVAL секунд и доводит граф до неё по журналу route_changes, перечитывая только изменённые
+    # маршруты. Полная пересборка нужна, если в журнале пропуск (версию подняли без записи или журнал
+    # обрезан), и раз в MAX_AGE секунд — для правок в обход сигналов (update(), bulk_create, SQL)
+    CHECK_INTERVAL = 5
+    MAX_AGE = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._edges = None
+        self._version = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+
+    def _build(self, version):
+        edges = defaultdict(dict)
+        for route_id, departure_id, arrival_id in Routes.objects.values_list(
+                'id', 'departure_airport_id', 'arrival_airport_id'):
+            edges[departure_id][route_id] = arrival_id
+        self._edges, self._version, self._built_at = edges, version, time.monotonic()
+
+    def _apply_changes(self, version):
+        changes = list(RouteChange.objects.filter(version__gt=self._version, version__lte=version)
+                       .order_by('version').values_list('version', 'route_id'))
+        if [change_version for change_version, _ in changes] != list(range(self._version + 1, version + 1)):
+            return False
+
+        route_ids = {route_id for _, route_id in changes}
+        routes = Routes.objects.filter(id__in=route_ids).values_list('id', 'departure_airport_id',
+                                                                     'arrival_airport_id')
+        # Граф не меняется на месте: поиски в других потоках дочитывают свою копию
+        edges = defaultdict(dict, self._edges)
+        for departure_id, targets in self._edges.items():
+            if route_ids & targets.keys():
+                edges[departure_id] = {route_id: arrival_id for route_id, arrival_id in targets.items()
+                                       if route_id not in route_ids}
+        for route_id, departure_id, arrival_id in routes:
+            edges[departure_id] = {**edges.get(departure_id, {}), route_id: arrival_id}
+        self._edges, self._version = edges, version
+        return True
+
+    def _current_edges(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._edges is not None and now - self._checked_at < self.CHECK_INTERVAL and \
+                    now - self._built_at < self.MAX_AGE:
+                return self._edges
+            version = table_version(Routes)
+            if self._edges is None or now - self._built_at >= self.MAX_AGE or \
+                    version != self._version and not self._apply_changes(version):
+                self._build(version)
+            self._checked_at = now
+            return self._edges
+
+    def expire(self):
+        # Следующий поиск сверит версию сразу, не дожидаясь CHECK_INTERVAL
+        with self._lock:
+            self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._edges = None
+
+    def paths(self, departure_airport, arrival_airport, max_stops=MAX_STOPS):
+        # Поиск в глубину с ограничением числа пересадок, без повторного посещения аэропортов.
+        # Граф не меняется после сборки, правки подменяют его копией
+        edges = self._current_edges()
+        found = []
+        stack = [(departure_airport, [], {departure_airport})]
+        while stack:
+            airport, path, visited = stack.pop()
+            for route_id, next_airport in edges.get(airport, {}).items():
+                if next_airport == arrival_airport:
+                    found.append(path + [route_id])
+                elif len(path) < max_stops and next_airport not in visited:
+                    stack.append((next_airport, path + [route_id], visited | {next_airport}))
+        return found
+
+
+route_graph = RouteGraph()
+
+
+def route_changed(sender, instance, **kwargs):
+    # Выполняется после reference_changed (он подключён раньше, при импорте reference_cache), поэтому
+    # версия уже поднята. Строка версии заблокирована до конца транзакции, и номер достаётся только этой правке
+    version = table_version(Routes)
+    RouteChange.objects.create(version=version, route_id=instance.id)
+    RouteChange.objects.filter(version__lte=version - CHANGE_LOG_SIZE).delete()
+    route_graph.expire()
+
+
+post_save.connect(route_changed, sender=Routes, dispatch_uid='route_graph_saved')
+post_delete.connect(route_changed, sender=Routes, dispatch_uid='route_graph_deleted')
+
+
+class Leg:
+    __slots__ = ('schedule', 'departure', 'arrival')
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.departure = datetime.combine(schedule.date, schedule.time)
+        self.arrival = self.departure + time_to_timedelta(schedule.route.flight_time)
+
+
+def search_itineraries(departure_airport, arrival_airport, selected_date, max_stops=MAX_STOPS):
+    paths = route_graph.paths(departure_airport, arrival_airport, max_stops)
+    if not paths:
+        return []
+
+    route_ids = {route_id for path in paths for route_id in path}
+    last_date = selected_date + (MAX_CONNECTION_TIME + timedelta(days=1)) * max_stops
+
+    # Все участки всех путей одним запросом по индексу schedules(RouteID, Date, Time)
+    legs_by_route = defaultdict(list)
+    for schedule in schedules_queryset().filter(route__in=route_ids, confirmed=True,
+                                                date__range=(selected_date, last_date)).order_by('date', 'time'):
+        legs_by_route[schedule.route_id].append(Leg(schedule))
+    departures_by_route = {route_id: [leg.departure for leg in legs] for route_id, legs in legs_by_route.items()}
+
+    itineraries = []
+    for path in paths:
+        first_legs = [leg for leg in legs_by_route.get(path[0], []) if leg.schedule.date == selected_date]
+        stack = [[leg] for leg in first_legs]
+        while stack:
+            legs = stack.pop()
+            if len(legs) == len(path):
+                itineraries.append(legs)
+                continue
+            route_id = path[len(legs)]
+            candidates = legs_by_route.get(route_id, [])
+            earliest = legs[-1].arrival + MIN_CONNECTION_TIME
+            latest = legs[-1].arrival + MAX_CONNECTION_TIME
+            start = bisect_left(departures_by_route.get(route_id, []), earliest)
+            for leg in candidates[start:]:
+                if leg.departure > latest:
+                    break
+                stack.append(legs + [leg])
+
+    itineraries.sort(key=lambda legs: (legs[-1].arrival, len(legs)))
+    return itineraries[:MAX_ITINERARIES]
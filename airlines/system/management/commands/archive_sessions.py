@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from system.session_tracking import ARCHIVE_BATCH_SIZE, archive_sessions, close_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Move closed user sessions older than the archive horizon into user_session_archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SESSION_ARCHIVE_DAYS,
+                            help='Archive sessions that started more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Sessions moved per transaction')
+        parser.add_argument('--close-stale', action='store_true',
+                            help='First close sessions left open by a later login of the same user')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['close_stale']:
+            closed = close_stale_sessions(kwargs['batch_size'])
+            self.stdout.write(f'Closed {closed} stale sessions')
+        before = timezone.now() - timedelta(days=kwargs['days'])
+        archived = archive_sessions(before, kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} sessions started before {before:%Y-%m-%d}'))
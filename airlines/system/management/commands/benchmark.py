@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from system.benchmark import SCALES, SCENARIOS, PASSWORD, Workload, run_scenario, seed
+from system.models import Users
+from system.revocation import token_revocations
+from system.session_tracking import session_events
+from system.test_runner import create_unmanaged_tables
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database with synthetic data and load-test the API routes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small', help='Dataset size preset')
+        for key in SCALES['small']:
+            parser.add_argument(f'--{key}', type=int, help=f'Override the number of {key} in the preset')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f'Comma-separated subset of: {", ".join(SCENARIOS)}')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for data and requests')
+        parser.add_argument('--db-name', help='Throwaway database name (SQLite file path); a new temp file by default')
+        parser.add_argument('--keepdb', action='store_true', help='Keep and reuse the seeded database')
+        parser.add_argument('--output', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Previous JSON results to compare against')
+
+    def handle(self, *args, **kwargs):
+        scale = {key: kwargs[key] if kwargs[key] is not None else value for key, value in SCALES[kwargs['scale']].items()}
+        scenarios = [name for name in kwargs['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        if kwargs['keepdb'] and not kwargs['db_name'] and connection.vendor == 'sqlite':
+            raise CommandError('--keepdb needs --db-name to find the seeded database again')
+
+        # Тестовая база создаётся и удаляется средствами Django: рабочая база не затрагивается
+        setup_test_environment(debug=False)
+        if kwargs['db_name']:
+            connection.settings_dict['TEST']['NAME'] = kwargs['db_name']
+        elif connection.vendor == 'sqlite':
+            # Общая in-memory база блокирует таблицы целиком и под конкурентной нагрузкой отвечает ошибками.
+            # Имя файла уникально, параллельные запуски не затирают базы друг друга; файл удаляет destroy_test_db
+            descriptor, path = tempfile.mkstemp(prefix='airlines-benchmark-', suffix='.sqlite3')
+            os.close(descriptor)
+            connection.settings_dict['TEST']['NAME'] = path
+        if connection.vendor == 'sqlite':
+            # Конкурентные записи в SQLite без IMMEDIATE падают с "database is locked" вместо ожидания
+            # блокировки; замер должен показывать очередь на запись, а не ошибки
+            connection.settings_dict['OPTIONS'].update({'transaction_mode': 'IMMEDIATE', 'timeout': 30})
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=kwargs['keepdb'])
+        try:
+            results = self.run(scale, scenarios, kwargs)
+        finally:
+            # Очередь событий сессий дописывается, синхронизация отзывов останавливается до удаления базы
+            session_events.stop()
+            token_revocations.reset()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=kwargs['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'commit': self.git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'scale': scale,
+            'requests': kwargs['requests'],
+            'concurrency': kwargs['concurrency'],
+            'seed': kwargs['seed'],
+            'scenarios': results,
+        }
+        output = kwargs['output'] or f'benchmark-{report["commit"] or "local"}-{datetime.now():%Y%m%d%H%M%S}.json'
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if kwargs['compare']:
+            with open(kwargs['compare']) as file:
+                self.compare(json.load(file), report)
+
+    def run(self, scale, scenarios, kwargs):
+        rng = random.Random(kwargs['seed'])
+        if 'users' not in connection.introspection.table_names():
+            create_unmanaged_tables(connection)
+        if not Users.objects.exists():
+            self.stdout.write(f'Seeding {", ".join(f"{value} {key}" for key, value in scale.items())}...')
+            seed(scale, rng)
+        workload = Workload(scale, rng)
+
+        response = Client().post('/api/token/', {'email': 'bench1@amonic.com', 'password': PASSWORD},
+                                 content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f'Cannot obtain a token for the benchmark user: {response.content[:200]!r}')
+        access_token = response.json()['access']
+
+        results = {}
+        self.stdout.write(f'{"scenario":<20}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}'
+                          f'{"errors":>8}')
+        for name in scenarios:
+            result = results[name] = run_scenario(workload, name, kwargs['requests'], kwargs['concurrency'],
+                                                  access_token, kwargs['seed'])
+            self.stdout.write(f'{name:<20}{result["throughput"]:>9}{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                              f'{result["p99_ms"]:>9}{result["queries_per_request"]!s:>9}{result["errors"]:>8}')
+        return results
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(__file__), check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, previous, current):
+        self.stdout.write(f'Compared with {previous.get("commit")}:')
+        for name, result in current['scenarios'].items():
+            before = previous.get('scenarios', {}).get(name)
+            if before is None:
+                continue
+            throughput = (result['throughput'] - before['throughput']) / before['throughput'] * 100
+            p95 = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            self.stdout.write(f'{name:<20}throughput {throughput:+.1f}%  p95 {p95:+.1f}%  '
+                              f'queries {before["queries_per_request"]} -> {result["queries_per_request"]}')
@@ -0,0 +1,67 @@
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from system.log import AsyncJsonHandler, JsonFormatter
+
+
+class SlowStream:
+    # Поток вывода, который блокируется на каждой записи, как stdout под нагруженным gunicorn
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare request latency with synchronous and queued logging under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+        parser.add_argument('--write-delay', type=float, default=0.002,
+                            help='Seconds each write to the log stream blocks')
+        parser.add_argument('--path', default='/api/tickets/search/?booking_reference=BENCH1',
+                            help='Endpoint to request')
+
+    def handle(self, *args, **kwargs):
+        logger = logging.getLogger('system')
+        saved = logger.handlers[:], logger.propagate
+        stream = SlowStream(kwargs['write_delay'])
+        sync_handler = logging.StreamHandler(stream)
+        sync_handler.setFormatter(JsonFormatter())
+
+        # Каждый запрос пишет ровно одну запись: сэмплирование отключено, чтобы сравнение было честным
+        modes = [('none', logging.NullHandler()), ('sync', sync_handler), ('async', AsyncJsonHandler(stream))]
+        self.stdout.write(f'{"mode":<8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+        try:
+            logger.propagate = False
+            for name, handler in modes:
+                logger.handlers = [handler]
+                latencies, elapsed = self.run(kwargs['path'], kwargs['requests'], kwargs['concurrency'])
+                quantiles = statistics.quantiles(latencies, n=100)
+                self.stdout.write(f'{name:<8}{len(latencies) / elapsed:>10.0f}{quantiles[49] * 1000:>10.2f}'
+                                  f'{quantiles[94] * 1000:>10.2f}{quantiles[98] * 1000:>10.2f}')
+                handler.close()
+        finally:
+            logger.handlers, logger.propagate = saved
+
+    @staticmethod
+    def run(path, total, concurrency):
+        def request(_):
+            started = time.perf_counter()
+            Client(HTTP_HOST='localhost').get(path)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(request, range(total)))
+        return latencies, time.perf_counter() - started
@@ -1,44 +1,127 @@
-from django.core.management.base import BaseCommand
-from system.models import Surveys0, Airports, CabinTypes
-import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from system.models import Surveys0, Airports, CabinTypes, SurveyImportProgress
+from system.survey_summary import SummaryWriter
+from system.surveys import BATCH, BATCH_SIZE, DONE, ERROR, FIELDS, collect_files, file_messages, init_worker, \
+    month_from_filename, parse_file
+
+POLL_INTERVAL = 1
+
 
 class Command(BaseCommand):
-    help = 'Import survey data from CSV'
+    help = 'Import survey data from CSV files, directories or glob patterns'
 
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Path to the CSV file')
+        parser.add_argument('paths', nargs='+', type=str, help='CSV files, directories or glob patterns')
+        parser.add_argument('--survey-month', type=str,
+                            help='Survey month to store, by default taken from a survey_MM.csv file name')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Parser processes; batches are still written by this process only')
 
     def handle(self, *args, **kwargs):
-        file_path = kwargs['file_path']
-        with open(file_path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader)
-            surveys = []
-            for row in reader:
-                departure_airport = Airports.objects.get(id=row[0]) if row[0].isdigit() else None
-                arrival_airport = Airports.objects.get(id=row[1]) if row[1].isdigit() else None
-                age = int(row[2]) if row[2].isdigit() else None
-                gender = row[3] if row[3] else 'M'
-                travel_class = CabinTypes.objects.get(id=row[4]) if row[4].isdigit() else None
-                q1 = int(row[5]) if row[5].isdigit() else None
-                q2 = int(row[6]) if row[6].isdigit() else None
-                q3 = int(row[7]) if row[7].isdigit() else None
-                q4 = int(row[8]) if row[8].isdigit() else None
-
-                if departure_airport and arrival_airport and travel_class:
-                    survey = Surveys0(
-                        departure_airport=departure_airport,
-                        arrival_airport=arrival_airport,
-                        age=age,
-                        gender=gender,
-                        travel_class=travel_class,
-                        q1=q1,
-                        q2=q2,
-                        q3=q3,
-                        q4=q4,
-                        survey_month='7'
-                    )
-                    surveys.append(survey)
-            if surveys:
-                Surveys0.objects.bulk_create(surveys)
-            self.stdout.write(self.style.SUCCESS('Successfully imported surveys'))
+        files = collect_files(kwargs['paths'])
+        progress = {item.file_path: item for item in SurveyImportProgress.objects.filter(file_path__in=files)}
+
+        tasks = []
+        for file_path in files:
+            item = progress.get(file_path)
+            if item is None:
+                survey_month = kwargs['survey_month'] or month_from_filename(file_path)
+                if not survey_month:
+                    raise CommandError(f'Cannot infer survey month from {file_path}, pass --survey-month')
+                item = progress[file_path] = SurveyImportProgress.objects.create(file_path=file_path,
+                                                                                 survey_month=survey_month)
+            if item.completed:
+                self.stdout.write(f'{file_path}: already imported, skipping')
+                continue
+            if item.rows_read:
+                self.stdout.write(f'{file_path}: resuming after {item.rows_read} rows')
+            tasks.append((file_path, item.rows_read))
+
+        airport_ids = set(Airports.objects.values_list('id', flat=True))
+        cabin_ids = set(CabinTypes.objects.values_list('id', flat=True))
+        imported = rejected = 0
+        failed = []
+        summary = SummaryWriter()
+        started = time.monotonic()
+
+        for kind, file_path, payload in self.messages(tasks, airport_ids, cabin_ids, kwargs):
+            item = progress[file_path]
+            if kind == BATCH:
+                rows, skipped, read = payload
+                # Пачка, отметка о прогрессе и сводный куб фиксируются вместе, поэтому прерванный
+                # импорт продолжается ровно с первой незаписанной строки
+                with transaction.atomic():
+                    Surveys0.objects.bulk_create(
+                        [Surveys0(**dict(zip(FIELDS, values)), survey_month=item.survey_month) for values in rows],
+                        batch_size=kwargs['batch_size'])
+                    SurveyImportProgress.objects.filter(id=item.id).update(
+                        rows_read=F('rows_read') + read, rows_imported=F('rows_imported') + len(rows),
+                        rows_rejected=F('rows_rejected') + skipped)
+                    summary.add(item.survey_month, rows)
+                imported += len(rows)
+                rejected += skipped
+            elif kind == DONE:
+                SurveyImportProgress.objects.filter(id=item.id).update(completed=True)
+                item.refresh_from_db()
+                self.stdout.write(f'{file_path}: imported {item.rows_imported}, rejected {item.rows_rejected}')
+            elif kind == ERROR:
+                failed.append(file_path)
+                self.stderr.write(f'{file_path}: {payload}')
+
+        elapsed = time.monotonic() - started
+        rate = imported / elapsed if elapsed else imported
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully imported {imported} surveys ({rate:.0f} rows/sec), rejected {rejected} rows'))
+        if failed:
+            raise CommandError(f'{len(failed)} file(s) failed, rerun the command to resume them')
+
+    def messages(self, tasks, airport_ids, cabin_ids, kwargs):
+        workers = min(kwargs['workers'], len(tasks))
+        if workers <= 1:
+            for file_path, skip_rows in tasks:
+                yield from file_messages(file_path, skip_rows, airport_ids, cabin_ids, kwargs['batch_size'])
+            return
+
+        # Разбор идёт в пуле процессов, запись в базу остаётся в одном процессе.
+        # Ограниченная очередь не даёт парсерам уйти далеко вперёд писателя. Процессы запускаются через spawn:
+        # fork скопировал бы потоки логирования, записи сессий и синхронизации отзывов в неопределённом состоянии
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue(maxsize=workers * 2)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(queue, airport_ids, cabin_ids, kwargs['batch_size'])) as pool:
+            futures = [pool.submit(parse_file, file_path, skip_rows) for file_path, skip_rows in tasks]
+            pending = len(tasks)
+            try:
+                while pending:
+                    try:
+                        message = queue.get(timeout=POLL_INTERVAL)
+                    except Empty:
+                        # Убитый парсер (OOM, сигнал) не пришлёт DONE или ERROR: пул помечает
+                        # задачи BrokenProcessPool, и импорт прерывается вместо бесконечного ожидания
+                        for future in futures:
+                            if future.done() and future.exception() is not None:
+                                raise CommandError(f'Parser process failed: {future.exception()!r}; '
+                                                   f'rerun the command to resume')
+                        continue
+                    if message[0] in (DONE, ERROR):
+                        pending -= 1
+                    yield message
+            finally:
+                # Если писатель упал, очередь разгружается, чтобы заблокированные парсеры завершились
+                for future in futures:
+                    future.cancel()
+                while not all(future.done() for future in futures):
+                    try:
+                        queue.get(timeout=0.1)
+                    except Empty:
+                        pass
@@ -0,0 +1,38 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from system.user_admin import UserBatchError, create_users
+
+MAX_REPORTED_ERRORS = 50
+OPTIONAL_COLUMNS = ('roleid', 'active')
+
+
+class Command(BaseCommand):
+    help = 'Create users from a CSV file with email, firstname, lastname, office_name, birthdate and password columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV file; optional roleid and active columns')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Password hashing threads')
+        parser.add_argument('--delimiter', default=',', help='CSV delimiter')
+
+    def handle(self, *args, **kwargs):
+        try:
+            with open(kwargs['path'], newline='', encoding='utf-8-sig') as file:
+                # Пустые необязательные колонки не передаются: для них действуют значения по умолчанию
+                rows = [{key: value for key, value in row.items() if key and (value or key not in OPTIONAL_COLUMNS)}
+                        for row in csv.DictReader(file, delimiter=kwargs['delimiter'])]
+        except OSError as e:
+            raise CommandError(f'Cannot read {kwargs["path"]}: {e}')
+
+        try:
+            users = create_users(rows, workers=kwargs['workers'])
+        except UserBatchError as e:
+            for item in e.errors[:MAX_REPORTED_ERRORS]:
+                # Строка 1 файла — заголовок
+                details = '; '.join(f'{field}: {message}' for field, message in item['errors'].items())
+                self.stderr.write(f'line {item["row"] + 1}: {details}')
+            raise CommandError(f'{len(e.errors)} invalid rows, nothing imported')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(users)} users'))
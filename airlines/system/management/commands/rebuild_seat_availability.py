@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from system.availability import rebuild_availability
+
+
+class Command(BaseCommand):
+    help = 'Rebuild remaining seat counters from sold tickets'
+
+    def handle(self, *args, **kwargs):
+        created = rebuild_availability()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} seat availability rows'))
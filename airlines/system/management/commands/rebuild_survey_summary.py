@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from system.survey_summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the survey summary table from surveys0'
+
+    def handle(self, *args, **kwargs):
+        created = rebuild_summary()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} survey summary rows'))
@@ -1,17 +1,55 @@
-from system.models import Users
-from django.contrib.auth.hashers import make_password
+import os
+
+from django.contrib.auth.hashers import identify_hasher, is_password_usable
 from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from system.hashers import hash_passwords, is_plaintext
+from system.models import Users
+
+READ_CHUNK = 2000
 
 
 class Command(BaseCommand):
-    def handle(self, *args, **options):
+    help = 'Hash plaintext passwords in parallel and report hashes that will be upgraded on login'
 
-        users = Users.objects.all()
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Hashing threads')
+        parser.add_argument('--batch-size', type=int, default=200, help='Users per hashing batch and UPDATE')
 
-        for user in users:
-            if not user.password.startswith('pbkdf2_'):
-                user.password = make_password(user.password)
-                user.save(update_fields=['password'])
+    def handle(self, *args, **options):
+        checked = hashed = outdated = 0
+        pending = []
+        last_id = 0
+        # Пользователи читаются пачками по id, зашифрованные пачки пишутся сразу: открытые пароли
+        # всей таблицы не копятся в памяти, а прерванный запуск продолжается с оставшихся
+        while True:
+            rows = list(Users.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'password')[:READ_CHUNK])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for user_id, password in rows:
+                checked += 1
+                if is_plaintext(password):
+                    pending.append((user_id, password))
+                elif password and is_password_usable(password) and identify_hasher(password).must_update(password):
+                    # Без исходного пароля такой хеш не пересчитать, это сделает вход пользователя
+                    outdated += 1
+                if len(pending) >= options['batch_size']:
+                    hashed += self.save(pending, options['workers'])
+                    pending = []
+        hashed += self.save(pending, options['workers'])
 
-        print(f"Пароли для {users.count()} пользователей проверены и зашифрованы, если это требовалось.")
+        self.stdout.write(f"Пароли для {checked} пользователей проверены: зашифровано {hashed}, "
+                          f"ещё {outdated} будут пересчитаны при следующем входе.")
 
+    @staticmethod
+    def save(rows, workers):
+        # PBKDF2 отпускает GIL, поэтому пачку хешируют потоки hash_passwords
+        if not rows:
+            return 0
+        passwords = hash_passwords([password for _, password in rows], workers)
+        with transaction.atomic():
+            Users.objects.bulk_update([Users(id=user_id, password=password)
+                                       for (user_id, _), password in zip(rows, passwords)], ['password'])
+        return len(rows)
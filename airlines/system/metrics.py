@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+WINDOW = 1024
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class RequestTimer:
+    __slots__ = ('started', 'queries', 'db_time', 'serialize_time', 'render_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+
+# Таймер текущего запроса. ContextVar переходит и в sync_to_async, поэтому запросы async ORM
+# и синхронные вьюхи под ASGI учитываются так же, как под WSGI
+current_timer = ContextVar('request_timer', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # execute_wrapper: только счётчик и время, сам SQL не сохраняется
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.db_time += time.perf_counter() - started
+        timer.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ViewStats:
+    __slots__ = ('durations', 'count', 'total', 'queries', 'db_time', 'serialize_time', 'render_time')
+
+    def __init__(self):
+        self.durations = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+
+
+class MetricsRegistry:
+    # Запись — несколько сложений под замком; перцентили по последним WINDOW запросам
+    # считаются только при чтении /api/metrics
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, duration, timer):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.durations.append(duration)
+            stats.count += 1
+            stats.total += duration
+            stats.queries += timer.queries
+            stats.db_time += timer.db_time
+            stats.serialize_time += timer.serialize_time
+            stats.render_time += timer.render_time
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {view: (sorted(stats.durations), stats.count, stats.total, stats.queries, stats.db_time,
+                           stats.serialize_time, stats.render_time) for view, stats in self._views.items()}
+
+    def prometheus(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request wall time over the last requests per view',
+            '# TYPE http_request_duration_seconds summary',
+        ]
+        counters = {'db_queries_total': [], 'db_time_seconds_total': [], 'serialize_time_seconds_total': [],
+                    'render_time_seconds_total': []}
+        for view, (durations, count, total, queries, db_time, serialize_time, render_time) in \
+                sorted(self.snapshot().items()):
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            for quantile in QUANTILES:
+                value = durations[min(int(quantile * len(durations)), len(durations) - 1)]
+                lines.append(f'http_request_duration_seconds{{view="{label}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'http_request_duration_seconds_sum{{view="{label}"}} {total:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{view="{label}"}} {count}')
+            counters['db_queries_total'].append(f'db_queries_total{{view="{label}"}} {queries}')
+            counters['db_time_seconds_total'].append(f'db_time_seconds_total{{view="{label}"}} {db_time:.6f}')
+            counters['serialize_time_seconds_total'].append(
+                f'serialize_time_seconds_total{{view="{label}"}} {serialize_time:.6f}')
+            counters['render_time_seconds_total'].append(
+                f'render_time_seconds_total{{view="{label}"}} {render_time:.6f}')
+        for name, values in counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(values)
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def time_serializer(serializer):
+    # Засекается to_representation верхнего уровня (serializer.data). SQL ленивых queryset,
+    # выполненный внутри, вычитается: он уже учтён во времени базы
+    representation = serializer.to_representation
+
+    def timed(instance):
+        timer = current_timer.get()
+        if timer is None:
+            return representation(instance)
+        started, db_time = time.perf_counter(), timer.db_time
+        try:
+            return representation(instance)
+        finally:
+            timer.serialize_time += time.perf_counter() - started - (timer.db_time - db_time)
+
+    serializer.to_representation = timed
+    return serializer
+
+
+class TimedJSONRenderer(JSONRenderer):
+    # Время превращения данных сериализатора в JSON попадает в метрики запроса
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            timer = current_timer.get()
+            if timer is not None:
+                timer.render_time += time.perf_counter() - started
@@ -1,21 +1,64 @@
 # middleware.py
-from django.utils import timezone
-from .models import UserSessionTracking
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import RequestTimer, current_timer, registry
+from .session_tracking import session_events, SERVER_ERROR
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    # Время запроса, число и время SQL-запросов, сериализации и рендеринга: в заголовок Server-Timing и в /api/metrics.
+    # Работает и под WSGI, и под ASGI, не переводя async-вьюхи в потоки
+    sync_capable = True
+    async_capable = True
 
-class UserSessionTrackingMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer)
+
+    @staticmethod
+    def finish(request, response, timer):
+        total = time.perf_counter() - timer.started
+        match = request.resolver_match
+        registry.record(match.view_name if match else 'unresolved', total, timer)
+
+        app_time = total - timer.db_time - timer.serialize_time - timer.render_time
+        response['Server-Timing'] = (f'db;dur={timer.db_time * 1000:.1f};desc="{timer.queries} queries", '
+                                     f'serialize;dur={timer.serialize_time * 1000:.1f}, '
+                                     f'render;dur={timer.render_time * 1000:.1f}, app;dur={app_time * 1000:.1f}, '
+                                     f'total;dur={total * 1000:.1f}')
         return response
 
+
+class UserSessionTrackingMiddleware(MiddlewareMixin):
     def process_exception(self, request, exception):
-        print(request.user)
+        logger.error('unhandled exception', exc_info=exception,
+                     extra={'path': request.path, 'user_id': getattr(request.user, 'id', None)})
         if request.user.is_authenticated:
-            print(request.user)
-            session = UserSessionTracking.objects.filter(user=request.user, logout_time__isnull=True).last()
-            if session:
-                session.logout_time = timezone.now()
-                session.logout_reason = 'Ошибка на стороне сервера'
-                session.save()
+            session_events.logout(request.user.id, SERVER_ERROR)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0009_rename_amenityid_amenitiestickets_amenity_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='routes',
+            index=models.Index(fields=['departure_airport', 'arrival_airport'], name='routes_dep_arr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedules',
+            index=models.Index(fields=['route', 'date', 'time'], name='schedules_route_date_time_idx'),
+        ),
+    ]
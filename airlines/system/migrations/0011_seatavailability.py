@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0010_schedules_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remaining', models.IntegerField(db_column='Remaining')),
+                ('cabin_type', models.ForeignKey(db_column='CabinTypeID', on_delete=django.db.models.deletion.DO_NOTHING, to='system.cabintypes')),
+                ('schedule', models.ForeignKey(db_column='ScheduleID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='seat_availability', to='system.schedules')),
+            ],
+            options={
+                'db_table': 'seat_availability',
+                'constraints': [models.UniqueConstraint(fields=('schedule', 'cabin_type'), name='seat_availability_schedule_cabin_uniq')],
+            },
+        ),
+    ]
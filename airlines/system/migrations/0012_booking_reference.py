@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0011_seatavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingReferenceSequence',
+            fields=[
+                ('id', models.AutoField(db_column='ID', primary_key=True, serialize=False)),
+            ],
+            options={
+                'db_table': 'booking_reference_sequence',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tickets',
+            constraint=models.UniqueConstraint(fields=('booking_reference', 'scheduleid'), name='tickets_booking_reference_uniq'),
+        ),
+    ]
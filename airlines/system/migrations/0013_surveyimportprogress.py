@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0012_booking_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveyImportProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.TextField(db_column='FilePath', unique=True)),
+                ('survey_month', models.CharField(db_column='SurveyMonth', max_length=20)),
+                ('rows_read', models.IntegerField(db_column='RowsRead', default=0)),
+                ('rows_imported', models.IntegerField(db_column='RowsImported', default=0)),
+                ('rows_rejected', models.IntegerField(db_column='RowsRejected', default=0)),
+                ('completed', models.BooleanField(db_column='Completed', default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_column='UpdatedAt')),
+            ],
+            options={
+                'db_table': 'survey_import_progress',
+            },
+        ),
+    ]
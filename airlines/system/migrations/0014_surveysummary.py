@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0013_surveyimportprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('survey_month', models.CharField(db_column='survey_month', max_length=20)),
+                ('gender', models.CharField(db_column='gender', max_length=1)),
+                ('age_bucket', models.CharField(db_column='age_bucket', max_length=10)),
+                ('question', models.CharField(db_column='question', max_length=2)),
+                ('answer', models.IntegerField(blank=True, db_column='answer', null=True)),
+                ('count', models.IntegerField(db_column='count')),
+                ('arrival_airport', models.ForeignKey(db_column='ArrivalAirportID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='system.airports')),
+                ('departure_airport', models.ForeignKey(db_column='DepartureAirportID', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='system.airports')),
+                ('travel_class', models.ForeignKey(db_column='travel_class', on_delete=django.db.models.deletion.DO_NOTHING, to='system.cabintypes')),
+            ],
+            options={
+                'db_table': 'survey_summary',
+                'indexes': [models.Index(fields=['survey_month', 'question'], name='survey_summary_month_idx')],
+            },
+        ),
+    ]
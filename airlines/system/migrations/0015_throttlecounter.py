@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0014_surveysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_column='Key', max_length=255, unique=True)),
+                ('value', models.IntegerField(db_column='Value')),
+                ('expires_at', models.DateTimeField(db_column='ExpiresAt', db_index=True)),
+            ],
+            options={
+                'db_table': 'throttle_counters',
+            },
+        ),
+    ]
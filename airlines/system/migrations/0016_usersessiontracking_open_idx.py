@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0015_throttlecounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersessiontracking',
+            index=models.Index(condition=models.Q(('logout_time__isnull', True)), fields=['user', 'id'], name='session_open_user_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0016_usersessiontracking_open_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSessionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('login_time', models.DateTimeField()),
+                ('logout_time', models.DateTimeField(blank=True, null=True)),
+                ('duration', models.DurationField(blank=True, null=True)),
+                ('logout_reason', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'db_table': 'user_session_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usersessiontracking',
+            index=models.Index(fields=['user', 'login_time'], name='session_user_login_idx'),
+        ),
+        migrations.AddField(
+            model_name='usersessionarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='usersessionarchive',
+            index=models.Index(fields=['user', 'login_time'], name='session_archive_user_login_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0017_usersessionarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(db_column='Table', max_length=64, unique=True)),
+                ('version', models.BigIntegerField(db_column='Version', default=0)),
+            ],
+            options={
+                'db_table': 'reference_versions',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0018_referenceversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('jti', models.CharField(db_column='JTI', max_length=64, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField(db_column='ExpiresAt', db_index=True)),
+                ('created_at', models.DateTimeField(db_column='CreatedAt', db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'revoked_tokens',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserTokenRevocation',
+            fields=[
+                ('user', models.OneToOneField(db_column='UserID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='token_revocation', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('revoked_before', models.DateTimeField(db_column='RevokedBefore')),
+            ],
+            options={
+                'db_table': 'user_token_revocations',
+            },
+        ),
+    ]
@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# Users не управляется миграциями и её индексы не попадают в историческое состояние, поэтому
+# индексы и FTS-таблица создаются здесь SQL-ом, зафиксированным на момент миграции, и только там,
+# где таблица users уже есть; в тестовой базе их создаёт create_unmanaged_tables
+INDEXES = [
+    ('users_office_name_idx', ['OfficeID', 'LastName', 'FirstName']),
+    ('users_name_idx', ['LastName', 'FirstName']),
+    ('users_role_active_idx', ['RoleID', 'Active']),
+]
+
+FTS_SQL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5('
+    'FirstName, LastName, Email, content=\'users\', content_rowid=\'ID\', tokenize="unicode61 remove_diacritics 2")',
+    'CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN '
+    'INSERT INTO users_fts(rowid, FirstName, LastName, Email) '
+    'VALUES (new.ID, new.FirstName, new.LastName, new.Email); END',
+    'CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN '
+    'INSERT INTO users_fts(users_fts, rowid, FirstName, LastName, Email) '
+    'VALUES (\'delete\', old.ID, old.FirstName, old.LastName, old.Email); END',
+    'CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF FirstName, LastName, Email ON users BEGIN '
+    'INSERT INTO users_fts(users_fts, rowid, FirstName, LastName, Email) '
+    'VALUES (\'delete\', old.ID, old.FirstName, old.LastName, old.Email); '
+    'INSERT INTO users_fts(rowid, FirstName, LastName, Email) '
+    'VALUES (new.ID, new.FirstName, new.LastName, new.Email); END',
+    'INSERT INTO users_fts(users_fts) VALUES (\'rebuild\')',
+]
+
+DROP_FTS_SQL = [
+    'DROP TRIGGER IF EXISTS users_fts_ai',
+    'DROP TRIGGER IF EXISTS users_fts_ad',
+    'DROP TRIGGER IF EXISTS users_fts_au',
+    'DROP TABLE IF EXISTS users_fts',
+]
+
+
+def has_fts5(connection):
+    # Без FTS5 в сборке SQLite поиск работает по префиксам полей, как на других базах
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def existing_indexes(connection):
+    if 'users' not in connection.introspection.table_names():
+        return None
+    with connection.cursor() as cursor:
+        return connection.introspection.get_constraints(cursor, 'users')
+
+
+def create_indexes(apps, schema_editor):
+    existing = existing_indexes(schema_editor.connection)
+    if existing is None:
+        return
+    quote = schema_editor.quote_name
+    for name, columns in INDEXES:
+        if name not in existing:
+            schema_editor.execute(f'CREATE INDEX {quote(name)} ON {quote("users")} '
+                                  f'({", ".join(quote(column) for column in columns)})')
+    if has_fts5(schema_editor.connection):
+        for sql in FTS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    existing = existing_indexes(schema_editor.connection)
+    if existing is None:
+        return
+    quote = schema_editor.quote_name
+    for name, _ in INDEXES:
+        if name in existing:
+            schema_editor.execute(schema_editor.sql_delete_index % {'name': quote(name), 'table': quote('users')})
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_FTS_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0019_revokedtoken_usertokenrevocation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def collapse_sequence(apps, schema_editor):
+    # Последовательность из строки на каждого пассажира сворачивается в одну строку с последним номером,
+    # выданные раньше номера не повторяются
+    Sequence = apps.get_model('system', 'BookingReferenceSequence')
+    last = Sequence.objects.aggregate(last=Max('id'))['last'] or 0
+    Sequence.objects.all().delete()
+    Sequence.objects.create(id=1, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0020_users_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookingreferencesequence',
+            name='value',
+            field=models.BigIntegerField(db_column='Value', default=0),
+        ),
+        migrations.RunPython(collapse_sequence, migrations.RunPython.noop),
+    ]
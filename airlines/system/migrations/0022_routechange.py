@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0021_booking_reference_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(db_column='Version', unique=True)),
+                ('route_id', models.IntegerField(db_column='RouteID')),
+            ],
+            options={
+                'db_table': 'route_changes',
+            },
+        ),
+    ]
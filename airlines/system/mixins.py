@@ -0,0 +1,64 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import time_serializer
+
+
+def requested_fields(request):
+    value = request.query_params.get('fields') if request is not None else None
+    return [field for field in value.split(',') if field] if value else None
+
+
+class SparseFieldsMixin:
+    # ?fields=a,b на чтении сужает и ответ сериализатора, и список колонок в SELECT через .only()
+    def _requested_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        return requested_fields(self.request)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Опечатка в ?fields= не должна превращаться в почти пустой ответ
+        fields = self._requested_fields()
+        if fields:
+            unknown = set(fields) - set(self.get_serializer_class()().fields)
+            if unknown:
+                raise ValidationError({"detail": f"Неизвестные поля: {', '.join(sorted(unknown))}."})
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self._requested_fields()
+        if fields:
+            child = getattr(serializer, 'child', serializer)
+            for name in set(child.fields) - set(fields):
+                child.fields.pop(name)
+        # Все вьюсеты проходят через этот миксин, поэтому время serializer.data учитывается здесь
+        return time_serializer(serializer)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self._requested_fields()
+        if fields:
+            columns = self._model_columns(queryset, fields)
+            if columns is not None:
+                queryset = queryset.only(*columns)
+        return queryset
+
+    def _model_columns(self, queryset, fields):
+        # Колонки выводятся из source полей сериализатора. Если среди полей есть вычисляемые
+        # (source='*'), нужные им колонки неизвестны, и выборка не сужается
+        select_related = queryset.query.select_related
+        if select_related is True:
+            return None
+        serializer_fields = self.get_serializer_class()().fields
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        columns = set(select_related or ())
+        for name in fields:
+            field = serializer_fields.get(name)
+            if field is None:
+                continue
+            column = field.source.split('.')[0]
+            if column not in concrete:
+                return None
+            columns.add(column)
+        return columns
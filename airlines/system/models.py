@@ -76,6 +76,12 @@ class Users(AbstractBaseUser, PermissionsMixin):
     class Meta:
         managed = False
         db_table = 'users'
+        # Таблица не управляется миграциями: индексы создаёт миграция 0020, если таблица уже есть
+        indexes = [
+            models.Index(fields=['officeid', 'lastname', 'firstname'], name='users_office_name_idx'),
+            models.Index(fields=['lastname', 'firstname'], name='users_name_idx'),
+            models.Index(fields=['roleid', 'active'], name='users_role_active_idx'),
+        ]
 
     def __str__(self):
         return self.email
@@ -93,6 +99,59 @@ class UserSessionTracking(models.Model):
             self.duration = self.logout_time - self.login_time
         super(UserSessionTracking, self).save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            # Частичный индекс только по открытым сессиям: поиск текущей сессии не зависит от истории
+            models.Index(fields=['user', 'id'], condition=models.Q(logout_time__isnull=True),
+                         name='session_open_user_idx'),
+            models.Index(fields=['user', 'login_time'], name='session_user_login_idx'),
+        ]
+
+
+class UserSessionArchive(models.Model):
+    # Закрытые сессии старше горизонта архивации, переносятся командой archive_sessions
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(Users, on_delete=models.CASCADE)
+    login_time = models.DateTimeField()
+    logout_time = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
+    logout_reason = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        db_table = 'user_session_archive'
+        indexes = [
+            models.Index(fields=['user', 'login_time'], name='session_archive_user_login_idx'),
+        ]
+
+
+class ThrottleCounter(models.Model):
+    key = models.CharField(db_column='Key', max_length=255, unique=True)
+    value = models.IntegerField(db_column='Value')
+    expires_at = models.DateTimeField(db_column='ExpiresAt', db_index=True)
+
+    class Meta:
+        db_table = 'throttle_counters'
+
+
+class RevokedToken(models.Model):
+    # Отозванные токены по jti; строка живёт до истечения срока токена, потом её удаляет фоновая очистка
+    jti = models.CharField(db_column='JTI', max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_column='ExpiresAt', db_index=True)
+    created_at = models.DateTimeField(db_column='CreatedAt', default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'revoked_tokens'
+
+
+class UserTokenRevocation(models.Model):
+    # Все токены пользователя, выданные не позже revoked_before, недействительны
+    user = models.OneToOneField(Users, models.CASCADE, db_column='UserID', primary_key=True,
+                                related_name='token_revocation')
+    revoked_before = models.DateTimeField(db_column='RevokedBefore')
+
+    class Meta:
+        db_table = 'user_token_revocations'
+
 
 class Airports(models.Model):
     id = models.AutoField(db_column='ID', primary_key=True, blank=True)
@@ -113,6 +172,9 @@ class Routes(models.Model):
 
     class Meta:
         db_table = 'routes'
+        indexes = [
+            models.Index(fields=['departure_airport', 'arrival_airport'], name='routes_dep_arr_idx'),
+        ]
 
 
 class Aircrafts(models.Model):
@@ -139,6 +201,10 @@ class Schedules(models.Model):
 
     class Meta:
         db_table = 'schedules'
+        indexes = [
+            # Покрывающий индекс для поиска рейсов: маршрут + дата, сортировка по времени
+            models.Index(fields=['route', 'date', 'time'], name='schedules_route_date_time_idx'),
+        ]
 
 
 class CabinTypes(models.Model):
@@ -165,6 +231,32 @@ class Tickets(models.Model):
 
     class Meta:
         db_table = 'tickets'
+        constraints = [
+            # Номер общий для билетов туда и обратно, но на одном рейсе не повторяется.
+            # Индекс начинается с BookingReference и обслуживает точный поиск по номеру.
+            models.UniqueConstraint(fields=['booking_reference', 'scheduleid'], name='tickets_booking_reference_uniq'),
+        ]
+
+
+class BookingReferenceSequence(models.Model):
+    # Одна строка-счётчик: value — последний выданный номер
+    id = models.AutoField(db_column='ID', primary_key=True)
+    value = models.BigIntegerField(db_column='Value', default=0)
+
+    class Meta:
+        db_table = 'booking_reference_sequence'
+
+
+class SeatAvailability(models.Model):
+    schedule = models.ForeignKey(Schedules, models.DO_NOTHING, db_column='ScheduleID', related_name='seat_availability')
+    cabin_type = models.ForeignKey(CabinTypes, models.DO_NOTHING, db_column='CabinTypeID')
+    remaining = models.IntegerField(db_column='Remaining')
+
+    class Meta:
+        db_table = 'seat_availability'
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'cabin_type'], name='seat_availability_schedule_cabin_uniq'),
+        ]
 
 
 class Surveys0(models.Model):
@@ -184,6 +276,37 @@ class Surveys0(models.Model):
         db_table = 'surveys0'
 
 
+class SurveySummary(models.Model):
+    survey_month = models.CharField(db_column='survey_month', max_length=20)
+    gender = models.CharField(db_column='gender', max_length=1)
+    age_bucket = models.CharField(db_column='age_bucket', max_length=10)
+    travel_class = models.ForeignKey(CabinTypes, models.DO_NOTHING, db_column='travel_class')
+    departure_airport = models.ForeignKey(Airports, models.DO_NOTHING, db_column='DepartureAirportID', related_name='+')
+    arrival_airport = models.ForeignKey(Airports, models.DO_NOTHING, db_column='ArrivalAirportID', related_name='+')
+    question = models.CharField(db_column='question', max_length=2)
+    answer = models.IntegerField(db_column='answer', blank=True, null=True)
+    count = models.IntegerField(db_column='count')
+
+    class Meta:
+        db_table = 'survey_summary'
+        indexes = [
+            models.Index(fields=['survey_month', 'question'], name='survey_summary_month_idx'),
+        ]
+
+
+class SurveyImportProgress(models.Model):
+    file_path = models.TextField(db_column='FilePath', unique=True)
+    survey_month = models.CharField(db_column='SurveyMonth', max_length=20)
+    rows_read = models.IntegerField(db_column='RowsRead', default=0)
+    rows_imported = models.IntegerField(db_column='RowsImported', default=0)
+    rows_rejected = models.IntegerField(db_column='RowsRejected', default=0)
+    completed = models.BooleanField(db_column='Completed', default=False)
+    updated_at = models.DateTimeField(db_column='UpdatedAt', auto_now=True)
+
+    class Meta:
+        db_table = 'survey_import_progress'
+
+
 class Amenities(models.Model):
     id = models.AutoField(db_column='ID', primary_key=True)
     service = models.TextField(db_column='Service')
@@ -209,4 +332,23 @@ class AmenitiesTickets(models.Model):
     price = models.DecimalField(db_column='Price', max_digits=10, decimal_places=2)
 
     class Meta:
-        db_table = 'amenities_tickets'
\ No newline at end of file
+        db_table = 'amenities_tickets'
+
+
+class ReferenceVersion(models.Model):
+    # Версия справочной таблицы: увеличивается при каждом изменении, входит в ETag и ключ кеша
+    table = models.CharField(db_column='Table', max_length=64, unique=True)
+    version = models.BigIntegerField(db_column='Version', default=0)
+
+    class Meta:
+        db_table = 'reference_versions'
+
+
+class RouteChange(models.Model):
+    # Журнал правок маршрутов: версия таблицы routes после правки и изменённый маршрут.
+    # По нему воркеры доводят граф маршрутов до текущей версии, не перечитывая всю таблицу
+    version = models.BigIntegerField(db_column='Version', unique=True)
+    route_id = models.IntegerField(db_column='RouteID')
+
+    class Meta:
+        db_table = 'route_changes'
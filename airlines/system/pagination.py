@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class OptionalLimitOffsetPagination(LimitOffsetPagination):
+    # Пагинация включается параметром ?limit=, без него ответ остаётся прежним списком
+    default_limit = None
+    max_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if hasattr(queryset, 'ordered') and not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return super().paginate_queryset(queryset, request, view)
+
+
+class SessionCursorPagination(CursorPagination):
+    # Keyset-пагинация по login_time: страница читается по индексу (user, login_time) без OFFSET
+    ordering = '-login_time'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class DirectoryPagination(LimitOffsetPagination):
+    # Поиск по справочнику сотрудников всегда постраничный, порядок задаёт сам запрос
+    default_limit = 50
+    max_limit = 200
@@ -0,0 +1,80 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .metrics import TimedJSONRenderer
+from .models import Countries, Airports, Aircrafts, Offices, Amenities, Routes, ReferenceVersion
+
+REFERENCE_MODELS = (Countries, Airports, Aircrafts, Offices, Amenities, Routes)
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def table_version(model):
+    return ReferenceVersion.objects.filter(table=model._meta.db_table).values_list('version', flat=True).first() or 0
+
+
+def bump_version(model):
+    table = model._meta.db_table
+    if not ReferenceVersion.objects.filter(table=table).update(version=F('version') + 1):
+        ReferenceVersion.objects.get_or_create(table=table)
+        ReferenceVersion.objects.filter(table=table).update(version=F('version') + 1)
+
+
+def reference_changed(sender, **kwargs):
+    bump_version(sender)
+
+
+# Версия поднимается только у изменённой таблицы; bulk-операции сигналов не шлют
+for model in REFERENCE_MODELS:
+    post_save.connect(reference_changed, sender=model, dispatch_uid=f'reference_saved_{model.__name__}')
+    post_delete.connect(reference_changed, sender=model, dispatch_uid=f'reference_deleted_{model.__name__}')
+
+
+class CachedJSONRenderer(TimedJSONRenderer):
+    # Тело из кеша уже отрендерено: байты отдаются как есть, остальные данные рендерятся обычно
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+def etag_matches(etag, header):
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x", * — с любым тегом
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in parse_etags(header))
+
+
+class ReferenceCacheMixin:
+    # Список справочника отдаётся готовыми JSON-байтами из кеша; клиент с актуальным ETag получает 304.
+    # Версия таблицы хранится в базе, поэтому изменения через любой воркер видны всем
+    def get_renderers(self):
+        return [CachedJSONRenderer() if isinstance(renderer, JSONRenderer) else renderer
+                for renderer in super().get_renderers()]
+
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:12]
+        version = table_version(model)
+        etag = f'"{model._meta.db_table}-{version}-{query}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag_matches(etag, request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f'reference:{model._meta.db_table}:{version}:{query}'
+        body = cache.get(key)
+        if body is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = CachedJSONRenderer().render(response.data)
+            cache.set(key, body, CACHE_TIMEOUT)
+        # Браузерный API и другие рендереры получают данные, а не байты
+        data = body if isinstance(request.accepted_renderer, JSONRenderer) else json.loads(body)
+        return Response(data, headers=headers)
@@ -0,0 +1,164 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken, UserTokenRevocation
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    # k позиций из одного blake2b двойным хешированием; ложноположительные ответы возможны
+    # с вероятностью error_rate при заполнении до capacity, ложноотрицательные — нет
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class TokenRevocationStore:
+    # Проверка jti: фильтр Блума в памяти отвечает «точно не отозван» без запросов к базе,
+    # только его срабатывания подтверждаются по первичному ключу revoked_tokens.
+    # Фоновый поток раз в SYNC_INTERVAL подтягивает отзывы и блокировки из других процессов
+    # и раз в PRUNE_INTERVAL удаляет истёкшие строки и пересобирает фильтр
+    def __init__(self):
+        self._filter = None
+        self._synced_at = None
+        self._pruned_at = 0.0
+        self._load_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _config(self):
+        return {'BACKGROUND': True, 'SYNC_INTERVAL': 5, 'PRUNE_INTERVAL': 3600, 'CAPACITY': 100000,
+                'ERROR_RATE': 0.001, **getattr(settings, 'TOKEN_REVOCATION', {})}
+
+    def _bloom(self):
+        if self._filter is None:
+            with self._load_lock:
+                if self._filter is None:
+                    self.rebuild()
+            if self._config()['BACKGROUND']:
+                self._ensure_thread()
+        return self._filter
+
+    def is_revoked(self, jti):
+        if jti not in self._bloom():
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        self._bloom().add(jti)
+
+    def rebuild(self):
+        config = self._config()
+        started = timezone.now()
+        live = RevokedToken.objects.filter(expires_at__gt=started)
+        bloom = BloomFilter(max(config['CAPACITY'], live.count() * 2), config['ERROR_RATE'])
+        for jti in live.values_list('jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self._filter, self._synced_at = bloom, started
+
+    def sync(self):
+        # Запас в один интервал: строки с отстающими часами другого процесса не пропускаются
+        started = timezone.now()
+        since = self._synced_at - timedelta(seconds=self._config()['SYNC_INTERVAL'])
+        bloom = self._filter
+        for jti in RevokedToken.objects.filter(created_at__gte=since).values_list('jti', flat=True):
+            bloom.add(jti)
+        # Пользователи, заблокированные в других процессах: их закэшированное здесь состояние сбрасывается.
+        # Импорт внутри метода: authentication сам импортирует этот модуль
+        from .authentication import invalidate_user_state
+
+        user_ids = list(UserTokenRevocation.objects.filter(revoked_before__gte=since).values_list('user_id', flat=True))
+        if user_ids:
+            invalidate_user_state(*user_ids)
+        self._synced_at = started
+
+    def prune(self):
+        deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        if deleted:
+            self.rebuild()
+        self._pruned_at = time.monotonic()
+        return deleted
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._pruned_at = time.monotonic()
+                self._thread = threading.Thread(target=self._run, name='token-revocation-sync', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self._config()['SYNC_INTERVAL']):
+                try:
+                    if time.monotonic() - self._pruned_at >= self._config()['PRUNE_INTERVAL']:
+                        self.prune()
+                    else:
+                        self.sync()
+                except DatabaseError:
+                    logger.exception('token revocation sync failed')
+                    connection.close()
+        finally:
+            connection.close()
+
+    def reset(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._filter = self._synced_at = None
+
+
+token_revocations = TokenRevocationStore()
+
+
+def revoke_token(token):
+    expires_at = datetime.fromtimestamp(token['exp'], dt_timezone.utc)
+    token_revocations.revoke(token[api_settings.JTI_CLAIM], expires_at)
+
+
+def revoke_user_tokens(*user_ids):
+    # Одна строка на пользователя: проверка идёт по iat токена, перебирать выданные токены не нужно
+    now = timezone.now()
+    UserTokenRevocation.objects.bulk_create(
+        [UserTokenRevocation(user_id=user_id, revoked_before=now) for user_id in user_ids],
+        update_conflicts=True, unique_fields=['user'], update_fields=['revoked_before'])
+
+
+def check_not_revoked(token, revoked_before):
+    if revoked_before is not None and token['iat'] <= revoked_before.timestamp():
+        raise AuthenticationFailed('Токен отозван', code='token_revoked')
+    if token_revocations.is_revoked(token[api_settings.JTI_CLAIM]):
+        raise AuthenticationFailed('Токен отозван', code='token_revoked')
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from .models import Routes, Schedules
+
+NEARBY_DAYS = 3
+
+
+def route_ids_subquery(departure_airport, arrival_airport):
+    # Пара (вылет, прилёт) разрешается в id маршрутов по индексу routes_dep_arr_idx
+    return Routes.objects.filter(
+        departure_airport=departure_airport,
+        arrival_airport=arrival_airport,
+    ).values('id')
+
+
+def schedules_queryset():
+    # Маршрут, аэропорты и самолёт подтягиваются одним JOIN, без запроса на каждую строку
+    return Schedules.objects.select_related('route__departure_airport', 'route__arrival_airport', 'aircraft')
+
+
+def search_queryset(departure_airport, arrival_airport, selected_date, include_nearby_days=False):
+    # Один запрос: подзапрос по маршрутам + диапазон по индексу schedules(RouteID, Date, Time)
+    schedules = schedules_queryset().filter(route__in=route_ids_subquery(departure_airport, arrival_airport))
+
+    if include_nearby_days:
+        schedules = schedules.filter(date__range=(selected_date - timedelta(days=NEARBY_DAYS),
+                                                  selected_date + timedelta(days=NEARBY_DAYS)))
+    else:
+        schedules = schedules.filter(date=selected_date)
+
+    return schedules.order_by('date', 'time')
+
+
+def search_schedules(departure_airport, arrival_airport, selected_date, include_nearby_days=False):
+    return list(search_queryset(departure_airport, arrival_airport, selected_date, include_nearby_days))
+
+
+async def asearch_schedules(departure_airport, arrival_airport, selected_date, include_nearby_days=False):
+    return [schedule async for schedule in
+            search_queryset(departure_airport, arrival_airport, selected_date, include_nearby_days)]
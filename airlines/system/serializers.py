@@ -1,42 +1,68 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import serializers
-from .models import Users, Offices, UserSessionTracking, Schedules, Aircrafts, Airports, Routes, Tickets, Countries, \
-    Surveys0, CabinTypes, Amenities, AmenitiesTickets
-from django.core.cache import cache
+from .models import Users, Offices, UserSessionTracking, UserSessionArchive, Schedules, Aircrafts, Airports, Routes, \
+    Tickets, Countries, Surveys0, CabinTypes, Amenities, AmenitiesTickets
+from .authentication import add_user_claims, get_user_state
+from .availability import seats_for
+from .revocation import check_not_revoked, revoke_token
+from .throttle import get_login_throttle
 from rest_framework import status
 from rest_framework import serializers
 from .models import Users, Offices
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
     def validate(self, attrs):
         email = attrs['email']
-        cache_key = f"login_attempts_{email}"
-        attempts = cache.get(cache_key, 0)
-
-        if attempts >= 3:
-            raise serializers.ValidationError('Повторите позже.')
+        throttle = get_login_throttle()
 
         try:
-            user = Users.objects.get(email=email)
+            user = Users.objects.select_related('officeid').get(email=email)
 
             if not user.is_active:
                 raise serializers.ValidationError('Пользователь заблокирован.')
 
             if not user.check_password(attrs['password']):
-                attempts += 1
-                cache.set(cache_key, attempts, timeout=10)
+                throttle.register_failure(email)
                 raise serializers.ValidationError('Неверный пароль.')
 
-            cache.delete(cache_key)
-            return super().validate(attrs)
+            throttle.reset(email)
+            # Пароль уже проверен: super().validate() вызвал бы authenticate() и посчитал хеш второй раз
+            self.user = user
+            refresh = self.get_token(user)
+            return {'refresh': str(refresh), 'access': str(refresh.access_token)}
 
         except Users.DoesNotExist:
-            attempts += 1
-            cache.set(cache_key, attempts, timeout=10)
+            throttle.register_failure(email)
             raise serializers.ValidationError('Неверный логин.')
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    # Отозванный refresh-токен не обновляется, после ротации старый токен отзывается
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        state = get_user_state(refresh.get(api_settings.USER_ID_CLAIM))
+        if state is None or state[0] != 1:
+            raise AuthenticationFailed('Пользователь не найден или заблокирован', code='user_inactive')
+        check_not_revoked(refresh, state[-1])
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                revoke_token(refresh)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
 class UsersSerializer(serializers.ModelSerializer):
     office_name = serializers.CharField(source='officeid.title', read_only=True)
 
@@ -54,7 +80,13 @@ class OfficesSerializer(serializers.ModelSerializer):
 class UserSessionTrackingSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserSessionTracking
-        fields = ['login_time', 'logout_time', 'duration', 'logout_reason']
+        fields = ['id', 'login_time', 'logout_time', 'duration', 'logout_reason']
+
+
+class UserSessionArchiveSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserSessionArchive
+        fields = ['id', 'login_time', 'logout_time', 'duration', 'logout_reason']
 
 
 class AirportsSerializer(serializers.ModelSerializer):
@@ -69,12 +101,38 @@ class AircraftsSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class PrebuiltNestedField(serializers.Field):
+    # Вложенный объект сериализуется один раз на каждый pk, дальше берётся из кэша в контексте
+    def __init__(self, serializer_class, **kwargs):
+        kwargs['read_only'] = True
+        self.serializer_class = serializer_class
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        cache = self.context.setdefault('_nested_cache', {})
+        key = (self.serializer_class, value.pk)
+        if key not in cache:
+            cache[key] = self.serializer_class(value, context=self.context).data
+        return cache[key]
+
+
+class SchedulesListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Остаток мест по всем рейсам списка читается одним запросом. Async-вьюхи читают его сами
+        # и передают в контексте: из event loop синхронный ORM вызывать нельзя
+        schedules = list(data.all() if hasattr(data, 'all') else data)
+        if 'seat_availability' not in self.context:
+            self.context['seat_availability'] = seats_for(schedule.id for schedule in schedules)
+        return super().to_representation(schedules)
+
+
 class SchedulesSerializer(serializers.ModelSerializer):
     business_price = serializers.SerializerMethodField()
     first_class_price = serializers.SerializerMethodField()
-    from_airport = AirportsSerializer(source='route.departure_airport', read_only=True)
-    to_airport = AirportsSerializer(source='route.arrival_airport', read_only=True)
-    aircraft = AircraftsSerializer(read_only=True)
+    available_seats = serializers.SerializerMethodField()
+    from_airport = PrebuiltNestedField(AirportsSerializer, source='route.departure_airport')
+    to_airport = PrebuiltNestedField(AirportsSerializer, source='route.arrival_airport')
+    aircraft = PrebuiltNestedField(AircraftsSerializer)
 
     aircraft_id = serializers.PrimaryKeyRelatedField(queryset=Aircrafts.objects.all(), source='aircraft',
                                                      write_only=True)
@@ -82,6 +140,7 @@ class SchedulesSerializer(serializers.ModelSerializer):
     class Meta:
         model = Schedules
         fields = '__all__'
+        list_serializer_class = SchedulesListSerializer
 
     def get_business_price(self, obj):
         return int(float(obj.economy_price) * 1.35)
@@ -90,6 +149,12 @@ class SchedulesSerializer(serializers.ModelSerializer):
         business_price = self.get_business_price(obj)
         return int(business_price * 1.30)
 
+    def get_available_seats(self, obj):
+        seats = self.context.get('seat_availability')
+        if seats is None or obj.id not in seats:
+            seats = seats_for([obj.id])
+        return seats.get(obj.id, {})
+
 
 class RoutesSerializer(serializers.ModelSerializer):
     class Meta:
@@ -109,17 +174,20 @@ class CountriesSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class TicketCreateSerializer(serializers.ModelSerializer):
+class PassengerSerializer(serializers.ModelSerializer):
+    # Страна паспорта приходит названием и разрешается во вьюхе одним запросом на всю группу
+    passport_country = serializers.CharField()
+
     class Meta:
         model = Tickets
-        fields = ['scheduleid', 'cabintypeid', 'first_name', 'last_name', 'email', 'phone', 'passport_number',
-                  'passport_country', 'booking_reference', 'confirmed']
+        fields = ['first_name', 'last_name', 'email', 'phone', 'passport_number', 'passport_country']
 
-    def create(self, validated_data):
-        user = self.context['request'].user
-        validated_data['userid'] = user
 
-        return super().create(validated_data)
+class FlightSelectionSerializer(serializers.ModelSerializer):
+    # Рейс и класс проверяются до бронирования мест и отдают те же ошибки полей, что и билет
+    class Meta:
+        model = Tickets
+        fields = ['scheduleid', 'cabintypeid']
 
 
 class CabinTypesSerializer(serializers.ModelSerializer):
@@ -0,0 +1,221 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import UserSessionTracking, UserSessionArchive
+
+LOGIN = 'login'
+LOGOUT = 'logout'
+
+TOKEN_EXPIRED = 'Токен устарел'
+SERVER_ERROR = 'Ошибка на стороне сервера'
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+MAX_ATTEMPTS = 5
+
+PERIODS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class SessionEventWriter:
+    # События сессий копятся в очереди процесса и пишутся пачками в фоновом потоке,
+    # поэтому запрос не ждёт записи в user_session_tracking
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Пачка, которую не удалось записать, и число неудачных попыток подряд
+        self._pending = []
+        self._failures = 0
+
+    def _config(self):
+        return {'ASYNC': True, 'BATCH_SIZE': BATCH_SIZE, 'FLUSH_INTERVAL': FLUSH_INTERVAL,
+                **getattr(settings, 'SESSION_TRACKING', {})}
+
+    def login(self, user_id):
+        self._put((LOGIN, user_id, timezone.now(), None))
+
+    def logout(self, user_id, reason=None):
+        self._put((LOGOUT, user_id, timezone.now(), reason))
+
+    def _put(self, event):
+        self._queue.put(event)
+        if self._config()['ASYNC']:
+            self._ensure_thread()
+        else:
+            self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='session-event-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            # После ошибки записи пауза удваивается, чтобы занятая база (database is locked) успела освободиться
+            while not self._stop.wait(self._config()['FLUSH_INTERVAL'] * 2 ** self._failures):
+                try:
+                    self.flush()
+                except DatabaseError:
+                    logger.warning('session events flush failed', exc_info=True)
+                    connection.close()
+        finally:
+            connection.close()
+
+    def stop(self):
+        # Вызывается при завершении процесса: поток останавливается, остаток очереди дописывается
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                self.flush()
+                return
+            except DatabaseError:
+                if not self._pending:
+                    return
+                connection.close()
+                time.sleep(self._config()['FLUSH_INTERVAL'])
+
+    def flush(self):
+        with self._flush_lock:
+            batch_size = self._config()['BATCH_SIZE']
+            while True:
+                # Неудавшаяся пачка пишется первой, порядок событий сохраняется
+                events = self._pending or self._drain(batch_size)
+                if not events:
+                    return
+                try:
+                    self._write(events)
+                except DatabaseError:
+                    self._failures += 1
+                    if self._failures < MAX_ATTEMPTS:
+                        self._pending = events
+                    else:
+                        logger.exception('session events batch lost', extra={'events': len(events)})
+                        self._pending, self._failures = [], 0
+                    raise
+                self._pending, self._failures = [], 0
+
+    def _drain(self, limit):
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    @staticmethod
+    def _write(events):
+        # Для пользователей из пачки одним запросом берутся последние открытые сессии,
+        # дальше события применяются в памяти в порядке поступления
+        user_ids = {event[1] for event in events}
+        last_ids = UserSessionTracking.objects.filter(user_id__in=user_ids, logout_time__isnull=True).values(
+            'user_id').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+        open_sessions = {session.user_id: session for session in UserSessionTracking.objects.filter(id__in=last_ids)}
+
+        created, updated = [], {}
+        for kind, user_id, at, reason in events:
+            session = open_sessions.pop(user_id, None)
+            if session is not None:
+                session.logout_time = at
+                session.duration = at - session.login_time
+                session.logout_reason = TOKEN_EXPIRED if kind == LOGIN else reason
+                if session.pk is not None:
+                    updated[session.pk] = session
+            if kind == LOGIN:
+                open_sessions[user_id] = UserSessionTracking(user_id=user_id, login_time=at)
+                created.append(open_sessions[user_id])
+
+        with transaction.atomic():
+            UserSessionTracking.objects.bulk_update(updated.values(), ['logout_time', 'duration', 'logout_reason'])
+            UserSessionTracking.objects.bulk_create(created)
+
+
+session_events = SessionEventWriter()
+atexit.register(session_events.stop)
+
+
+def session_summary(user_id, period):
+    # Время в системе и число сбоев по периодам: GROUP BY по горячей таблице и архиву
+    totals = defaultdict(lambda: {'sessions': 0, 'crashes': 0, 'seconds': 0})
+    for model in (UserSessionTracking, UserSessionArchive):
+        rows = model.objects.filter(user_id=user_id).annotate(start=PERIODS[period]('login_time')).values(
+            'start').annotate(sessions=Count('id'), crashes=Count('id', filter=Q(logout_reason=SERVER_ERROR)),
+                              online=Sum('duration')).order_by()
+        for row in rows:
+            item = totals[row['start'].date()]
+            item['sessions'] += row['sessions']
+            item['crashes'] += row['crashes']
+            item['seconds'] += int(row['online'].total_seconds()) if row['online'] else 0
+
+    periods = [{'start': start, **item} for start, item in sorted(totals.items(), reverse=True)]
+    return {
+        'period': period,
+        'sessions': sum(item['sessions'] for item in periods),
+        'crashes': sum(item['crashes'] for item in periods),
+        'seconds': sum(item['seconds'] for item in periods),
+        'periods': periods,
+    }
+
+
+def archive_sessions(before, batch_size=ARCHIVE_BATCH_SIZE):
+    # Закрытые сессии старше before переносятся в архив пачками, каждая в своей транзакции.
+    # Открытые сессии остаются в горячей таблице, чтобы их мог закрыть выход пользователя
+    archived = 0
+    sessions = UserSessionTracking.objects.filter(login_time__lt=before, logout_time__isnull=False).order_by('id')
+    while True:
+        with transaction.atomic():
+            batch = list(sessions[:batch_size])
+            if not batch:
+                return archived
+            UserSessionArchive.objects.bulk_create([
+                UserSessionArchive(id=session.id, user_id=session.user_id, login_time=session.login_time,
+                                   logout_time=session.logout_time, duration=session.duration,
+                                   logout_reason=session.logout_reason) for session in batch
+            ], ignore_conflicts=True)
+            UserSessionTracking.objects.filter(id__in=[session.id for session in batch]).delete()
+        archived += len(batch)
+
+
+def close_stale_sessions(batch_size=ARCHIVE_BATCH_SIZE):
+    # Раньше повторный вход только помечал прошлую сессию причиной, не закрывая её.
+    # Такие сессии закрываются временем следующего входа, открытой остаётся одна на пользователя
+    closed = 0
+    stale = []
+    previous = None
+    sessions = UserSessionTracking.objects.order_by('user_id', 'id').only(
+        'user_id', 'login_time', 'logout_time', 'logout_reason')
+    for session in sessions.iterator(chunk_size=batch_size):
+        if previous is not None and previous.user_id == session.user_id and previous.logout_time is None:
+            previous.logout_time = session.login_time
+            previous.duration = session.login_time - previous.login_time
+            previous.logout_reason = previous.logout_reason or TOKEN_EXPIRED
+            stale.append(previous)
+            if len(stale) >= batch_size:
+                UserSessionTracking.objects.bulk_update(stale, ['logout_time', 'duration', 'logout_reason'])
+                closed += len(stale)
+                stale = []
+        previous = session
+    UserSessionTracking.objects.bulk_update(stale, ['logout_time', 'duration', 'logout_reason'])
+    return closed + len(stale)
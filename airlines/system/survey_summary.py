@@ -0,0 +1,116 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, When, Value, Count, Sum, F
+
+from .models import Surveys0, SurveySummary
+from .surveys import FIELDS
+
+QUESTIONS = ('q1', 'q2', 'q3', 'q4')
+
+# Те же возрастные группы, что и в отчёте об удовлетворённости на фронтенде
+AGE_BUCKETS = ((18, 24, '18-24'), (25, 39, '25-39'), (40, 59, '40-59'), (60, None, '60+'))
+UNKNOWN_AGE = 'unknown'
+
+DIMENSIONS = ('survey_month', 'gender', 'age_bucket', 'travel_class', 'departure_airport', 'arrival_airport')
+# Измерения-ссылки фильтруются по числовому id
+ID_DIMENSIONS = ('travel_class', 'departure_airport', 'arrival_airport')
+KEY_FIELDS = ('survey_month', 'gender', 'age_bucket', 'travel_class_id', 'departure_airport_id',
+              'arrival_airport_id', 'question', 'answer')
+
+BATCH_SIZE = 1000
+
+
+def age_bucket(age):
+    if age is not None:
+        for low, high, label in AGE_BUCKETS:
+            if age >= low and (high is None or age <= high):
+                return label
+    return UNKNOWN_AGE
+
+
+def age_bucket_expression():
+    whens = [When(age__gte=low, age__lte=high, then=Value(label)) if high is not None
+             else When(age__gte=low, then=Value(label)) for low, high, label in AGE_BUCKETS]
+    return Case(*whens, default=Value(UNKNOWN_AGE))
+
+
+class SummaryWriter:
+    # Инкрементальное обновление куба при импорте: пачка прибавляет к строкам куба свои приращения
+    # (count = count + n) и не пишет итог, поэтому параллельные импорты не затирают счётчики друг друга.
+    # Если два импорта одновременно заведут одну и ту же строку, ключ задвоится — summarize суммирует
+    # count по ключу, и ответ от этого не меняется
+    def add(self, survey_month, rows):
+        counts = Counter()
+        for values in rows:
+            survey = dict(zip(FIELDS, values))
+            dims = (survey_month, survey['gender'], age_bucket(survey['age']), survey['travel_class_id'],
+                    survey['departure_airport_id'], survey['arrival_airport_id'])
+            for question in QUESTIONS:
+                counts[dims + (question, survey[question])] += 1
+
+        # Строки куба ищутся заново в каждой пачке: id из прошлых пачек могли исчезнуть при rebuild
+        existing = SurveySummary.objects.filter(
+            survey_month=survey_month, departure_airport_id__in={key[4] for key in counts},
+            arrival_airport_id__in={key[5] for key in counts}).values_list('id', *KEY_FIELDS)
+        ids_by_delta = defaultdict(list)
+        for row_id, *key in existing:
+            delta = counts.pop(tuple(key), None)
+            if delta is not None:
+                ids_by_delta[delta].append(row_id)
+
+        # Приращения малы и часто совпадают, поэтому строки с одинаковым приращением обновляются одним запросом
+        for delta, ids in ids_by_delta.items():
+            for start in range(0, len(ids), BATCH_SIZE):
+                SurveySummary.objects.filter(id__in=ids[start:start + BATCH_SIZE]).update(count=F('count') + delta)
+        SurveySummary.objects.bulk_create([SurveySummary(**dict(zip(KEY_FIELDS, key)), count=count)
+                                           for key, count in counts.items()], batch_size=BATCH_SIZE)
+
+
+def rebuild_summary():
+    # Полный пересчёт куба из surveys0: по одному GROUP BY на вопрос. Куб заменяется целиком,
+    # поэтому пересчёт запускается, когда импорт не идёт
+    with transaction.atomic():
+        SurveySummary.objects.all().delete()
+        surveys = Surveys0.objects.annotate(age_bucket=age_bucket_expression())
+        created = 0
+        for question in QUESTIONS:
+            groups = surveys.values(*DIMENSIONS, answer=F(question)).annotate(count=Count('id')).order_by()
+            rows = [SurveySummary(survey_month=group['survey_month'], gender=group['gender'],
+                                  age_bucket=group['age_bucket'], travel_class_id=group['travel_class'],
+                                  departure_airport_id=group['departure_airport'],
+                                  arrival_airport_id=group['arrival_airport'], question=question,
+                                  answer=group['answer'], count=group['count']) for group in groups]
+            SurveySummary.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            created += len(rows)
+    return created
+
+
+def summarize(group_by, filters):
+    # Ответ собирается из куба: сырые строки surveys0 не читаются
+    groups = defaultdict(lambda: {question: {'answered': 0, 'total': 0, 'sum': 0, 'distribution': {}}
+                                  for question in QUESTIONS})
+    rows = SurveySummary.objects.filter(**filters).values(*group_by, 'question', 'answer').annotate(
+        total=Sum('count')).order_by(*group_by)
+    for row in rows:
+        key = tuple(row[dimension] for dimension in group_by)
+        stats = groups[key][row['question']]
+        stats['total'] += row['total']
+        if row['answer'] is not None:
+            stats['answered'] += row['total']
+            stats['sum'] += row['answer'] * row['total']
+            stats['distribution'][row['answer']] = row['total']
+
+    result = []
+    for key, questions in groups.items():
+        item = dict(zip(group_by, key))
+        item['count'] = questions[QUESTIONS[0]]['total']
+        item['questions'] = {
+            question: {
+                'mean': round(stats['sum'] / stats['answered'], 2) if stats['answered'] else None,
+                'unanswered': stats['total'] - stats['answered'],
+                'distribution': dict(sorted(stats['distribution'].items())),
+            } for question, stats in questions.items()
+        }
+        result.append(item)
+    return result
@@ -0,0 +1,96 @@
+import csv
+import glob
+import os
+import re
+from itertools import islice
+
+# Модуль не импортирует Django: функции разбора выполняются в дочерних процессах пула,
+# которым база не нужна. Всё, что пишет в базу, остаётся в команде import_surveys.
+
+BATCH_SIZE = 5000
+
+FIELDS = ('departure_airport_id', 'arrival_airport_id', 'age', 'gender', 'travel_class_id', 'q1', 'q2', 'q3', 'q4')
+
+BATCH = 'batch'
+DONE = 'done'
+ERROR = 'error'
+
+
+def month_from_filename(file_path):
+    # survey_07.csv -> '7', как месяц хранится в surveys0.survey_month
+    match = re.search(r'survey_(\d{1,2})\.csv$', str(file_path))
+    return str(int(match.group(1))) if match else None
+
+
+def collect_files(paths):
+    # Принимает файлы, каталоги (берутся все *.csv) и glob-шаблоны
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.csv'))))
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(os.path.abspath(file) for file in files))
+
+
+def _int_or_none(value):
+    return int(value) if value.isdigit() else None
+
+
+def parse_row(row, airport_ids, cabin_ids):
+    # Возвращает кортеж значений в порядке FIELDS или None, если строку нужно отбросить
+    if len(row) < 9:
+        return None
+    departure_airport = _int_or_none(row[0])
+    arrival_airport = _int_or_none(row[1])
+    travel_class = _int_or_none(row[4])
+    if departure_airport not in airport_ids or arrival_airport not in airport_ids or travel_class not in cabin_ids:
+        return None
+    return (departure_airport, arrival_airport, _int_or_none(row[2]), row[3] or 'M', travel_class,
+            _int_or_none(row[5]), _int_or_none(row[6]), _int_or_none(row[7]), _int_or_none(row[8]))
+
+
+def read_batches(file_path, airport_ids, cabin_ids, batch_size=BATCH_SIZE, skip_rows=0):
+    # Файл читается потоком: в памяти не больше одной пачки строк.
+    # Отдаёт тройки (разобранные строки, число отброшенных строк, число прочитанных строк)
+    with open(file_path, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)
+        for _ in islice(reader, skip_rows):
+            pass
+        while True:
+            rows = list(islice(reader, batch_size))
+            if not rows:
+                return
+            parsed = [parse_row(row, airport_ids, cabin_ids) for row in rows]
+            valid = [values for values in parsed if values is not None]
+            yield valid, len(rows) - len(valid), len(rows)
+
+
+def file_messages(file_path, skip_rows, airport_ids, cabin_ids, batch_size):
+    try:
+        for batch in read_batches(file_path, airport_ids, cabin_ids, batch_size, skip_rows):
+            yield BATCH, file_path, batch
+        yield DONE, file_path, None
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        yield ERROR, file_path, str(e)
+
+
+_worker_state = {}
+
+
+def init_worker(queue, airport_ids, cabin_ids, batch_size):
+    _worker_state.update(queue=queue, airport_ids=airport_ids, cabin_ids=cabin_ids, batch_size=batch_size)
+
+
+def parse_file(file_path, skip_rows):
+    # Выполняется в процессе пула: пачки уходят в очередь единственному писателю
+    state = _worker_state
+    try:
+        for message in file_messages(file_path, skip_rows, state['airport_ids'], state['cabin_ids'],
+                                     state['batch_size']):
+            state['queue'].put(message)
+    except Exception as e:
+        state['queue'].put((ERROR, file_path, str(e)))
@@ -0,0 +1,46 @@
+import logging
+
+from django.apps import apps
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+from .directory import create_search_index
+from .revocation import token_revocations
+
+
+def create_unmanaged_tables(connection):
+    # Таблицы countries, offices, roles и users не управляются миграциями,
+    # поэтому в тестовой базе их нужно создать вручную
+    unmanaged = [model for model in apps.get_app_config('system').get_models() if not model._meta.managed]
+    with connection.schema_editor() as editor:
+        for model in unmanaged:
+            editor.create_model(model)
+            # Индексы из Meta неуправляемых моделей create_model пропускает
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+    create_search_index(connection)
+
+
+class UnmanagedModelsTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # JSON-логи приложения не перемешиваются с выводом unittest; с -v 2 и выше они остаются
+        logger = logging.getLogger('system')
+        self._log_handlers = logger.handlers
+        if self.verbosity < 2:
+            logger.handlers = [logging.NullHandler()]
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger('system').handlers = self._log_handlers
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        for alias in connections:
+            create_unmanaged_tables(connections[alias])
+        return old_config
+
+    def teardown_databases(self, old_config, **kwargs):
+        # Фоновая синхронизация отзывов не должна обращаться к уже удалённой базе
+        token_revocations.reset()
+        super().teardown_databases(old_config, **kwargs)
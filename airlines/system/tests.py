@@ -1,3 +1,1217 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+import functools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count, Max, Sum
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .analytics import survey_columns
+from .authentication import ClaimsJWTAuthentication, get_user_state
+from .benchmark import SCALES, Workload, run_scenario, seed
+from .hashers import PBKDF2PasswordHasher
+from .log import AsyncJsonHandler, SamplingFilter
+from .metrics import registry
+from .reference_cache import bump_version, table_version
+from .booking import encode_booking_reference
+from .itineraries import RouteGraph, route_graph
+from .models import Countries, Airports, Routes, Aircrafts, Schedules, Roles, Users, CabinTypes, Tickets, \
+    SeatAvailability, Surveys0, SurveyImportProgress, SurveySummary, ThrottleCounter, \
+    UserSessionTracking, UserSessionArchive, Offices, RevokedToken, UserTokenRevocation, BookingReferenceSequence, \
+    RouteChange
+from .serializers import CustomTokenObtainPairSerializer
+from .revocation import BloomFilter, revoke_user_tokens, token_revocations
+from .survey_summary import SummaryWriter
+from .session_tracking import SessionEventWriter, TOKEN_EXPIRED, SERVER_ERROR, archive_sessions
+from .throttle import DatabaseThrottleStore, get_login_throttle
+
+
+def create_cabin_types():
+    for name in ('Economy', 'Business', 'First Class'):
+        CabinTypes.objects.create(name=name)
+
+
+class SchedulesQueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_cabin_types()
+        country = Countries.objects.create(name='Russia')
+        cls.departure = Airports.objects.create(countryid=country, iata_code='SVO', name='Sheremetyevo')
+        cls.arrival = Airports.objects.create(countryid=country, iata_code='LED', name='Pulkovo')
+        cls.route = Routes.objects.create(departure_airport=cls.departure, arrival_airport=cls.arrival,
+                                          distance=700, flight_time=time(1, 30))
+        cls.aircrafts = [
+            Aircrafts.objects.create(name=f'Boeing {i}', make_model='B738', total_seats=180,
+                                     economy_seats=160, business_seats=20)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_schedules(self, count):
+        Schedules.objects.bulk_create([
+            Schedules(date=date(2024, 10, 1), time=time(i % 24, 0), aircraft=self.aircrafts[i % 3],
+                      route=self.route, flight_number=f'SU{i}', economy_price=100, confirmed=True)
+            for i in range(count)
+        ])
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_query_count_is_constant(self):
+        self.create_schedules(2)
+        small, _ = self.count_queries('/api/schedules/')
+        self.create_schedules(30)
+        large, data = self.count_queries('/api/schedules/')
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 32)
+        self.assertEqual(data[0]['from_airport']['iata_code'], 'SVO')
+        self.assertEqual(data[0]['to_airport']['iata_code'], 'LED')
+
+    def test_search_query_count_is_constant(self):
+        params = {'departure_airport': self.departure.id, 'arrival_airport': self.arrival.id,
+                  'date': '2024-10-01'}
+        self.create_schedules(2)
+        small, _ = self.count_queries('/api/schedules/search/', params)
+        self.create_schedules(30)
+        large, data = self.count_queries('/api/schedules/search/', params)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data), 32)
+        self.assertEqual(data[0]['aircraft']['make_model'], 'B738')
+
+    def test_limit_pagination_is_opt_in(self):
+        self.create_schedules(5)
+        _, data = self.count_queries('/api/schedules/')
+        self.assertEqual(len(data), 5)
+        _, data = self.count_queries('/api/schedules/', {'limit': 2, 'offset': 2})
+        self.assertEqual(data['count'], 5)
+        self.assertEqual([item['flight_number'] for item in data['results']], ['SU2', 'SU3'])
+
+    def test_sparse_fields_narrow_response_and_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/aircrafts/', {'fields': 'id,name'}).json()
+        self.assertEqual(data[0], {'id': self.aircrafts[0].id, 'name': 'Boeing 0'})
+        self.assertNotIn('total_seats', queries[0]['sql'].lower())
+
+        data = self.client.get('/api/routes/', {'fields': 'distance'}).json()
+        self.assertEqual(data, [{'distance': 700}])
+
+    def test_unknown_sparse_fields_are_rejected(self):
+        response = self.client.get('/api/aircrafts/', {'fields': 'id,nmae,seats'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Неизвестные поля: nmae, seats.'})
+
+
+class ItinerariesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_cabin_types()
+        country = Countries.objects.create(name='Russia')
+        cls.svo, cls.led, cls.kzn = [
+            Airports.objects.create(countryid=country, iata_code=code, name=code) for code in ('SVO', 'LED', 'KZN')
+        ]
+        cls.aircraft = Aircrafts.objects.create(name='Boeing', make_model='B738', total_seats=180,
+                                                economy_seats=160, business_seats=20)
+        cls.svo_led = Routes.objects.create(departure_airport=cls.svo, arrival_airport=cls.led,
+                                            distance=700, flight_time=time(1, 30))
+        cls.led_kzn = Routes.objects.create(departure_airport=cls.led, arrival_airport=cls.kzn,
+                                            distance=1500, flight_time=time(2, 0))
+
+    def setUp(self):
+        route_graph.invalidate()
+        self.client = APIClient()
+
+    def add_flight(self, route, hour, minute=0):
+        return Schedules.objects.create(date=date(2024, 10, 1), time=time(hour, minute), aircraft=self.aircraft,
+                                        route=route, flight_number=f'SU{route.id}{hour}', economy_price=100,
+                                        confirmed=True)
+
+    def search(self):
+        return self.client.get('/api/schedules/itineraries/', {
+            'departure_airport': self.svo.id, 'arrival_airport': self.kzn.id, 'date': '2024-10-01'})
+
+    def test_one_stop_respects_minimum_connection_time(self):
+        first = self.add_flight(self.svo_led, 8)
+        self.add_flight(self.led_kzn, 10)
+        connection = self.add_flight(self.led_kzn, 11)
+
+        response = self.search()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        itinerary = response.json()[0]
+        self.assertEqual(itinerary['stops'], 1)
+        self.assertEqual([flight['id'] for flight in itinerary['flights']], [first.id, connection.id])
+
+    def test_graph_follows_route_changes(self):
+        self.add_flight(self.svo_led, 8)
+        self.assertEqual(self.search().status_code, 404)
+
+        direct = Routes.objects.create(departure_airport=self.svo, arrival_airport=self.kzn,
+                                       distance=800, flight_time=time(1, 45))
+        self.add_flight(direct, 9)
+        response = self.search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['stops'], 0)
+
+    def test_graph_rebuilds_when_route_version_changes(self):
+        self.add_flight(self.svo_led, 8)
+        self.assertEqual(self.search().status_code, 404)
+
+        # Маршрут добавлен в обход сигналов, версию поднял другой воркер
+        direct, = Routes.objects.bulk_create([Routes(departure_airport=self.svo, arrival_airport=self.kzn,
+                                                     distance=800, flight_time=time(1, 45))])
+        self.add_flight(direct, 9)
+        bump_version(Routes)
+        route_graph.expire()
+        self.assertEqual(self.search().status_code, 200)
+
+    def test_route_changes_are_applied_without_rebuild(self):
+        self.assertEqual(route_graph.paths(self.svo.id, self.kzn.id), [[self.svo_led.id, self.led_kzn.id]])
+
+        with mock.patch.object(RouteGraph, '_build', side_effect=AssertionError('full rebuild')), \
+                mock.patch.object(RouteGraph, 'CHECK_INTERVAL', 0):
+            direct = Routes.objects.create(departure_airport=self.svo, arrival_airport=self.kzn,
+                                           distance=800, flight_time=time(1, 45))
+            self.assertCountEqual(route_graph.paths(self.svo.id, self.kzn.id),
+                                  [[direct.id], [self.svo_led.id, self.led_kzn.id]])
+
+            # Правка другого воркера видна по журналу: граф перечитывает только изменённый маршрут
+            Routes.objects.filter(id=self.led_kzn.id).update(arrival_airport=self.svo)
+            bump_version(Routes)
+            RouteChange.objects.create(version=table_version(Routes), route_id=self.led_kzn.id)
+            self.assertEqual(route_graph.paths(self.svo.id, self.kzn.id), [[direct.id]])
+            self.assertEqual(route_graph.paths(self.led.id, self.svo.id), [[self.led_kzn.id]])
+
+            direct.delete()
+            self.assertEqual(route_graph.paths(self.svo.id, self.kzn.id), [])
+
+
+class TicketCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Countries.objects.create(name='Russia')
+        svo = Airports.objects.create(countryid=cls.country, iata_code='SVO', name='Sheremetyevo')
+        led = Airports.objects.create(countryid=cls.country, iata_code='LED', name='Pulkovo')
+        route = Routes.objects.create(departure_airport=svo, arrival_airport=led, distance=700,
+                                      flight_time=time(1, 30))
+        aircraft = Aircrafts.objects.create(name='Boeing', make_model='B738', total_seats=5,
+                                            economy_seats=2, business_seats=2)
+        cls.schedule = Schedules.objects.create(date=date(2024, 10, 1), time=time(8, 0), aircraft=aircraft,
+                                                route=route, flight_number='SU1', economy_price=100, confirmed=True)
+        cls.return_schedule = Schedules.objects.create(date=date(2024, 10, 5), time=time(8, 0), aircraft=aircraft,
+                                                       route=route, flight_number='SU2', economy_price=100,
+                                                       confirmed=True)
+        create_cabin_types()
+        role = Roles.objects.create(id=2, title='User')
+        cls.user = Users.objects.create(roleid=role, email='user@amonic.com', password='x', lastname='User', active=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, count, cabin_type=1, **extra):
+        return self.client.post('/api/create-ticket/', {
+            'flight': self.schedule.id,
+            'cabintypeid': cabin_type,
+            'passengers': [{'first_name': f'P{i}', 'last_name': 'Test', 'email': 'p@test.com', 'phone': '1',
+                            'passport_number': str(i), 'passport_country': 'Russia'} for i in range(count)],
+            **extra,
+        }, format='json')
+
+    def available(self):
+        response = self.client.get('/api/schedules/search-by-id/', {'id': self.schedule.id})
+        return response.json()['available_seats']
+
+    def test_booking_decrements_and_rejects_overbooking(self):
+        self.assertEqual(self.available(), {'1': 2, '2': 2, '3': 1})
+
+        self.assertEqual(self.book(3).status_code, 400)
+        self.assertEqual(Tickets.objects.count(), 0)
+
+        self.assertEqual(self.book(2).status_code, 201)
+        self.assertEqual(self.available()['1'], 0)
+        self.assertEqual(self.book(1).status_code, 400)
+
+    def test_rebuild_matches_sold_tickets(self):
+        self.book(1)
+        SeatAvailability.objects.update(remaining=100)
+
+        call_command('rebuild_seat_availability', stdout=StringIO())
+
+        self.assertEqual(self.available(), {'1': 1, '2': 2, '3': 1})
+
+    def test_group_booking_query_count_is_constant(self):
+        self.available()
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.book(1, cabin_type=2).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.book(2, cabin_type=1).status_code, 201)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Tickets.objects.count(), 3)
+
+    def test_failed_return_leg_rolls_back_outbound(self):
+        self.assertEqual(self.book(2, flight=self.return_schedule.id).status_code, 201)
+
+        response = self.book(1, has_return_trip=True, returnFlight=self.return_schedule.id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Недостаточно свободных мест на рейсе.'})
+        self.assertEqual(Tickets.objects.count(), 2)
+        self.assertEqual(self.available()['1'], 2)
+
+    def test_invalid_flight_and_cabin_return_field_errors(self):
+        cases = [
+            ({'flight': 'abc'}, 'scheduleid'),
+            ({'flight': None}, 'scheduleid'),
+            ({'flight': 999999}, 'scheduleid'),
+            ({'cabintypeid': None}, 'cabintypeid'),
+            ({'cabintypeid': 'x'}, 'cabintypeid'),
+            ({'has_return_trip': True}, 'scheduleid'),
+        ]
+        for extra, field in cases:
+            with self.subTest(**extra):
+                response = self.book(1, **extra)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+        self.assertEqual(Tickets.objects.count(), 0)
+        self.assertEqual(SeatAvailability.objects.get(schedule=self.schedule, cabin_type_id=1).remaining, 2)
+
+    def ticket_data(self, **extra):
+        return {'userid': self.user.id, 'scheduleid': self.schedule.id, 'cabintypeid': 1, 'first_name': 'P',
+                'last_name': 'Test', 'email': 'p@test.com', 'phone': '1', 'passport_number': '1',
+                'passport_country': self.country.id, 'booking_reference': 'ABC123', 'confirmed': True, **extra}
+
+    def test_ticket_crud_moves_seat_counters(self):
+        response = self.client.post('/api/tickets/', self.ticket_data(), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.available(), {'1': 1, '2': 2, '3': 1})
+
+        ticket_id = response.json()['id']
+        response = self.client.patch(f'/api/tickets/{ticket_id}/', {'cabintypeid': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.available(), {'1': 2, '2': 2, '3': 0})
+
+        response = self.client.post('/api/tickets/', self.ticket_data(cabintypeid=3), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Tickets.objects.count(), 1)
+
+    def test_reads_do_not_write_counters(self):
+        self.book(1)
+        SeatAvailability.objects.all().delete()
+
+        self.assertEqual(self.available(), {'1': 1, '2': 2, '3': 1})
+        self.assertFalse(SeatAvailability.objects.exists())
+
+    def test_booking_numbers_match_stored_tickets(self):
+        return_flight = Schedules.objects.create(date=date(2024, 10, 5), time=time(8, 0),
+                                                 aircraft=self.schedule.aircraft, route=self.schedule.route,
+                                                 flight_number='SU2', economy_price=100, confirmed=True)
+        self.assertEqual(self.book(1, has_return_trip=True, returnFlight=self.schedule.id).status_code, 400)
+
+        response = self.book(2, has_return_trip=True, returnFlight=return_flight.id)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        stored = dict(Tickets.objects.values_list('id', 'booking_reference'))
+        self.assertEqual([stored[ticket_id] for ticket_id in data['tickets']], data['booking_numbers'])
+        self.assertEqual(len(set(data['booking_numbers'])), 2)
+
+        tickets = self.client.get('/api/tickets/search/', {'booking_reference': data['booking_numbers'][0]})
+        self.assertEqual(len(tickets.json()), 2)
+
+    def test_references_come_from_one_counter_row(self):
+        self.assertEqual(self.book(1).json()['booking_numbers'], [encode_booking_reference(1)])
+        self.assertEqual(self.book(5).status_code, 400)
+
+        response = self.book(1)
+
+        # Номер отменённой брони не расходуется
+        self.assertEqual(response.json()['booking_numbers'], [encode_booking_reference(2)])
+        self.assertEqual(list(BookingReferenceSequence.objects.values_list('value', flat=True)), [2])
+
+    def test_taken_reference_is_skipped(self):
+        # Старый случайный номер на том же рейсе совпал со следующим кодом серии
+        Tickets.objects.create(userid=self.user, scheduleid=self.schedule, cabintypeid_id=1, first_name='Old',
+                               last_name='Test', email='p@test.com', phone='1', passport_number='0',
+                               passport_country=self.country, booking_reference=encode_booking_reference(1),
+                               confirmed=True)
+
+        response = self.book(1)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['booking_numbers'], [encode_booking_reference(2)])
+        self.assertEqual(Tickets.objects.count(), 2)
+
+    def test_encoded_references_do_not_collide(self):
+        references = {encode_booking_reference(number) for number in range(1, 100001)}
+        self.assertEqual(len(references), 100000)
+        self.assertTrue(all(len(reference) == 6 for reference in references))
+
+
+class ImportSurveysTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_cabin_types()
+        country = Countries.objects.create(name='Russia')
+        cls.airports = [Airports.objects.create(countryid=country, iata_code=code, name=code)
+                        for code in ('SVO', 'LED')]
+
+    def write_csv(self, name, rows, directory=None):
+        if directory is None:
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w') as csvfile:
+            csvfile.write('DepartureAirportID,ArrivalAirportID,age,gender,travel_class,q1,q2,q3,q4\n')
+            csvfile.writelines(rows)
+        return path
+
+    def test_streams_batches_and_rejects_unknown_references(self):
+        svo, led = (airport.id for airport in self.airports)
+        rows = [f'{svo},{led},30,F,1,1,2,3,4\n'] * 7 + [f'{svo},999,30,M,1,1,1,1,1\n', f'{svo},{led},,,9,1,1,1,1\n']
+        path = self.write_csv('survey_05.csv', rows)
+        out = StringIO()
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_surveys', path, batch_size=3, stdout=out)
+
+        self.assertEqual(Surveys0.objects.count(), 7)
+        self.assertEqual(set(Surveys0.objects.values_list('survey_month', flat=True)), {'5'})
+        self.assertIn('rejected 2 rows', out.getvalue())
+        # Раньше на каждую строку было три запроса get()
+        self.assertLess(len(queries), 3 * len(rows))
+
+    def test_survey_month_argument(self):
+        svo, led = (airport.id for airport in self.airports)
+        path = self.write_csv('dump.csv', [f'{svo},{led},30,,1,1,2,3,4\n'])
+
+        call_command('import_surveys', path, survey_month='11', stdout=StringIO())
+
+        survey = Surveys0.objects.get()
+        self.assertEqual((survey.survey_month, survey.gender), ('11', 'M'))
+
+    def test_directory_import_in_parallel_resumes_unfinished_files(self):
+        svo, led = (airport.id for airport in self.airports)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        first = self.write_csv('survey_05.csv', [f'{svo},{led},30,F,1,1,2,3,4\n'] * 5, directory)
+        self.write_csv('survey_06.csv', [f'{led},{svo},40,M,2,4,3,2,1\n'] * 4, directory)
+        SurveyImportProgress.objects.create(file_path=first, survey_month='5', rows_read=3)
+
+        call_command('import_surveys', directory, workers=2, batch_size=2, stdout=StringIO())
+
+        counts = dict(Surveys0.objects.values_list('survey_month').annotate(total=Count('id')).order_by())
+        self.assertEqual(counts, {'5': 2, '6': 4})
+        self.assertTrue(all(SurveyImportProgress.objects.values_list('completed', flat=True)))
+
+        call_command('import_surveys', directory, workers=2, stdout=StringIO())
+        self.assertEqual(Surveys0.objects.count(), 6)
+
+    def test_failed_parser_process_aborts_instead_of_hanging(self):
+        svo, led = (airport.id for airport in self.airports)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.write_csv('survey_05.csv', [f'{svo},{led},30,F,1,1,2,3,4\n'], directory)
+        self.write_csv('survey_06.csv', [f'{led},{svo},40,M,2,4,3,2,1\n'], directory)
+
+        # Задача падает в процессе пула, не отправив DONE или ERROR
+        with mock.patch('system.management.commands.import_surveys.parse_file', functools.partial(os._exit, 1)):
+            with self.assertRaisesMessage(CommandError, 'Parser process failed'):
+                call_command('import_surveys', directory, workers=2, stdout=StringIO())
+        self.assertEqual(Surveys0.objects.count(), 0)
+
+    def test_summary_is_refreshed_by_importer_and_matches_rebuild(self):
+        svo, led = (airport.id for airport in self.airports)
+        path = self.write_csv('survey_07.csv', [
+            f'{svo},{led},30,F,1,1,2,3,4\n', f'{svo},{led},35,F,1,3,2,,4\n', f'{svo},{led},70,M,2,5,5,5,5\n'])
+        call_command('import_surveys', path, batch_size=2, stdout=StringIO())
+
+        response = APIClient().get('/api/surveys0/summary/', {'group_by': 'gender,age_bucket', 'survey_month': '7'})
+
+        self.assertEqual(response.status_code, 200)
+        female = next(item for item in response.json() if item['gender'] == 'F')
+        self.assertEqual((female['age_bucket'], female['count']), ('25-39', 2))
+        self.assertEqual(female['questions']['q1'], {'mean': 2.0, 'unanswered': 0, 'distribution': {'1': 1, '3': 1}})
+        self.assertEqual(female['questions']['q3']['unanswered'], 1)
+
+        incremental = set(SurveySummary.objects.values_list(
+            'survey_month', 'gender', 'age_bucket', 'travel_class', 'question', 'answer', 'count'))
+        call_command('rebuild_survey_summary', stdout=StringIO())
+        rebuilt = set(SurveySummary.objects.values_list(
+            'survey_month', 'gender', 'age_bucket', 'travel_class', 'question', 'answer', 'count'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_concurrent_summary_writers_add_up(self):
+        svo, led = (airport.id for airport in self.airports)
+        survey = (svo, led, 30, 'F', 1, 1, 2, 3, 4)
+        # Два импорта одного месяца пишут пачки вперемешку
+        first, second = SummaryWriter(), SummaryWriter()
+        first.add('8', [survey])
+        second.add('8', [survey, survey])
+        first.add('8', [survey])
+
+        counts = SurveySummary.objects.filter(survey_month='8').values('question').annotate(total=Sum('count'))
+        self.assertEqual({row['question']: row['total'] for row in counts}, {'q1': 4, 'q2': 4, 'q3': 4, 'q4': 4})
+        self.assertEqual(SurveySummary.objects.filter(survey_month='8').count(), 4)
+
+    def test_summary_rejects_unknown_dimension(self):
+        response = APIClient().get('/api/surveys0/summary/', {'group_by': 'email'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_summary_rejects_non_numeric_id_filter(self):
+        response = APIClient().get('/api/surveys0/summary/', {'group_by': 'gender', 'departure_airport': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_crosstab_matches_summary(self):
+        survey_columns.invalidate()
+        svo, led = (airport.id for airport in self.airports)
+        path = self.write_csv('survey_07.csv', [
+            f'{svo},{led},30,F,1,1,2,3,4\n', f'{svo},{led},35,F,1,3,2,,4\n', f'{led},{svo},70,M,2,5,5,5,5\n',
+            f'{svo},{led},16,M,2,,1,1,1\n'])
+        call_command('import_surveys', path, stdout=StringIO())
+        client = APIClient()
+
+        response = client.get('/api/surveys0/crosstab/', {'group_by': 'age_band,travel_class', 'question': 'q1'})
+
+        self.assertEqual(response.status_code, 200)
+        cells = {(cell['age_band'], cell['travel_class']): cell for cell in response.json()}
+        self.assertEqual(cells[('25-39', 1)], {'age_band': '25-39', 'travel_class': 1, 'count': 2, 'mean': 2.0,
+                                               'unanswered': 0, 'distribution': {'1': 1, '3': 1}})
+        self.assertEqual(cells[('unknown', 2)]['unanswered'], 1)
+
+        route = client.get('/api/surveys0/crosstab/', {'group_by': 'gender', 'question': 'q3',
+                                                      'route': f'{svo}-{led}'}).json()
+        summary = client.get('/api/surveys0/summary/', {'group_by': 'gender', 'departure_airport': svo}).json()
+        self.assertEqual(len(route), 2)
+        for cell, expected in zip(route, summary):
+            self.assertEqual(cell['mean'], expected['questions']['q3']['mean'])
+            self.assertEqual(cell['count'], expected['count'])
+
+
+@override_settings(SESSION_TRACKING={'ASYNC': False})
+class LoginThrottleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Roles.objects.create(id=2, title='User')
+        cls.user = Users.objects.create(roleid=role, email='user@amonic.com', lastname='User', active=1)
+        cls.user.set_password('secret')
+        cls.user.save()
+
+    def login(self, password):
+        return APIClient().post('/api/token/', {'email': 'user@amonic.com', 'password': password}, format='json')
+
+    def test_database_store_counts_and_expires(self):
+        store = DatabaseThrottleStore()
+        self.assertEqual([store.incr('key', 10) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(store.get('key'), 3)
+
+        ThrottleCounter.objects.filter(key='key').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(store.get('key'), 0)
+        self.assertEqual(store.incr('key', 10), 1)
+
+        store.delete('key')
+        self.assertFalse(ThrottleCounter.objects.exists())
+
+    def test_database_store_prunes_expired_counters(self):
+        store = DatabaseThrottleStore(prune_interval=0)
+        store.incr('stale', 10)
+        ThrottleCounter.objects.filter(key='stale').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        store.incr('fresh', 10)
+
+        self.assertEqual(list(ThrottleCounter.objects.values_list('key', flat=True)), ['fresh'])
+
+    def test_lockout_after_failed_attempts(self):
+        for _ in range(3):
+            self.assertNotEqual(self.login('wrong').status_code, 200)
+        self.assertTrue(get_login_throttle().is_locked('user@amonic.com'))
+        self.assertEqual(self.login('secret').status_code, 429)
+
+        get_login_throttle().reset('user@amonic.com')
+        self.assertEqual(self.login('secret').status_code, 200)
+        self.assertFalse(ThrottleCounter.objects.exists())
+        self.assertTrue(UserSessionTracking.objects.filter(user=self.user, logout_time__isnull=True).exists())
+
+
+@override_settings(SESSION_TRACKING={'ASYNC': False},
+                   PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000})
+class PasswordHashingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Roles.objects.create(id=2, title='User')
+
+    def create_user(self, email, password):
+        return Users.objects.create(roleid=self.role, email=email, lastname='User', active=1, password=password)
+
+    def login(self, email, password):
+        return APIClient().post('/api/token/', {'email': email, 'password': password}, format='json')
+
+    def test_login_upgrades_outdated_hashes(self):
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}):
+            self.create_user('old@amonic.com', make_password('secret'))
+
+        self.assertEqual(self.login('old@amonic.com', 'secret').status_code, 200)
+        password = Users.objects.get(email='old@amonic.com').password
+        self.assertTrue(password.startswith('pbkdf2_sha256$2000$'))
+        self.assertTrue(check_password('secret', password))
+
+    def test_plaintext_passwords_do_not_log_in(self):
+        # Открытые пароли из исходной базы шифрует set_passwords, вход по ним не работает
+        self.create_user('plain@amonic.com', 'secret')
+
+        self.assertNotEqual(self.login('plain@amonic.com', 'secret').status_code, 200)
+        self.assertEqual(Users.objects.get(email='plain@amonic.com').password, 'secret')
+
+    def test_stronger_hashes_are_not_downgraded(self):
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 3000}):
+            stored = self.create_user('strong@amonic.com', make_password('secret')).password
+
+        self.assertEqual(self.login('strong@amonic.com', 'secret').status_code, 200)
+        self.assertEqual(Users.objects.get(email='strong@amonic.com').password, stored)
+
+    def test_default_iterations_follow_django(self):
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': None}):
+            self.assertEqual(PBKDF2PasswordHasher().iterations, hashers.PBKDF2PasswordHasher.iterations)
+
+    def test_set_passwords_hashes_plaintext_in_parallel(self):
+        for i in range(5):
+            self.create_user(f'user{i}@amonic.com', f'secret{i}')
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}):
+            self.create_user('old@amonic.com', make_password('secret'))
+
+        out = StringIO()
+        with mock.patch('system.management.commands.set_passwords.READ_CHUNK', 3):
+            call_command('set_passwords', workers=2, batch_size=2, stdout=out)
+        self.assertIn('проверены: зашифровано 5, ещё 1', out.getvalue())
+        for i in range(5):
+            self.assertTrue(check_password(f'secret{i}', Users.objects.get(email=f'user{i}@amonic.com').password))
+
+
+class ClaimsAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Countries.objects.create(id=1, name='Russia')
+        office = Offices.objects.create(id=1, countryid=country, title='Moscow', phone='0', contact='Contact')
+        cls.admin = Users.objects.create(roleid=Roles.objects.create(id=1, title='Administrator'), officeid=office,
+                                         email='admin@amonic.com', lastname='Admin', active=1)
+        cls.user = Users.objects.create(roleid=Roles.objects.create(id=2, title='User'), officeid=office,
+                                        email='user@amonic.com', lastname='User', active=1)
+
+    def setUp(self):
+        cache.clear()
+        token_revocations.reset()
+        token_revocations.rebuild()
+
+    def client_for(self, user):
+        client = APIClient()
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_user_is_built_from_claims(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertEqual((token['role'], token['office'], token['office_title']), (2, 1, 'Moscow'))
+
+        with self.assertNumQueries(1):
+            ClaimsJWTAuthentication().get_user(token)
+        with self.assertNumQueries(0):
+            user = ClaimsJWTAuthentication().get_user(token)
+            self.assertEqual((user.pk, user.email, user.roleid_id, user.officeid.title),
+                             (self.user.id, 'user@amonic.com', 2, 'Moscow'))
+        self.assertEqual(user.lastname, 'User')
+
+    def test_update_user_invalidates_cached_state(self):
+        client = self.client_for(self.user)
+        self.assertEqual(client.post('/api/add_user/', {}, format='json').status_code, 403)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.post('/api/add_user/', {}, format='json').status_code, 403)
+
+        response = self.client_for(self.admin).patch(f'/api/update_user/{self.user.id}/', {'active': 0},
+                                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.post('/api/add_user/', {}, format='json').status_code, 401)
+
+        response = self.client_for(self.user).get('/api/current_user/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client_for(self.admin).get('/api/current_user/').json()['office_name'], 'Moscow')
+
+
+@override_settings(SESSION_TRACKING={'ASYNC': False}, TOKEN_REVOCATION={'BACKGROUND': False})
+class TokenRevocationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Users.objects.create(roleid=Roles.objects.create(id=1, title='Administrator'),
+                                         email='admin@amonic.com', lastname='Admin', active=1)
+        cls.user = Users.objects.create(roleid=Roles.objects.create(id=2, title='User'),
+                                        email='user@amonic.com', lastname='User', active=1)
+
+    def setUp(self):
+        cache.clear()
+        token_revocations.reset()
+
+    @staticmethod
+    def tokens(user):
+        refresh = CustomTokenObtainPairSerializer.get_token(user)
+        return str(refresh), str(refresh.access_token)
+
+    @staticmethod
+    def get(path, access):
+        return APIClient().get(path, HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'key-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertLess(sum(f'other-{i}' in bloom for i in range(10000)), 300)
+
+    def test_logout_revokes_session_tokens(self):
+        refresh, access = self.tokens(self.user)
+        response = APIClient().post('/api/logout/', {'refresh': refresh}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        self.assertEqual(self.get('/api/current_user/', access).status_code, 401)
+        self.assertEqual(APIClient().post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+        self.assertEqual(self.get('/api/current_user/', self.tokens(self.user)[1]).status_code, 200)
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        refresh, _ = self.tokens(self.user)
+        response = APIClient().post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/api/current_user/', response.json()['access']).status_code, 200)
+        self.assertEqual(APIClient().post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+        self.assertEqual(APIClient().post('/api/token/refresh/', {'refresh': response.json()['refresh']}).status_code,
+                         200)
+
+    def test_deactivation_revokes_all_user_tokens(self):
+        refresh, access = self.tokens(self.user)
+        admin = self.tokens(self.admin)[1]
+        for active in (0, 1):
+            response = APIClient().patch(f'/api/update_user/{self.user.id}/', {'active': active}, format='json',
+                                         HTTP_AUTHORIZATION=f'Bearer {admin}')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get('/api/current_user/', access).status_code, 401)
+        self.assertEqual(APIClient().post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_sync_drops_state_of_users_blocked_in_other_processes(self):
+        access = self.tokens(self.user)[1]
+        token_revocations.rebuild()
+        self.assertEqual(self.get('/api/current_user/', access).status_code, 200)
+
+        # Другой воркер заблокировал пользователя: его кэш этого процесса не видит
+        Users.objects.filter(id=self.user.id).update(active=0)
+        revoke_user_tokens(self.user.id)
+        self.assertEqual(get_user_state(self.user.id)[0], 1)
+
+        token_revocations.sync()
+
+        self.assertEqual(get_user_state(self.user.id)[0], 0)
+        self.assertEqual(self.get('/api/current_user/', access).status_code, 401)
+
+    def test_prune_removes_expired_tokens(self):
+        now = timezone.now()
+        token_revocations.revoke('expired', now - timedelta(seconds=1))
+        token_revocations.revoke('live', now + timedelta(hours=1))
+        self.assertEqual(token_revocations.prune(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+        with self.assertNumQueries(0):
+            self.assertFalse(token_revocations.is_revoked('expired'))
+        self.assertTrue(token_revocations.is_revoked('live'))
+
+
+@override_settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}, PASSWORD_HASHERS=[
+    'system.hashers.PBKDF2PasswordHasher'], TOKEN_REVOCATION={'BACKGROUND': False})
+class BulkUserAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Countries.objects.create(id=1, name='Russia')
+        cls.office = Offices.objects.create(id=1, countryid=country, title='Moscow', phone='0', contact='Contact')
+        Offices.objects.create(id=2, countryid=country, title='Abu Dhabi', phone='0', contact='Contact')
+        cls.admin = Users.objects.create(roleid=Roles.objects.create(id=1, title='Administrator'), officeid=cls.office,
+                                         email='admin@amonic.com', lastname='Admin', active=1)
+        Roles.objects.create(id=2, title='User')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        token = CustomTokenObtainPairSerializer.get_token(self.admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    @staticmethod
+    def row(i, **extra):
+        return {'email': f'user{i}@amonic.com', 'firstname': 'User', 'lastname': str(i), 'office_name': 'Moscow',
+                'birthdate': '1990-01-01', 'password': f'secret{i}', **extra}
+
+    def test_bulk_create_validates_every_row_before_writing(self):
+        rows = [self.row(1), self.row(2, office_name='Nowhere'), self.row(1), self.row(3, birthdate='01.01.1990')]
+        response = self.client.post('/api/users/bulk/', {'users': rows}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(item['row'], sorted(item['errors'])) for item in response.json()['errors']],
+                         [(2, ['office_name']), (3, ['email']), (4, ['birthdate'])])
+        self.assertEqual(Users.objects.count(), 1)
+
+        # Офисы, роли, занятые email и один INSERT в транзакции
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/users/bulk/', {'users': [self.row(i) for i in range(1, 11)]},
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 10)
+        user = Users.objects.get(email='user3@amonic.com')
+        self.assertEqual((user.roleid_id, user.officeid_id, user.active), (2, 1, 1))
+        self.assertTrue(user.check_password('secret3'))
+
+    def test_bulk_update(self):
+        self.client.post('/api/users/bulk/', {'users': [self.row(i) for i in range(1, 4)]}, format='json')
+        ids = list(Users.objects.filter(roleid_id=2).order_by('id').values_list('id', flat=True))
+
+        response = self.client.patch('/api/users/bulk/', {'users': [
+            {'id': ids[0], 'office_name': 'Abu Dhabi'}, {'id': ids[1], 'active': 0, 'roleid': 1},
+            {'id': ids[2], 'email': 'admin@amonic.com'}]}, format='json')
+        self.assertEqual(response.json(), {'errors': [{'row': 3, 'errors': {
+            'email': 'Пользователь с таким email уже существует'}}]})
+
+        response = self.client.patch('/api/users/bulk/', {'users': [
+            {'id': ids[0], 'office_name': 'Abu Dhabi'}, {'id': ids[1], 'active': 0, 'roleid': 1}]}, format='json')
+        self.assertEqual(response.json(), {'updated': 2})
+        self.assertEqual(Users.objects.get(id=ids[0]).officeid_id, 2)
+        self.assertEqual(Users.objects.filter(id=ids[1], active=0, roleid_id=1).count(), 1)
+        self.assertTrue(UserTokenRevocation.objects.filter(user_id=ids[1]).exists())
+
+    def test_bulk_update_rejects_duplicate_and_malformed_emails(self):
+        self.client.post('/api/users/bulk/', {'users': [self.row(i) for i in range(1, 4)]}, format='json')
+        ids = list(Users.objects.filter(roleid_id=2).order_by('id').values_list('id', flat=True))
+
+        response = self.client.patch('/api/users/bulk/', {'users': [
+            {'id': ids[0], 'email': 'same@amonic.com'}, {'id': ids[1], 'email': 'same@amonic.com'},
+            {'id': ids[2], 'email': ['x']}]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(item['row'], sorted(item['errors'])) for item in response.json()['errors']],
+                         [(2, ['email']), (3, ['email'])])
+        self.assertFalse(Users.objects.filter(email='same@amonic.com').exists())
+
+        response = self.client.post('/api/users/bulk/', {'users': [self.row(4, email={'a': 1})]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_user_endpoints_and_permissions(self):
+        response = self.client.post('/api/add_user/', self.row(1, roleid=1), format='json')
+        self.assertEqual(response.status_code, 201)
+        user = Users.objects.get(email='user1@amonic.com')
+        self.assertEqual(user.roleid_id, 2)
+
+        response = self.client.patch(f'/api/update_user/{user.id}/', {'office_name': 'Nowhere'}, format='json')
+        self.assertEqual(response.json(), {'error': 'Офис не найден'})
+        self.assertEqual(self.client.patch('/api/update_user/999/', {}, format='json').status_code, 404)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {CustomTokenObtainPairSerializer.get_token(user).access_token}')
+        self.assertEqual(client.post('/api/users/bulk/', {'users': []}, format='json').status_code, 403)
+
+    def test_import_users_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'users.csv')
+        with open(path, 'w') as file:
+            file.write('email,firstname,lastname,office_name,birthdate,password,roleid\n'
+                       'a@amonic.com,A,A,Moscow,1990-01-01,secret,\n'
+                       'b@amonic.com,B,B,Abu Dhabi,1991-02-03,secret,1\n')
+        call_command('import_users', path, workers=2, stdout=StringIO())
+        self.assertEqual(dict(Users.objects.filter(email__in=['a@amonic.com', 'b@amonic.com']).values_list(
+            'email', 'roleid_id')), {'a@amonic.com': 2, 'b@amonic.com': 1})
+
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_users', path, stdout=StringIO(), stderr=err)
+        self.assertIn('line 2: email: Пользователь с таким email уже существует', err.getvalue())
+
+
+class UserDirectoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        country = Countries.objects.create(id=1, name='Russia')
+        moscow = Offices.objects.create(id=1, countryid=country, title='Moscow', phone='0', contact='Contact')
+        abu_dhabi = Offices.objects.create(id=2, countryid=country, title='Abu Dhabi', phone='0', contact='Contact')
+        admin, user = Roles.objects.create(id=1, title='Administrator'), Roles.objects.create(id=2, title='User')
+        for email, firstname, lastname, office, role, active in [
+            ('ivan.petrov@amonic.com', 'Ivan', 'Petrov', moscow, user, 1),
+            ('anna@amonic.com', 'Anna', 'Ivanova', moscow, admin, 1),
+            ('petr@amonic.com', 'Петр', 'Сидоров', abu_dhabi, user, 0),
+            ('john@amonic.com', 'John', 'Smith', abu_dhabi, user, 1),
+        ]:
+            Users.objects.create(email=email, firstname=firstname, lastname=lastname, officeid=office, roleid=role,
+                                 active=active)
+
+    def search(self, **params):
+        response = APIClient().get('/api/users/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['email'] for item in response.json()['results']]
+
+    def test_prefix_and_full_text_matching(self):
+        self.assertEqual(self.search(q='iva'), ['anna@amonic.com', 'ivan.petrov@amonic.com'])
+        self.assertEqual(self.search(q='pet iv'), ['ivan.petrov@amonic.com'])
+        self.assertEqual(self.search(q='сид'), ['petr@amonic.com'])
+        self.assertEqual(self.search(q='amonic', office=2, active=1), ['john@amonic.com'])
+        self.assertEqual(self.search(role=1), ['anna@amonic.com'])
+        self.assertEqual(APIClient().get('/api/users/search/', {'office': 'x'}).status_code, 400)
+
+    def test_prefix_fallback_without_fts5(self):
+        with mock.patch('system.directory.has_fts5', return_value=False):
+            self.assertEqual(self.search(q='iva'), ['anna@amonic.com', 'ivan.petrov@amonic.com'])
+            self.assertEqual(self.search(q='pet iv'), ['ivan.petrov@amonic.com'])
+
+    def test_paginated_with_two_queries(self):
+        with self.assertNumQueries(2):
+            response = APIClient().get('/api/users/search/', {'limit': 2})
+        data = response.json()
+        self.assertEqual((data['count'], len(data['results'])), (4, 2))
+        self.assertEqual(data['results'][0]['office_name'], 'Moscow')
+        self.assertIsNotNone(data['next'])
+
+    def test_index_follows_updates(self):
+        user = Users.objects.get(email='john@amonic.com')
+        Users.objects.filter(id=user.id).update(lastname='Johnson')
+        self.assertEqual(self.search(q='johnson'), ['john@amonic.com'])
+        self.assertEqual(self.search(q='smith'), [])
+        user.delete()
+        self.assertEqual(self.search(q='john'), [])
+
+    def test_office_filter_uses_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN SELECT * FROM users WHERE "OfficeID" = 1 '
+                           'ORDER BY "LastName", "FirstName" LIMIT 50')
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('users_office_name_idx', plan)
+
+
+@override_settings(SESSION_TRACKING={'ASYNC': False})
+class SessionTrackingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Roles.objects.create(id=2, title='User')
+        cls.users = [Users.objects.create(roleid=role, email=f'user{i}@amonic.com', lastname='User', active=1)
+                     for i in range(2)]
+
+    def test_batch_replays_events_in_order(self):
+        first, second = self.users
+        writer = SessionEventWriter()
+        with self.settings(SESSION_TRACKING={'ASYNC': True, 'FLUSH_INTERVAL': 60}):
+            writer._ensure_thread = lambda: None
+            writer.login(first.id)
+            writer.login(second.id)
+            writer.login(first.id)
+            writer.logout(second.id, SERVER_ERROR)
+            self.assertFalse(UserSessionTracking.objects.exists())
+
+        with self.assertNumQueries(4):
+            writer.flush()
+
+        sessions = list(UserSessionTracking.objects.order_by('id'))
+        self.assertEqual([session.user_id for session in sessions], [first.id, second.id, first.id])
+        self.assertEqual(sessions[0].logout_reason, TOKEN_EXPIRED)
+        self.assertEqual(sessions[0].duration, sessions[0].logout_time - sessions[0].login_time)
+        self.assertEqual(sessions[1].logout_reason, SERVER_ERROR)
+        self.assertIsNone(sessions[2].logout_time)
+
+        writer.logout(first.id)
+        self.assertIsNotNone(UserSessionTracking.objects.get(id=sessions[2].id).logout_time)
+
+    def test_stop_flushes_pending_events(self):
+        writer = SessionEventWriter()
+        with self.settings(SESSION_TRACKING={'ASYNC': True, 'FLUSH_INTERVAL': 60}):
+            writer._ensure_thread = lambda: None
+            writer.login(self.users[0].id)
+        writer.stop()
+        self.assertEqual(UserSessionTracking.objects.count(), 1)
+
+    def test_failed_flush_keeps_events(self):
+        writer = SessionEventWriter()
+        with self.settings(SESSION_TRACKING={'ASYNC': True, 'FLUSH_INTERVAL': 60}):
+            writer._ensure_thread = lambda: None
+            writer.login(self.users[0].id)
+            write = SessionEventWriter._write
+            with mock.patch.object(SessionEventWriter, '_write', side_effect=OperationalError('database is locked')):
+                with self.assertRaises(OperationalError):
+                    writer.flush()
+            writer.logout(self.users[0].id)
+
+        with mock.patch.object(SessionEventWriter, '_write', side_effect=write) as retried:
+            writer.flush()
+        self.assertEqual(len(retried.call_args_list[0].args[0]), 1)
+        session = UserSessionTracking.objects.get()
+        self.assertIsNotNone(session.logout_time)
+
+    def test_open_session_lookup_uses_partial_index(self):
+        query = UserSessionTracking.objects.filter(user_id__in=[self.users[0].id], logout_time__isnull=True).values(
+            'user_id').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('session_open_user_idx', plan)
+
+
+class SessionHistoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        role = Roles.objects.create(id=2, title='User')
+        cls.user = Users.objects.create(roleid=role, email='user@amonic.com', lastname='User', active=1)
+        start = datetime(2023, 1, 30, 8, 0, tzinfo=dt_timezone.utc)
+        for day in range(5):
+            login_time = start + timedelta(days=day)
+            UserSessionTracking.objects.create(user=cls.user, login_time=login_time,
+                                               logout_time=login_time + timedelta(hours=1),
+                                               logout_reason=SERVER_ERROR if day == 0 else None)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_history_is_cursor_paginated(self):
+        response = self.client.get('/api/user_sessions/', {'page_size': 2})
+        self.assertEqual([item['login_time'][:10] for item in response.data['results']], ['2023-02-03', '2023-02-02'])
+
+        seen = len(response.data['results'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += len(response.data['results'])
+        self.assertEqual(seen, 5)
+
+    def test_summary_and_archive(self):
+        archived = archive_sessions(datetime(2023, 2, 1, tzinfo=dt_timezone.utc), batch_size=1)
+        self.assertEqual(archived, 2)
+        self.assertEqual(UserSessionTracking.objects.count(), 3)
+        self.assertEqual(len(self.client.get('/api/user_sessions/archive/').data['results']), 2)
+
+        summary = self.client.get('/api/user_sessions/summary/', {'period': 'month'}).data
+        self.assertEqual((summary['sessions'], summary['crashes'], summary['seconds']), (5, 1, 5 * 3600))
+        self.assertEqual([(item['start'], item['sessions']) for item in summary['periods']],
+                         [(date(2023, 2, 1), 3), (date(2023, 1, 1), 2)])
+        self.assertEqual(self.client.get('/api/user_sessions/summary/', {'period': 'year'}).status_code, 400)
+
+    def test_close_stale_sessions_is_opt_in_command(self):
+        login_time = datetime(2023, 3, 1, 8, 0, tzinfo=dt_timezone.utc)
+        stale, current = [UserSessionTracking.objects.create(user=self.user,
+                                                             login_time=login_time + timedelta(hours=hours))
+                          for hours in (0, 2)]
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('archive_sessions', close_stale=True, days=10000, stdout=out)
+
+        self.assertIn('Closed 1 stale sessions', out.getvalue())
+        # Без отдельного запроса на каждую закрываемую сессию
+        self.assertLessEqual(len(queries), 6)
+        stale.refresh_from_db()
+        self.assertEqual((stale.logout_time, stale.logout_reason), (current.login_time, TOKEN_EXPIRED))
+        self.assertTrue(UserSessionTracking.objects.filter(id=current.id, logout_time__isnull=True).exists())
+
+
+class ReferenceCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = Countries.objects.create(name='Russia')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_conditional_get_and_invalidation(self):
+        response = self.client.get('/api/countries/')
+        etag = response['ETag']
+        self.assertEqual(response.json(), [{'id': self.country.id, 'name': 'Russia'}])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/countries/').content, response.content)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/countries/', {'fields': 'name'})['ETag'], etag)
+
+        Airports.objects.create(countryid=self.country, iata_code='SVO', name='Sheremetyevo')
+        self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Countries.objects.create(name='Italy')
+        response = self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_if_none_match_compares_whole_tags(self):
+        etag = self.client.get('/api/countries/')['ETag']
+
+        self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=f'x{etag}x').status_code, 200)
+        self.assertEqual(self.client.get('/api/countries/', HTTP_IF_NONE_MATCH=f'"other", W/{etag}').status_code, 304)
+
+    def test_cached_list_keeps_content_negotiation(self):
+        self.client.get('/api/countries/')
+
+        response = self.client.get('/api/countries/', HTTP_ACCEPT='text/html')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('text/html', response['Content-Type'])
+        self.assertContains(response, 'Russia')
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class RequestMetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Countries.objects.create(name='Russia')
+        admin, user = Roles.objects.create(id=1, title='Administrator'), Roles.objects.create(id=2, title='User')
+        cls.admin = Users.objects.create(roleid=admin, email='admin@amonic.com', lastname='Admin', active=1)
+        cls.user = Users.objects.create(roleid=user, email='user@amonic.com', lastname='User', active=1)
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+
+    def test_server_timing_and_prometheus_export(self):
+        response = self.client.get('/api/countries/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, '
+                                                    r'render;dur=[\d.]+, app;dur=[\d.]+, total;dur=[\d.]+$')
+
+        response = self.client.get('/api/metrics', HTTP_X_METRICS_TOKEN='scrape-token')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="countries-list"} 1', body)
+        self.assertIn('http_request_duration_seconds{view="countries-list",quantile="0.99"}', body)
+        self.assertRegex(body, r'db_queries_total\{view="countries-list"\} [1-9]')
+        self.assertRegex(body, r'serialize_time_seconds_total\{view="countries-list"\} 0\.0*[1-9]')
+
+    def test_metrics_are_protected(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics', HTTP_X_METRICS_TOKEN='wrong').status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+
+class StructuredLoggingTest(TestCase):
+    def test_async_handler_writes_json_lines(self):
+        stream = StringIO()
+        handler = AsyncJsonHandler(stream)
+        handler.addFilter(SamplingFilter())
+        logger = logging.getLogger('system.tests.logging')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            logger.info('ticket %s', 'search', extra={'booking_reference': 'ABC123'})
+            logger.info('sampled out', extra={'sample_rate': 0})
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                logger.exception('failed')
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines], ['ticket search', 'failed'])
+        self.assertEqual(lines[0]['booking_reference'], 'ABC123')
+        self.assertIn('ValueError: boom', lines[1]['exception'])
+
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_cabin_types()
+        country = Countries.objects.create(name='Russia')
+        svo = Airports.objects.create(countryid=country, iata_code='SVO', name='Sheremetyevo')
+        led = Airports.objects.create(countryid=country, iata_code='LED', name='Pulkovo')
+        route = Routes.objects.create(departure_airport=svo, arrival_airport=led, distance=700,
+                                      flight_time=time(1, 30))
+        aircraft = Aircrafts.objects.create(name='Boeing', make_model='B738', total_seats=5,
+                                            economy_seats=2, business_seats=2)
+        cls.schedule = Schedules.objects.create(date=date(2024, 10, 1), time=time(8, 0), aircraft=aircraft,
+                                                route=route, flight_number='SU1', economy_price=100, confirmed=True)
+        cls.params = {'departure_airport': svo.id, 'arrival_airport': led.id, 'date': '2024-10-01'}
+        role = Roles.objects.create(id=2, title='User')
+        cls.user = Users.objects.create(roleid=role, email='user@amonic.com', lastname='User', active=1)
+
+    def setUp(self):
+        self.async_client = AsyncClient()
+
+    async def test_schedule_search_matches_sync_endpoint(self):
+        response = await self.async_client.get('/api/async/schedules/search/', self.params)
+        self.assertEqual(response.status_code, 200)
+        sync_data = await sync_to_async(lambda: APIClient().get('/api/schedules/search/', self.params).json())()
+        self.assertEqual(response.json(), sync_data)
+        self.assertEqual(response.json()[0]['available_seats'], {'1': 2, '2': 2, '3': 1})
+
+        response = await self.async_client.get('/api/async/schedules/search-by-id/', {'id': self.schedule.id})
+        self.assertEqual(response.json()['flight_number'], 'SU1')
+        response = await self.async_client.get('/api/async/schedules/search-by-id/', {'id': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_ticket_search_and_current_user(self):
+        response = await self.async_client.get('/api/async/tickets/search/', {'booking_reference': 'NONE00'})
+        self.assertEqual(response.json(), [])
+
+        self.assertEqual((await self.async_client.get('/api/async/current_user/')).status_code, 401)
+        response = await self.async_client.get('/api/async/current_user/',
+                                               headers={'Authorization': 'Bearer bad'})
+        self.assertEqual(response.status_code, 401)
+
+        token = AccessToken.for_user(self.user)
+        response = await self.async_client.get('/api/async/current_user/',
+                                               headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.json()['email'], 'user@amonic.com')
+
+
+class BenchmarkTest(TransactionTestCase):
+    def _fixture_teardown(self):
+        # flush не трогает неуправляемые таблицы, их очищаем сами после него, после каждого теста
+        super()._fixture_teardown()
+        for model in (Users, Offices, Roles, Countries):
+            model.objects.all().delete()
+
+    def test_seed_and_run_scenario(self):
+        scale = dict(SCALES['small'], airports=10, routes=20, schedules=50, users=3, tickets=100, surveys=100)
+        rng = random.Random(1)
+        seed(scale, rng)
+        self.assertEqual(Schedules.objects.count(), 50)
+        self.assertEqual(Users.objects.count(), 3)
+
+        result = run_scenario(Workload(scale, rng), 'amenitiestickets', requests=6, concurrency=2, access_token=None,
+                              seed_value=1)
+        self.assertEqual(result['requests'], 6)
+        self.assertEqual(result['statuses'], {'200': 6})
+        self.assertEqual(result['queries_per_request'], 2)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_create_ticket_after_seed(self):
+        scale = dict(SCALES['small'], airports=10, routes=20, schedules=5, users=3, tickets=300, surveys=10)
+        rng = random.Random(1)
+        seed(scale, rng)
+
+        token = AccessToken.for_user(Users.objects.get(id=1))
+        result = run_scenario(Workload(scale, rng), 'create_ticket', requests=20, concurrency=1,
+                              access_token=str(token), seed_value=1)
+        self.assertEqual(result['statuses'], {'201': 20})
+        self.assertEqual(Tickets.objects.count(), 320)
+        self.assertEqual(Tickets.objects.values('booking_reference').distinct().count(), Tickets.objects.count())
@@ -0,0 +1,109 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ThrottleCounter
+
+
+class DatabaseThrottleStore:
+    # Счётчики в общей базе: видны всем воркерам, инкремент выполняется одним UPSERT.
+    # Истёкшие строки (в том числе от перебора несуществующих email) удаляются попутно
+    # не чаще раза в prune_interval секунд на процесс, по индексу ExpiresAt
+    def __init__(self, prune_interval=60, **options):
+        self.prune_interval = prune_interval
+        self._pruned_at = time.monotonic()
+
+    def prune(self):
+        self._pruned_at = time.monotonic()
+        deleted, _ = ThrottleCounter.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    def incr(self, key, ttl):
+        if time.monotonic() - self._pruned_at >= self.prune_interval:
+            self.prune()
+        table = connection.ops.quote_name(ThrottleCounter._meta.db_table)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("Key", "Value", "ExpiresAt") VALUES (%s, 1, %s) '
+                f'ON CONFLICT ("Key") DO UPDATE SET '
+                f'"Value" = CASE WHEN {table}."ExpiresAt" > %s THEN {table}."Value" + 1 ELSE 1 END, '
+                f'"ExpiresAt" = excluded."ExpiresAt" '
+                f'RETURNING "Value"',
+                [key, connection.ops.adapt_datetimefield_value(now + timedelta(seconds=ttl)),
+                 connection.ops.adapt_datetimefield_value(now)])
+            return cursor.fetchone()[0]
+
+    def get(self, key):
+        return ThrottleCounter.objects.filter(key=key, expires_at__gt=timezone.now()).values_list(
+            'value', flat=True).first() or 0
+
+    def set(self, key, value, ttl):
+        ThrottleCounter.objects.update_or_create(
+            key=key, defaults={'value': value, 'expires_at': timezone.now() + timedelta(seconds=ttl)})
+
+    def delete(self, *keys):
+        ThrottleCounter.objects.filter(key__in=keys).delete()
+
+
+class RedisThrottleStore:
+    # INCR и продление TTL выполняются одним Lua-скриптом, поэтому гонок между воркерами нет
+    INCR_SCRIPT = "local value = redis.call('INCR', KEYS[1]) redis.call('EXPIRE', KEYS[1], ARGV[1]) return value"
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='throttle:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._incr = self.client.register_script(self.INCR_SCRIPT)
+
+    def incr(self, key, ttl):
+        return int(self._incr(keys=[self.prefix + key], args=[ttl]))
+
+    def get(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, *keys):
+        self.client.delete(*(self.prefix + key for key in keys))
+
+
+class LoginThrottle:
+    def __init__(self, store, max_attempts, attempt_window, lockout):
+        self.store = store
+        self.max_attempts = max_attempts
+        self.attempt_window = attempt_window
+        self.lockout = lockout
+
+    @staticmethod
+    def _keys(email):
+        return f'login_attempts_{email}', f'lockout_{email}'
+
+    def is_locked(self, email):
+        return bool(self.store.get(self._keys(email)[1]))
+
+    def register_failure(self, email):
+        attempts_key, lockout_key = self._keys(email)
+        if self.store.incr(attempts_key, self.attempt_window) >= self.max_attempts:
+            self.store.set(lockout_key, 1, self.lockout)
+
+    def reset(self, email):
+        self.store.delete(*self._keys(email))
+
+
+_login_throttle = None
+
+
+def get_login_throttle():
+    global _login_throttle
+    if _login_throttle is None:
+        config = settings.LOGIN_THROTTLE
+        store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        _login_throttle = LoginThrottle(store, config['MAX_ATTEMPTS'], config['ATTEMPT_WINDOW'], config['LOCKOUT'])
+    return _login_throttle
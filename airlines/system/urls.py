@@ -7,7 +7,8 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from django.urls import path
-from .views import CustomTokenObtainPairView
+from .views import CustomTokenObtainPairView, CustomTokenRefreshView
+from . import async_views
 from rest_framework_simplejwt.views import TokenRefreshView
 
 router = DefaultRouter()
@@ -28,12 +29,18 @@ urlpatterns = [
     path('', include(router.urls)),
     path('user-profile/', UserProfileView.as_view(), name='user-profile'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('current_user/', current_user, name='current_user'),
     path('add_user/', add_user, name='add_user'),
     path('update_user/<int:user_id>/', update_user, name='update_user'),
     path('logout/', logout_view, name='logout'),
     path('test_error/', test_error, name='test_error'),
+    path('metrics', metrics_view, name='metrics'),
     path('update_schedule/<int:schedule_id>/', update_schedule, name='update_schedule'),
     path('create-ticket/', TicketCreateView.as_view(), name='create-ticket'),
+    # Async-варианты для ASGI: те же параметры и ответы, что у синхронных эндпоинтов
+    path('async/schedules/search/', async_views.schedules_search, name='async-schedules-search'),
+    path('async/schedules/search-by-id/', async_views.schedules_search_by_id, name='async-schedules-search-by-id'),
+    path('async/tickets/search/', async_views.tickets_search, name='async-tickets-search'),
+    path('async/current_user/', async_views.current_user, name='async-current-user'),
 ]
@@ -0,0 +1,159 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .authentication import invalidate_user_state
+from .hashers import hash_passwords
+from .models import Users, Offices, Roles
+from .revocation import revoke_user_tokens
+
+BATCH_SIZE = 500
+DEFAULT_ROLE = 2
+
+REQUIRED_FIELDS = ('email', 'firstname', 'lastname', 'office_name', 'birthdate', 'password')
+UPDATABLE_FIELDS = ('email', 'firstname', 'lastname', 'birthdate', 'active', 'office_name', 'roleid')
+# Поля, которые приходят только строкой: список или объект вместо них — ошибка строки, а не 500
+TEXT_FIELDS = ('email', 'firstname', 'lastname', 'office_name', 'password')
+
+# Поле запроса -> атрибут модели
+ATTRIBUTES = {'office_name': 'officeid_id', 'roleid': 'roleid_id'}
+
+
+class UserBatchError(Exception):
+    # Ошибки всех строк пакета сразу: [{'row': номер с 1, 'errors': {поле: сообщение}}]
+    def __init__(self, errors):
+        super().__init__(f'Ошибки в {len(errors)} строках')
+        self.errors = errors
+
+
+class Lookups:
+    # Офисы по названию и роли читаются один раз на пакет, а не на каждую строку
+    def __init__(self):
+        self.offices = dict(Offices.objects.values_list('title', 'id'))
+        self.roles = set(Roles.objects.values_list('id', flat=True))
+
+
+def clean_row(row, lookups, fields, errors):
+    values = {}
+    for field in fields:
+        if field not in row:
+            continue
+        value = row[field]
+        if field in REQUIRED_FIELDS and value in (None, ''):
+            errors[field] = 'Обязательное поле'
+        elif field in TEXT_FIELDS and not isinstance(value, str):
+            errors[field] = 'Ожидается строка'
+        elif field == 'email':
+            try:
+                validate_email(value)
+                values['email'] = value
+            except ValidationError:
+                errors[field] = 'Неверный email'
+        elif field == 'birthdate':
+            try:
+                values['birthdate'] = value if isinstance(value, date) else date.fromisoformat(value)
+            except (TypeError, ValueError):
+                errors[field] = 'Неверный формат даты. Используйте формат ГГГГ-ММ-ДД.'
+        elif field == 'office_name':
+            if value not in lookups.offices:
+                errors[field] = 'Офис не найден'
+            else:
+                values['officeid_id'] = lookups.offices[value]
+        elif field == 'roleid':
+            try:
+                values['roleid_id'] = int(value)
+            except (TypeError, ValueError):
+                values['roleid_id'] = None
+            if values['roleid_id'] not in lookups.roles:
+                errors[field] = 'Роль не найдена'
+        elif field == 'active':
+            try:
+                values['active'] = int(value)
+            except (TypeError, ValueError):
+                values['active'] = None
+            if values['active'] not in (0, 1):
+                errors[field] = 'Допустимые значения: 0 или 1'
+        else:
+            values[field] = value
+    return values
+
+
+def create_users(rows, workers=None):
+    # Все строки проверяются до записи: при любой ошибке не создаётся ни один пользователь
+    lookups = Lookups()
+    emails = {row['email'] for row in rows if isinstance(row.get('email'), str) and row['email']}
+    taken = set(Users.objects.filter(email__in=emails).values_list('email', flat=True))
+
+    cleaned, errors = [], []
+    for number, row in enumerate(rows, 1):
+        row_errors = {field: 'Обязательное поле' for field in REQUIRED_FIELDS if field not in row}
+        values = clean_row(row, lookups, REQUIRED_FIELDS + ('roleid', 'active'), row_errors)
+        if values.get('email') in taken:
+            row_errors['email'] = 'Пользователь с таким email уже существует'
+        taken.add(values.get('email'))
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            cleaned.append(values)
+    if errors:
+        raise UserBatchError(errors)
+
+    passwords = hash_passwords([values.pop('password') for values in cleaned], workers)
+    users = [Users(**{'roleid_id': DEFAULT_ROLE, 'active': 1, **values}, password=password)
+             for values, password in zip(cleaned, passwords)]
+    with transaction.atomic():
+        Users.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    return users
+
+
+def update_users(rows):
+    # Строка — {'id': ..., поля для изменения}. Пользователи читаются одним запросом, пишутся bulk_update
+    lookups = Lookups()
+    ids = [row.get('id') for row in rows]
+    users = Users.objects.in_bulk([user_id for user_id in ids if isinstance(user_id, int)])
+    new_emails = {row['email'] for row in rows if isinstance(row.get('email'), str) and row['email']}
+    taken = dict(Users.objects.filter(email__in=new_emails).values_list('email', 'id'))
+
+    changes, errors, fields = [], [], set()
+    for number, row in enumerate(rows, 1):
+        user = users.get(row.get('id'))
+        if user is None:
+            errors.append({'row': number, 'errors': {'id': 'Пользователь не найден'}})
+            continue
+        row_errors = {}
+        values = clean_row(row, lookups, UPDATABLE_FIELDS, row_errors)
+        if taken.get(values.get('email'), user.id) != user.id:
+            row_errors['email'] = 'Пользователь с таким email уже существует'
+        elif 'email' in values:
+            # Email занимается строкой пакета: вторая строка с тем же адресом — ошибка, а не IntegrityError
+            taken[values['email']] = user.id
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+            continue
+        changes.append((user, values))
+        fields.update(values)
+    if errors:
+        raise UserBatchError(errors)
+
+    deactivated, state_changed = [], []
+    for user, values in changes:
+        state = (user.active, user.roleid_id, user.officeid_id)
+        for attribute, value in values.items():
+            setattr(user, attribute, value)
+        if state[0] == 1 and user.active != 1:
+            deactivated.append(user.id)
+        if (user.active, user.roleid_id, user.officeid_id) != state:
+            state_changed.append(user.id)
+
+    updated = [user for user, _ in changes]
+    with transaction.atomic():
+        if fields:
+            Users.objects.bulk_update(updated, sorted(fields), batch_size=BATCH_SIZE)
+        if deactivated:
+            # Заблокированные пользователи теряют все выданные токены, в том числе refresh
+            revoke_user_tokens(*deactivated)
+    if state_changed:
+        invalidate_user_state(*state_changed)
+    return updated
@@ -1,33 +1,55 @@
-import random
-import string
+import hmac
+import logging
 import uuid
-from datetime import timedelta, datetime
+from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth import logout
-from django.contrib.auth.hashers import make_password
-from django.db.models import Q
+from django.db import transaction
+from django.http import HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework.views import APIView
 
-from .models import Offices, Roles, Airports, Routes, Schedules, Aircrafts, Tickets, Countries, Surveys0, Amenities, \
+from .models import Offices, Airports, Routes, Schedules, Aircrafts, Tickets, Countries, Surveys0, Amenities, \
     AmenitiesTickets
 from .serializers import UsersSerializer, OfficesSerializer, UserSessionTrackingSerializer, RoutesSerializer, \
     AirportsSerializer, SchedulesSerializer, AircraftsSerializer, TicketsSerializer, CountriesSerializer, \
-    TicketCreateSerializer, Surveys0Serializer, AmenitiesSerializer, AmenitiesTicketsSerializer
+    PassengerSerializer, FlightSelectionSerializer, Surveys0Serializer, AmenitiesSerializer, \
+    AmenitiesTicketsSerializer, UserSessionArchiveSerializer
+from .search import search_schedules, schedules_queryset
+from .itineraries import search_itineraries, MAX_STOPS
+from .availability import reserve_seats, release_seats, NotEnoughSeats
+from .booking import create_booked_tickets
+from .survey_summary import summarize, DIMENSIONS as SUMMARY_DIMENSIONS, ID_DIMENSIONS as SUMMARY_ID_DIMENSIONS, \
+    QUESTIONS
+from .analytics import survey_columns, DIMENSIONS as ANALYTICS_DIMENSIONS
+from .throttle import get_login_throttle
+from .session_tracking import session_events, session_summary, PERIODS as SESSION_PERIODS
+from .pagination import SessionCursorPagination, DirectoryPagination
+from .mixins import SparseFieldsMixin
+from .reference_cache import ReferenceCacheMixin
+from .metrics import registry, time_serializer
+from .revocation import revoke_token
+from .directory import search_users
+from .user_admin import DEFAULT_ROLE, UPDATABLE_FIELDS, UserBatchError, create_users, update_users
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+SEARCH_LOG_SAMPLE_RATE = 0.01
 
-from django.utils import timezone
-from django.core.cache import cache
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework_simplejwt.views import TokenObtainPairView
-from .models import Users, UserSessionTracking
-from .serializers import CustomTokenObtainPairSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .models import Users, UserSessionTracking, UserSessionArchive
+from .serializers import CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -35,54 +57,74 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
     def post(self, request, *args, **kwargs):
         email = request.data.get('email')
-        attempts_key = f'login_attempts_{email}'
-        lockout_key = f'lockout_{email}'
-
-        attempts = cache.get(attempts_key, 0)
-        lockout_time = cache.get(lockout_key)
-
-        if lockout_time:
-            return Response({"detail": "Слишком много попыток. Попробуйте позже"},
-                            status=status.HTTP_429_TOO_MANY_REQUESTS)
 
-        if attempts >= 3:
-            cache.set(lockout_key, True, 5 * 60)
+        if get_login_throttle().is_locked(email):
             return Response({"detail": "Слишком много попыток. Попробуйте позже"},
                             status=status.HTTP_429_TOO_MANY_REQUESTS)
 
         try:
-            response = super().post(request, *args, **kwargs)
-            if response.status_code == status.HTTP_200_OK:
-                user = User.objects.get(email=email)
-                last_session = UserSessionTracking.objects.filter(user=user, logout_time__isnull=True).last()
-
-                if last_session:
-                    last_session.logout_reason = 'Токен устарел'
-                    last_session.save()
-                    UserSessionTracking.objects.create(user=user, login_time=timezone.now())
-                else:
-                    UserSessionTracking.objects.create(user=user, login_time=timezone.now())
-
-                cache.delete(attempts_key)
-                cache.delete(lockout_key)
-
-            return response
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            session_events.login(serializer.user.id)
+            return Response(serializer.validated_data, status=status.HTTP_200_OK)
         except Exception as e:
             error_messages = e.detail.get('non_field_errors', [])
             return Response({"detail": error_messages}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = CustomTokenRefreshSerializer
+
+
+class UserViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Users.objects.all()
     serializer_class = UsersSerializer
 
+    @action(detail=False, methods=['get'], url_path='search', pagination_class=DirectoryPagination)
+    def search(self, request):
+        # ?q= — префиксы слов имени, фамилии и email; ?office=, ?role=, ?active= — точные фильтры
+        filters = {}
+        for param in ('office', 'role', 'active'):
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            if not value.isdigit():
+                return Response({"detail": f"Параметр {param} должен быть числом."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            filters[param] = int(value)
+
+        page = self.paginate_queryset(search_users(request.query_params.get('q'), **filters))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk', permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        # POST создаёт, PATCH изменяет пакет пользователей: {"users": [...]}. Пакет пишется целиком
+        # в одной транзакции или не пишется совсем, ошибки возвращаются по номерам строк
+        if request.user.roleid_id != 1:
+            return Response({'error': 'Вы не администратор'}, status=status.HTTP_403_FORBIDDEN)
+        rows = request.data.get('users') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return Response({'error': 'Ожидается список пользователей в поле users'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info('bulk users', extra={'user_id': request.user.id, 'method': request.method, 'rows': len(rows)})
+        try:
+            if request.method == 'POST':
+                users = create_users(rows)
+                return Response({'created': len(users), 'ids': [user.id for user in users]},
+                                status=status.HTTP_201_CREATED)
+            users = update_users(rows)
+            return Response({'updated': len(users)}, status=status.HTTP_200_OK)
+        except UserBatchError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
 
-class OfficeViewSet(viewsets.ModelViewSet):
+class OfficeViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Offices.objects.all()
     serializer_class = OfficesSerializer
 
 
-class CountriesViewSet(viewsets.ModelViewSet):
+class CountriesViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Countries.objects.all()
     serializer_class = CountriesSerializer
 
@@ -91,91 +133,67 @@ class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        serializer = UsersSerializer(user)
+        # request.user собран из токена, профиль целиком читается одним запросом
+        user = Users.objects.select_related('officeid').get(pk=request.user.pk)
+        serializer = time_serializer(UsersSerializer(user))
         return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
-    user = request.user
-    serializer = UsersSerializer(user)
+    user = Users.objects.select_related('officeid').get(pk=request.user.pk)
+    serializer = time_serializer(UsersSerializer(user))
     return Response(serializer.data)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_user(request):
-    print(request.data)
-    if request.user.roleid.id != 1:
+    logger.info('add_user', extra={'user_id': request.user.id, 'fields': sorted(request.data)})
+    if request.user.roleid_id != 1:
         return Response({'error': 'Вы не администратор'}, status=status.HTTP_403_FORBIDDEN)
 
-    data = request.data
+    # Роль из запроса не принимается: add_user создаёт только обычных пользователей
     try:
-        office_name = data.get('office_name')
-        office = Offices.objects.get(title=office_name)
-        role = Roles.objects.get(id=2)
-        user = User.objects.create(
-            email=data['email'],
-            roleid=role,
-            firstname=data['firstname'],
-            lastname=data['lastname'],
-            officeid=office,
-            birthdate=data['birthdate'],
-            password=make_password(data['password']),
-            active=1
-        )
-        user.save()
-        return Response({'message': 'Пользователь успешно добавлен'}, status=status.HTTP_201_CREATED)
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        create_users([{**request.data, 'roleid': DEFAULT_ROLE}], workers=1)
+    except UserBatchError as e:
+        return Response({'error': first_error(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'message': 'Пользователь успешно добавлен'}, status=status.HTTP_201_CREATED)
 
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def update_user(request, user_id):
-    print(request.data)
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
+    logger.info('update_user', extra={'user_id': request.user.id, 'target_id': user_id,
+                                      'fields': sorted(request.data)})
+    if not User.objects.filter(id=user_id).exists():
         return Response({'error': 'Пользователь не найден'}, status=status.HTTP_404_NOT_FOUND)
 
-    if request.method == 'PATCH':
-        data = request.data
-        try:
-            user.email = data.get('email', user.email)
-            user.firstname = data.get('firstname', user.firstname)
-            user.lastname = data.get('lastname', user.lastname)
-            user.active = data.get('active', user.active)
-            if 'office_name' in data:
-                office = Offices.objects.get(title=data['office_name'])
-                user.officeid = office
-
-            if 'roleid' in data:
-                role = Roles.objects.get(id=data['roleid'])
-                user.roleid = role
-
-            user.save()
-            return Response({'message': 'Пользователь успешно обновлен'}, status=status.HTTP_200_OK)
-
-        except Offices.DoesNotExist:
-            return Response({'error': 'Офис не найден'}, status=status.HTTP_400_BAD_REQUEST)
-        except Roles.DoesNotExist:
-            return Response({'error': 'Роль не найдена'}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            print(e)
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    fields = {field: request.data[field] for field in UPDATABLE_FIELDS if field in request.data}
+    try:
+        update_users([{**fields, 'id': user_id}])
+    except UserBatchError as e:
+        return Response({'error': first_error(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'message': 'Пользователь успешно обновлен'}, status=status.HTTP_200_OK)
+
+
+def first_error(error):
+    return next(iter(error.errors[0]['errors'].values()))
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
     try:
-        session = UserSessionTracking.objects.filter(user=request.user, logout_time__isnull=True).last()
-        if session:
-            session.logout_time = timezone.now()
-            session.save()
+        session_events.logout(request.user.id)
+        # Отзываются текущий access-токен и, если передан, refresh-токен этой сессии
+        revoke_token(request.auth)
+        if request.data.get('refresh'):
+            try:
+                revoke_token(RefreshToken(request.data['refresh']))
+            except TokenError:
+                pass
         logout(request)
         return Response({'message': 'Выход выполнен успешно'}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -187,31 +205,59 @@ def test_error(request):
     raise ValueError("Искусственная ошибка для тестирования")
 
 
-class UserSessionTrackingViewSet(viewsets.ReadOnlyModelViewSet):
+class MetricsPermission(BasePermission):
+    def has_permission(self, request, view):
+        token = request.headers.get('X-Metrics-Token')
+        if token and settings.METRICS_TOKEN and hmac.compare_digest(token, settings.METRICS_TOKEN):
+            return True
+        return bool(request.user and request.user.is_authenticated and request.user.roleid_id == 1)
+
+
+@api_view(['GET'])
+@permission_classes([MetricsPermission])
+def metrics_view(request):
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UserSessionTrackingViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UserSessionTrackingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionCursorPagination
 
     def get_queryset(self):
-        return UserSessionTracking.objects.filter(user=self.request.user).order_by('-login_time')
+        return UserSessionTracking.objects.filter(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def archive(self, request):
+        page = self.paginate_queryset(UserSessionArchive.objects.filter(user=request.user))
+        return self.get_paginated_response(time_serializer(UserSessionArchiveSerializer(page, many=True)).data)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        period = request.query_params.get('period', 'month')
+        if period not in SESSION_PERIODS:
+            return Response({'error': f'Период должен быть одним из: {", ".join(SESSION_PERIODS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(session_summary(request.user.id, period))
 
 
-class AirportsViewSet(viewsets.ModelViewSet):
+class AirportsViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Airports.objects.all()
     serializer_class = AirportsSerializer
 
 
-class AicraftsViewSet(viewsets.ModelViewSet):
+class AicraftsViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Aircrafts.objects.all()
     serializer_class = AircraftsSerializer
 
 
-class RoutesViewSet(viewsets.ModelViewSet):
+class RoutesViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Routes.objects.all()
     serializer_class = RoutesSerializer
 
 
-class SchedulesViewSet(viewsets.ModelViewSet):
-    queryset = Schedules.objects.all()
+class SchedulesViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
+    queryset = schedules_queryset()
     serializer_class = SchedulesSerializer
 
     @action(detail=False, methods=['get'], url_path='search')
@@ -232,27 +278,49 @@ class SchedulesViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Неверный формат даты. Используйте формат ГГГГ-ММ-ДД."},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        if include_nearby_days:
-            start_date = selected_date - timedelta(days=3)
-            end_date = selected_date + timedelta(days=3)
-            schedules = self.queryset.filter(
-                Q(route__departure_airport=departure_airport) &
-                Q(route__arrival_airport=arrival_airport) &
-                Q(date__range=(start_date, end_date))
-            )
-        else:
-            schedules = self.queryset.filter(
-                Q(route__departure_airport=departure_airport) &
-                Q(route__arrival_airport=arrival_airport) &
-                Q(date=selected_date)
-            )
+        schedules = search_schedules(departure_airport, arrival_airport, selected_date, include_nearby_days)
 
-        if schedules.exists():
+        if schedules:
             serializer = self.get_serializer(schedules, many=True)
             return Response(serializer.data)
         else:
             return Response({"detail": "Нет доступных рейсов на указанную дату."}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['get'], url_path='itineraries')
+    def itineraries(self, request):
+        departure_airport = request.query_params.get('departure_airport')
+        arrival_airport = request.query_params.get('arrival_airport')
+        date = request.query_params.get('date')
+
+        if not (departure_airport and arrival_airport and date):
+            return Response(
+                {"detail": "Нужно указать все параметры поиска (аэропорт вылета, аэропорт прибытия и дату)."},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+            departure_airport = int(departure_airport)
+            arrival_airport = int(arrival_airport)
+            max_stops = min(max(int(request.query_params.get('max_stops', MAX_STOPS)), 0), MAX_STOPS)
+        except ValueError:
+            return Response({"detail": "Неверные параметры поиска."}, status=status.HTTP_400_BAD_REQUEST)
+
+        itineraries = search_itineraries(departure_airport, arrival_airport, selected_date, max_stops)
+        if not itineraries:
+            return Response({"detail": "Нет доступных рейсов на указанную дату."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Каждый рейс сериализуется один раз, даже если входит в несколько маршрутов
+        schedules = {leg.schedule.id: leg.schedule for legs in itineraries for leg in legs}
+        serialized = {item['id']: item for item in self.get_serializer(list(schedules.values()), many=True).data}
+
+        return Response([{
+            'stops': len(legs) - 1,
+            'departure': legs[0].departure,
+            'arrival': legs[-1].arrival,
+            'duration': legs[-1].arrival - legs[0].departure,
+            'flights': [serialized[leg.schedule.id] for leg in legs],
+        } for legs in itineraries])
+
     @action(detail=False, methods=['get'], url_path='search-by-id')
     def search_by_id(self, request):
         schedule_id = request.query_params.get('id')
@@ -284,14 +352,46 @@ def update_schedule(request, schedule_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Tickets.objects.all()
     serializer_class = TicketsSerializer
 
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        with transaction.atomic():
+            try:
+                reserve_seats(data['scheduleid'].id, data['cabintypeid'].id, 1)
+            except NotEnoughSeats:
+                raise ValidationError({"error": "Недостаточно свободных мест на рейсе."})
+            serializer.save()
+
+    def perform_update(self, serializer):
+        # Смена рейса или класса переносит место в той же транзакции, что и запись билета
+        instance = serializer.instance
+        old_seat = (instance.scheduleid_id, instance.cabintypeid_id)
+        data = serializer.validated_data
+        new_seat = (data['scheduleid'].id if 'scheduleid' in data else old_seat[0],
+                    data['cabintypeid'].id if 'cabintypeid' in data else old_seat[1])
+        with transaction.atomic():
+            if new_seat != old_seat:
+                try:
+                    reserve_seats(*new_seat, 1)
+                except NotEnoughSeats:
+                    raise ValidationError({"error": "Недостаточно свободных мест на рейсе."})
+            serializer.save()
+            if new_seat != old_seat:
+                release_seats(*old_seat)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            release_seats(instance.scheduleid_id, instance.cabintypeid_id)
+
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
         booking_reference = request.query_params.get('booking_reference', None)
-        print(booking_reference)
+        logger.info('ticket search', extra={'booking_reference': booking_reference,
+                                            'sample_rate': SEARCH_LOG_SAMPLE_RATE})
         if booking_reference is not None:
             tickets = self.queryset.filter(booking_reference=booking_reference)
             serializer = self.get_serializer(tickets, many=True)
@@ -302,82 +402,116 @@ class TicketViewSet(viewsets.ModelViewSet):
 class TicketCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def generate_booking_reference(self, length=6):
-        characters = string.ascii_letters + string.digits
-        return ''.join(random.choice(characters) for _ in range(length))
-
     def post(self, request):
         passengers_data = request.data.get('passengers', [])
         has_return_trip = request.data.get('has_return_trip', False)
-        tickets = []
+        cabin_type = request.data.get('cabintypeid')
 
         # Проверка на наличие пассажиров
         if not passengers_data:
             return Response({"error": "Пассажиры не указаны."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Создание билетов на рейс туда и обратно
-        for passenger in passengers_data:
-            country_name = passenger.get('passport_country')
-            country = Countries.objects.filter(name=country_name).first()
-
-            if not country:
-                return Response({"error": f"Country '{country_name}' not found."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Генерация уникального номера бронирования для каждого пассажира
-            booking_reference = self.generate_booking_reference()
-
-            # Создаем билет на рейс туда
-            outbound_serializer = TicketCreateSerializer(data={
-                **passenger,
-                'booking_reference': booking_reference,
-                'scheduleid': request.data.get('flight'),
-                'cabintypeid': request.data.get('cabintypeid'),
-                'confirmed': True,
-                'passport_country': country.id,
-            }, context={'request': request})
-
-            if outbound_serializer.is_valid():
-                outbound_ticket = outbound_serializer.save()
-                tickets.append(outbound_ticket)
-            else:
-                return Response(outbound_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-            # Если есть обратный рейс, создаем билет на обратный рейс
-            if has_return_trip:
-                return_serializer = TicketCreateSerializer(data={
+        # Сначала проверяется вся группа, страны паспортов разрешаются одним запросом
+        passengers = PassengerSerializer(data=passengers_data, many=True)
+        if not passengers.is_valid():
+            return Response(passengers.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        country_names = {passenger['passport_country'] for passenger in passengers.validated_data}
+        countries = dict(Countries.objects.filter(name__in=country_names).values_list('name', 'id'))
+        missing = country_names - countries.keys()
+        if missing:
+            return Response({"error": f"Country '{missing.pop()}' not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        requested = [request.data.get('flight')]
+        if has_return_trip:
+            requested.append(request.data.get('returnFlight'))
+
+        # Рейсы и класс проверяются до бронирования мест: ошибка ввода не выдаётся за нехватку мест
+        flights = []
+        for flight in requested:
+            selection = FlightSelectionSerializer(data={'scheduleid': flight, 'cabintypeid': cabin_type})
+            if not selection.is_valid():
+                return Response(selection.errors, status=status.HTTP_400_BAD_REQUEST)
+            flights.append(selection.validated_data['scheduleid'].id)
+            cabin_type = selection.validated_data['cabintypeid'].id
+        if len(set(flights)) < len(flights):
+            return Response({"error": "Рейс обратно совпадает с рейсом туда."}, status=status.HTTP_400_BAD_REQUEST)
+
+        for passenger in passengers.validated_data:
+            passenger['passport_country_id'] = countries[passenger.pop('passport_country')]
+
+        def build_tickets(booking_references):
+            # Один номер бронирования на пассажира для рейсов туда и обратно
+            return [
+                Tickets(
                     **passenger,
-                    'booking_reference': booking_reference,  # Один общий номер для обратного рейса
-                    'scheduleid': request.data.get('returnFlight'),
-                    'cabintypeid': request.data.get('cabintypeid'),
-                    'confirmed': True,
-                    'passport_country': country.id,
-                }, context={'request': request})
-
-                if return_serializer.is_valid():
-                    return_ticket = return_serializer.save()
-                    tickets.append(return_ticket)
-                else:
-                    return Response(return_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                    userid=request.user,
+                    scheduleid_id=flight,
+                    cabintypeid_id=cabin_type,
+                    booking_reference=booking_reference,
+                    confirmed=True,
+                )
+                for passenger, booking_reference in zip(passengers.validated_data, booking_references)
+                for flight in flights
+            ]
+
+        # Места, номера бронирования и билеты пишутся в одной транзакции: при ошибке не остаётся
+        # половины брони и не расходуются номера
+        try:
+            with transaction.atomic():
+                for flight in flights:
+                    reserve_seats(flight, cabin_type, len(passengers_data))
+                tickets = create_booked_tickets(build_tickets, len(passengers.validated_data))
+        except NotEnoughSeats:
+            return Response({"error": "Недостаточно свободных мест на рейсе."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Возвращаем идентификаторы билетов
         return Response({
             'tickets': [ticket.id for ticket in tickets],
-            'booking_numbers': [self.generate_booking_reference() for _ in tickets],
-            # Уникальные номера для каждого пассажира
+            'booking_numbers': [ticket.booking_reference for ticket in tickets],
         }, status=status.HTTP_201_CREATED)
 
 
-class Surveys0ViewSet(viewsets.ModelViewSet):
+class Surveys0ViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Surveys0.objects.all()
     serializer_class = Surveys0Serializer
 
+    @action(detail=False, methods=['get'], url_path='summary')
+    def summary(self, request):
+        group_by = [field for field in request.query_params.get('group_by', '').split(',') if field]
+        unknown = set(group_by) - set(SUMMARY_DIMENSIONS)
+        if unknown:
+            return Response({"detail": f"Нельзя группировать по полям: {', '.join(sorted(unknown))}."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-class AmenitiesViewSet(viewsets.ModelViewSet):
+        filters = {field: request.query_params[field] for field in SUMMARY_DIMENSIONS if field in request.query_params}
+        for field in SUMMARY_ID_DIMENSIONS:
+            if field in filters:
+                if not filters[field].isdigit():
+                    return Response({"detail": f"Параметр {field} должен быть числом."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                filters[field] = int(filters[field])
+        return Response(summarize(group_by, filters))
+
+    @action(detail=False, methods=['get'], url_path='crosstab')
+    def crosstab(self, request):
+        group_by = [field for field in request.query_params.get('group_by', '').split(',') if field]
+        question = request.query_params.get('question', 'q1')
+        unknown = set(group_by) - set(ANALYTICS_DIMENSIONS)
+        if unknown or question not in QUESTIONS:
+            return Response({"detail": "Неверные параметры отчёта."}, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {field: request.query_params[field] for field in ANALYTICS_DIMENSIONS
+                   if field in request.query_params}
+        return Response(survey_columns.get().crosstab(group_by, question, filters))
+
+
+class AmenitiesViewSet(ReferenceCacheMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Amenities.objects.all()
     serializer_class = AmenitiesSerializer
 
 
-class AmenitiesTicketsViewSet(viewsets.ModelViewSet):
+class AmenitiesTicketsViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = AmenitiesTickets.objects.all()
     serializer_class = AmenitiesTicketsSerializer
     filter_backends = [DjangoFilterBackend]